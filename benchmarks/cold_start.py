@@ -0,0 +1,143 @@
+"""
+Tiempo de Arranque en Frío del Dashboard
+========================================
+
+Importa `app_dashboard` en un intérprete nuevo con `python -X importtime` (como
+ocurre al arrancar el servidor o reciclar un worker) y muestra:
+
+- Tiempo total de importación del dashboard y la parte que ya paga Streamlit
+  (el servidor lo tiene importado antes de ejecutar el script)
+- Coste por paquete (suma del tiempo propio de sus módulos)
+- Módulos pesados que deberían cargarse de forma diferida y se importaron igual
+  (sin contar los que importa el propio Streamlit)
+
+Termina con error si el tiempo supera el presupuesto o si algún módulo diferido
+se importa al arrancar:
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --budget 0.8 --repeat 5 --output cold_start.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_BUDGET = 1.0
+DEFAULT_REPEAT = 3
+
+# Paquetes que el dashboard importa solo en la ruta que los usa
+LAZY_PACKAGES = ['sklearn', 'scipy', 'matplotlib', 'plotly', 'groq', 'seaborn', 'duckdb']
+
+_US_PER_SECOND = 1_000_000
+
+
+# ============================================================================
+# MEDICIÓN
+# ============================================================================
+
+def parse_importtime(stderr):
+    """Líneas de `-X importtime` → lista de (módulo, tiempo propio, acumulado) en µs"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_import(module):
+    """Importar el módulo en un proceso nuevo y devolver sus tiempos de importación"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT / 'src', env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{completed.stderr[-2000:]}")
+
+    modules = parse_importtime(completed.stderr)
+    total_us = next(cumulative for name, _, cumulative in modules if name == module)
+    return {'total_s': total_us / _US_PER_SECOND, 'modules': modules}
+
+
+def package_breakdown(modules):
+    """Tiempo propio sumado por paquete de primer nivel, de mayor a menor"""
+    totals = defaultdict(int)
+    for name, self_us, _ in modules:
+        totals[name.split('.')[0]] += self_us
+    return sorted(((package, us / _US_PER_SECOND) for package, us in totals.items()),
+                  key=lambda item: item[1], reverse=True)
+
+
+def eager_lazy_packages(modules, baseline_modules=()):
+    """Paquetes diferidos importados al arrancar que no trae ya Streamlit"""
+    loaded = {name.split('.')[0] for name, _, _ in modules}
+    preloaded = {name.split('.')[0] for name, _, _ in baseline_modules}
+    return [package for package in LAZY_PACKAGES if package in loaded - preloaded]
+
+
+# ============================================================================
+# INFORME
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Desglose del tiempo de importación del dashboard")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help="Tiempo máximo de importación en segundos")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="Arranques a medir (se usa el más rápido)")
+    parser.add_argument('--top', type=int, default=15, help="Paquetes a mostrar en el desglose")
+    parser.add_argument('--output', help="Guardar el informe en JSON")
+    args = parser.parse_args()
+
+    # El más rápido descarta ruido del sistema; la caché de disco ya está caliente tras el primero
+    repeat = max(args.repeat, 1)
+    runs = [measure_import('app_dashboard') for _ in range(repeat)]
+    best = min(runs, key=lambda run: run['total_s'])
+    baseline = min((measure_import('streamlit') for _ in range(repeat)), key=lambda run: run['total_s'])
+    breakdown = package_breakdown(best['modules'])
+    eager = eager_lazy_packages(best['modules'], baseline['modules'])
+    own_s = max(best['total_s'] - baseline['total_s'], 0.0)
+
+    print(f"\n▶ Importación de app_dashboard: {best['total_s']:.3f}s "
+          f"(mejor de {len(runs)}, presupuesto {args.budget:.3f}s)")
+    print(f"  Streamlit: {baseline['total_s']:.3f}s · resto del dashboard: {own_s:.3f}s\n")
+    print(f"  {'Paquete':<28} {'Tiempo':>9} {'%':>6}")
+    for package, seconds in breakdown[:args.top]:
+        print(f"  {package:<28} {seconds:>8.3f}s {seconds / best['total_s']:>6.1%}")
+
+    if args.output:
+        report = {
+            'total_s': best['total_s'],
+            'runs_s': [run['total_s'] for run in runs],
+            'streamlit_s': baseline['total_s'],
+            'dashboard_s': own_s,
+            'budget_s': args.budget,
+            'packages': dict(breakdown),
+            'eager_lazy_packages': eager
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\n✓ Informe guardado en {args.output}")
+
+    failed = False
+    if eager:
+        print(f"\n❌ Módulos diferidos importados al arrancar: {', '.join(eager)}")
+        failed = True
+    if best['total_s'] > args.budget:
+        print(f"\n❌ Arranque en frío por encima del presupuesto: "
+              f"{best['total_s']:.3f}s > {args.budget:.3f}s")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("\n✓ Arranque dentro del presupuesto")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""
+Benchmarks de Escala del Pipeline
+=================================
+
+Ejecuta cada etapa del pipeline del dashboard sobre datasets sintéticos de
+distintos tamaños:
+
+- Validación, carga, limpieza, tabla de facturas y RFM (y lectura desde la
+  caché en disco)
+- Clustering, evaluación de K, árbol de decisión y estabilidad
+- Análisis de cesta, cubo país × mes × segmento, scores, CLV, perfil de
+  segmentos y contexto del chatbot
+
+Por cada etapa registra:
+
+- Tiempo de pared y de CPU
+- Pico de memoria residente (RSS) de la etapa
+- Throughput (filas de entrada por segundo)
+
+Los resultados se guardan en JSON para compararlos entre commits:
+
+    python benchmarks/run_benchmarks.py --sizes 10k,100k,1M,10M
+    python benchmarks/run_benchmarks.py --sizes 10k,100k --compare benchmarks/results/base.json
+    python benchmarks/run_benchmarks.py --sizes 1M,10M --sharded-workers 1,2,4,8,16,32
+    python benchmarks/run_benchmarks.py --sizes 100k --clv-customers 100k,1M
+
+El generador crea un cliente por cada ~120 filas: 10k filas son ~80 clientes,
+así que ese tamaño sirve solo como prueba rápida de que todo funciona; los
+tiempos por etapa son significativos a partir de 100k.
+
+Funciona offline en cualquier Linux (el pico de RSS se reinicia por etapa con
+/proc/self/clear_refs; en otros sistemas se usa el máximo del proceso).
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / 'src'))
+sys.path.insert(0, str(REPO_ROOT))
+
+# Las etapas se importan de los módulos sin Streamlit: ni este script ni los procesos
+# del modo multinúcleo (que lo vuelven a importar) cargan el dashboard
+import numpy as np  # noqa: E402
+from instrumentation import reset_peak_rss, read_peak_rss_mb  # noqa: E402
+from backends import BACKENDS, clean_transactions, aggregate_rfm_pandas, compare_rfm  # noqa: E402
+from invoices import build_invoice_table  # noqa: E402
+from pipeline import (load_data, compute_rfm, fit_clustering, assign_segment_names,  # noqa: E402
+                      train_decision_tree, evaluate_clustering, build_chatbot_context)
+from rfm_scoring import score_rfm, build_score_cube  # noqa: E402
+from segment_profile import build_segment_profile  # noqa: E402
+from stability import cluster_stability  # noqa: E402
+from market_basket import build_basket_matrix, segment_basket_rules  # noqa: E402
+from sales_cube import customer_activity, build_sales_cube, query_sales_cube  # noqa: E402
+from parallel import sharded_rfm  # noqa: E402
+from result_cache import CACHE_DIR_ENV, content_key, cache_get, cache_put  # noqa: E402
+from generate_test_data import generate_transactions  # noqa: E402
+from clv import predict_clv  # noqa: E402
+from market_segments import segment_markets  # noqa: E402
+from validation import validate_sample, quality_report  # noqa: E402
+
+DEFAULT_SIZES = '10k,100k,1M,10M'
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_OUTPUT_DIR = REPO_ROOT / 'benchmarks' / 'results'
+
+# Límite de filas por etapa: Excel no admite más de ~1M filas y el silhouette
+# de evaluate_clustering es cuadrático en el número de clientes
+STAGE_ROW_LIMITS = {
+    'load_data': 100_000,
+    'evaluate_clustering': 100_000,
+}
+
+# Diferencias menores a este tiempo se consideran ruido al comparar
+MIN_COMPARABLE_SECONDS = 0.05
+
+
+# ============================================================================
+# MEDICIÓN
+# ============================================================================
+
+def parse_size(text):
+    """Convertir '10k', '1M' o '2500' en número de filas"""
+    text = text.strip().lower()
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def measure(func, repeat=1):
+    """Ejecutar una etapa y devolver (resultado, métricas) con la mejor repetición"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        rss_reset = reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = func()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        metrics = {
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'peak_rss_mb': read_peak_rss_mb(),
+            'rss_reset': rss_reset
+        }
+        if best is None or wall < best['wall_s']:
+            best = metrics
+    return result, best
+
+
+# ============================================================================
+# ETAPAS
+# ============================================================================
+
+def run_sharded_speedup(df_clean, worker_counts, repeat):
+    """Speedup de la agregación RFM por shards frente a la versión serial de pandas"""
+    records = []
+    serial, serial_metrics = measure(lambda: aggregate_rfm_pandas(df_clean), repeat)
+    print(f"  {'rfm serial (pandas)':<24} {serial_metrics['wall_s']:>9.3f}s")
+
+    for workers in worker_counts:
+        # Primera llamada fuera de la medición: arranca el pool de procesos
+        sharded_rfm(df_clean, workers)
+        result, metrics = measure(lambda: sharded_rfm(df_clean, workers), repeat)
+        speedup = serial_metrics['wall_s'] / metrics['wall_s'] if metrics['wall_s'] > 0 else None
+        identical = not compare_rfm(serial, result)
+        records.append({'stage': f'sharded_rfm[w={workers}]', 'size': len(df_clean), 'rows': len(df_clean),
+                        'status': 'ok', **metrics, 'workers': workers,
+                        'serial_wall_s': serial_metrics['wall_s'], 'speedup': speedup,
+                        'identical': identical,
+                        'throughput_rows_s': len(df_clean) / metrics['wall_s'] if metrics['wall_s'] > 0 else None})
+        print(f"  {f'rfm sharded (w={workers})':<24} {metrics['wall_s']:>9.3f}s  "
+              f"speedup {speedup or 0:>5.2f}x  {'✓' if identical else '❌ resultado distinto'}")
+    return records
+
+
+def run_market_speedup(df, worker_counts, repeat):
+    """Segmentación por mercado en paralelo frente al tiempo del mercado más grande"""
+    records = []
+    for workers in worker_counts:
+        # Primera llamada fuera de la medición: arranca el pool de procesos
+        segment_markets(df, n_workers=workers)
+        result, metrics = measure(lambda: segment_markets(df, n_workers=workers), repeat)
+        records.append({'stage': f'segment_markets[w={workers}]', 'size': len(df), 'rows': len(df),
+                        'status': 'ok', **metrics, 'workers': workers, 'markets': len(result['markets']),
+                        'largest_market_s': result['largest_seconds'],
+                        'throughput_rows_s': len(df) / metrics['wall_s'] if metrics['wall_s'] > 0 else None})
+        print(f"  {f'mercados (w={workers})':<24} {metrics['wall_s']:>9.3f}s  "
+              f"{len(result['markets'])} mercados · mayor {result['largest_seconds']:.3f}s")
+    return records
+
+
+def run_clv_scaling(customer_counts, repeat, seed=42):
+    """Ajuste y puntuación del CLV con millones de clientes: tablas RFM remuestreadas de un
+    dataset sintético, con la antigüedad desplazada al azar para no repetir combinaciones"""
+    df_clean = clean_transactions(generate_transactions(200_000, seed=seed))
+    base = aggregate_rfm_pandas(df_clean)
+    rng = np.random.default_rng(seed)
+
+    records = []
+    for n_customers in customer_counts:
+        rfm = base.iloc[rng.integers(0, len(base), n_customers)].reset_index(drop=True)
+        shift = rng.integers(0, 60, n_customers)
+        rfm = rfm.assign(CustomerID=np.arange(n_customers, dtype=np.float64),
+                         Recency=rfm['Recency'] + shift, Tenure=rfm['Tenure'] + shift)
+        result, metrics = measure(lambda: predict_clv(rfm), repeat)
+        records.append({'stage': f'predict_clv[customers={n_customers}]', 'size': n_customers,
+                        'rows': n_customers, 'status': 'ok', **metrics,
+                        'fit_s': result['fit_seconds'], 'unique_rows': result['unique_rows'],
+                        'throughput_rows_s': n_customers / metrics['wall_s'] if metrics['wall_s'] > 0 else None})
+        print(f"  {f'clv ({n_customers:,} clientes)':<24} {metrics['wall_s']:>9.3f}s  "
+              f"{metrics['peak_rss_mb']:>9.1f} MB  ajuste {result['fit_seconds']:.3f}s  "
+              f"{result['unique_rows']:,} combinaciones")
+    return records
+
+
+def run_size(n_rows, repeat, limits, workdir, backend='pandas', worker_counts=()):
+    """Ejecutar todas las etapas para un tamaño de dataset"""
+    records = []
+
+    def record(stage, rows, func):
+        limit = limits.get(stage)
+        if limit is not None and n_rows > limit:
+            records.append({'stage': stage, 'size': n_rows, 'rows': rows, 'status': 'skipped',
+                            'reason': f'tamaño > límite de la etapa ({limit:,})'})
+            print(f"  {stage:<24} omitida (límite {limit:,})")
+            return None
+        result, metrics = measure(func, repeat)
+        throughput = rows / metrics['wall_s'] if metrics['wall_s'] > 0 else None
+        records.append({'stage': stage, 'size': n_rows, 'rows': rows, 'status': 'ok',
+                        **metrics, 'throughput_rows_s': throughput})
+        print(f"  {stage:<24} {metrics['wall_s']:>9.3f}s  {metrics['peak_rss_mb']:>9.1f} MB  "
+              f"{throughput or 0:>14,.0f} filas/s")
+        return result
+
+    df = generate_transactions(n_rows, seed=42)
+
+    if limits.get('load_data') is None or n_rows <= limits['load_data']:
+        excel_path = Path(workdir) / f'transactions_{n_rows}.xlsx'
+        df.to_excel(excel_path, index=False)
+
+        record('validate_sample', n_rows, lambda: validate_sample(str(excel_path)))
+        record('load_data', n_rows, lambda: load_data(str(excel_path)))
+    else:
+        record('load_data', n_rows, None)
+
+    record('quality_report', len(df), lambda: quality_report(df))
+
+    # Mismas funciones que ejecutan get_clean_data, get_rfm y get_clustering en un fallo de caché
+    df_clean = record('clean_data', len(df), lambda: clean_transactions(df, backend=backend))
+    invoices = record('build_invoice_table', len(df_clean), lambda: build_invoice_table(df_clean))
+    rfm = record('calculate_rfm', len(invoices),
+                 lambda: compute_rfm(df_clean, backend=backend, invoices=invoices))
+
+    # Lectura de las transacciones limpias desde la caché en disco (carpeta temporal)
+    os.environ[CACHE_DIR_ENV] = str(Path(workdir) / 'cache')
+    cache_key = content_key(f'clean_data-{n_rows}'.encode())
+    cache_put('clean_data', cache_key, df_clean)
+    record('result_cache_hit', len(df_clean), lambda: cache_get('clean_data', cache_key))
+    if worker_counts:
+        records.extend(run_sharded_speedup(df_clean, worker_counts, repeat))
+        records.extend(run_market_speedup(df, worker_counts, repeat))
+
+    labels, kmeans, scaler = record('perform_clustering', len(rfm), lambda: fit_clustering(rfm, n_clusters=4))
+    rfm, _ = assign_segment_names(rfm.assign(Cluster=labels))
+
+    rfm_scaled = scaler.transform(rfm[['Recency', 'Frequency', 'Monetary']])
+    record('evaluate_clustering', len(rfm), lambda: evaluate_clustering(rfm_scaled, max_k=10))
+    record('train_decision_tree', len(rfm), lambda: train_decision_tree(rfm))
+    record('cluster_stability', len(rfm), lambda: cluster_stability(rfm))
+
+    basket = record('build_basket_matrix', len(df_clean), lambda: build_basket_matrix(df_clean))
+    record('segment_basket_rules', basket['matrix'].nnz,
+           lambda: segment_basket_rules(basket, rfm[['CustomerID', 'Segment']]))
+
+    activity = record('customer_activity', len(df_clean), lambda: customer_activity(df_clean))
+    sales_cube = record('build_sales_cube', len(activity),
+                        lambda: build_sales_cube(activity, rfm[['CustomerID', 'Segment']]))
+    # Consulta típica de los filtros: dos países y un trimestre
+    record('query_sales_cube', sales_cube['activity'].nnz,
+           lambda: query_sales_cube(sales_cube, list(sales_cube['countries'][:2]),
+                                        tuple(sales_cube['months'][[0, min(2, len(sales_cube['months']) - 1)]])))
+
+    rfm = record('score_rfm', len(rfm), lambda: score_rfm(rfm, n_quantiles=4))
+    score_cube = build_score_cube(rfm, n_quantiles=4)
+    record('predict_clv', len(rfm), lambda: predict_clv(rfm))
+    profile = record('build_segment_profile', len(rfm), lambda: build_segment_profile(rfm))
+    record('get_chatbot_context', len(rfm), lambda: build_chatbot_context(profile, score_cube))
+
+    return records
+
+
+# ============================================================================
+# RESULTADOS Y COMPARACIÓN
+# ============================================================================
+
+def git_commit():
+    """Commit actual del repositorio (o 'unknown' fuera de git)"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare_results(current, baseline, threshold):
+    """Listar las etapas cuyo tiempo empeoró más que el umbral relativo"""
+    baseline_index = {(r['stage'], r['size']): r for r in baseline['results'] if r['status'] == 'ok'}
+    regressions = []
+    for record in current['results']:
+        base = baseline_index.get((record['stage'], record['size']))
+        if record['status'] != 'ok' or base is None:
+            continue
+        if max(base['wall_s'], record['wall_s']) < MIN_COMPARABLE_SECONDS:
+            continue
+        change = record['wall_s'] / base['wall_s'] - 1
+        if change > threshold:
+            regressions.append({
+                'stage': record['stage'],
+                'size': record['size'],
+                'baseline_s': base['wall_s'],
+                'current_s': record['wall_s'],
+                'change': change
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de escala del pipeline de segmentación")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help="Tamaños en filas separados por comas (ej: 10k,100k,1M); 10k es solo una prueba rápida")
+    parser.add_argument('--backend', default='pandas', choices=list(BACKENDS),
+                        help="Motor de cálculo para limpieza y RFM")
+    parser.add_argument('--sharded-workers', default='',
+                        help="Procesos a comparar en la agregación RFM por shards (ej: 1,2,4,8)")
+    parser.add_argument('--clv-customers', default='',
+                        help="Clientes para medir el ajuste y la puntuación del CLV (ej: 100k,1M)")
+    parser.add_argument('--repeat', type=int, default=1, help="Repeticiones por etapa (se usa la mejor)")
+    parser.add_argument('--limit', action='append', default=[], metavar='ETAPA=FILAS',
+                        help="Cambiar el límite de filas de una etapa (0 = sin límite)")
+    parser.add_argument('--output', help="Archivo JSON de resultados (por defecto benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="JSON de referencia contra el que comparar")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Empeoramiento relativo tolerado antes de fallar (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    limits = dict(STAGE_ROW_LIMITS)
+    for item in args.limit:
+        stage, value = item.split('=', 1)
+        limits[stage] = parse_size(value) or None
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    worker_counts = [int(w) for w in args.sharded_workers.split(',') if w]
+    clv_customers = [parse_size(count) for count in args.clv_customers.split(',') if count]
+    commit = git_commit()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in sizes:
+            print(f"\n▶ {n_rows:,} transacciones")
+            results.extend(run_size(n_rows, args.repeat, limits, workdir, backend=args.backend,
+                                    worker_counts=worker_counts))
+    if clv_customers:
+        print("\n▶ CLV (BG/NBD + Gamma-Gamma)")
+        results.extend(run_clv_scaling(clv_customers, args.repeat))
+
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': sizes,
+            'backend': args.backend,
+            'sharded_workers': worker_counts,
+            'clv_customers': clv_customers,
+            'repeat': args.repeat,
+            'limits': limits
+        },
+        'results': results
+    }
+
+    output = Path(args.output) if args.output else DEFAULT_OUTPUT_DIR / f'{commit}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n✓ Resultados guardados en {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (umbral {args.threshold:.0%}):")
+            for r in regressions:
+                print(f"  {r['stage']:<24} {r['size']:>12,}  {r['baseline_s']:.3f}s → "
+                      f"{r['current_s']:.3f}s (+{r['change']:.0%})")
+            sys.exit(1)
+        print(f"\n✓ Sin regresiones respecto a {args.compare} (umbral {args.threshold:.0%})")
+
+
+if __name__ == '__main__':
+    main()
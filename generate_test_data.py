@@ -1,52 +1,286 @@
 # Script para generar dataset de prueba (opcional)
 # Si no tienes el dataset real, puedes generar uno sintético para probar
+#
+# Genera transacciones con el esquema de Online Retail usando solo operaciones
+# vectorizadas de NumPy, por lo que escala a decenas de millones de filas:
+#
+#   python generate_test_data.py                                  # 5.000 filas en Excel
+#   python generate_test_data.py --rows 20M --output data/retail.parquet
+#   python generate_test_data.py --rows 5M --output data/drop --format csv --split
+#
+# Distribuciones:
+# - Actividad por cliente con cola pesada (Pareto): pocos clientes concentran
+#   la mayoría de las facturas, como en el dataset real
+# - Gasto con cola pesada: multiplicador lognormal por cliente y cantidades
+#   binomiales negativas por línea; precios lognormales por producto
+# - Facturas con varias líneas y popularidad de productos tipo Zipf
+# - Cancelaciones (InvoiceNo con prefijo 'C' y cantidades negativas)
+# - CustomerID nulos por factura
+# - Estacionalidad mensual (pico en noviembre), semanal (sin sábados) y horaria
+
+import argparse
+from pathlib import Path
 
-import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-
-print("Generando dataset sintético de prueba...")
-
-# Configuración
-np.random.seed(42)
-n_customers = 500
-n_transactions = 5000
-
-# Generar CustomerIDs
-customer_ids = np.random.choice(range(10000, 10000 + n_customers), n_transactions)
-
-# Generar fechas
-start_date = datetime(2010, 12, 1)
-end_date = datetime(2011, 12, 9)
-dates = [start_date + timedelta(days=np.random.randint(0, (end_date - start_date).days)) 
-         for _ in range(n_transactions)]
-
-# Generar otros campos
-invoice_nos = [f"{10000 + i}" for i in range(n_transactions)]
-stock_codes = [f"SKU{np.random.randint(1000, 9999)}" for _ in range(n_transactions)]
-descriptions = [f"Product {i}" for i in range(n_transactions)]
-quantities = np.random.randint(1, 50, n_transactions)
-unit_prices = np.round(np.random.uniform(1, 100, n_transactions), 2)
-countries = np.random.choice(['United Kingdom', 'France', 'Germany', 'Spain'], 
-                             n_transactions, p=[0.8, 0.1, 0.05, 0.05])
-
-# Crear DataFrame
-df_synthetic = pd.DataFrame({
-    'InvoiceNo': invoice_nos,
-    'StockCode': stock_codes,
-    'Description': descriptions,
-    'Quantity': quantities,
-    'UnitPrice': unit_prices,
-    'InvoiceDate': dates,
-    'CustomerID': customer_ids,
-    'Country': countries
-})
-
-# Guardar
-df_synthetic.to_excel('data/Online_Retail_Test.xlsx', index=False)
-
-print(f"✓ Dataset sintético generado: data/Online_Retail_Test.xlsx")
-print(f"  - {n_transactions:,} transacciones")
-print(f"  - {n_customers} clientes únicos")
-print("\nPuedes usar este archivo para probar el dashboard.")
-print("Para producción, descarga el dataset real desde UCI.")
+import pandas as pd
+
+# Excel no admite más filas por hoja
+EXCEL_MAX_ROWS = 1_048_575
+
+# Peso relativo de cada mes (enero..diciembre), con el pico navideño del retail
+MONTH_WEIGHTS = np.array([0.70, 0.60, 0.80, 0.75, 0.85, 0.85, 0.85, 0.85, 1.15, 1.25, 1.60, 1.00])
+
+# Peso por día de la semana (lunes..domingo); el dataset real no tiene sábados
+WEEKDAY_WEIGHTS = np.array([1.00, 1.10, 1.15, 1.20, 0.90, 0.00, 0.65])
+
+COUNTRIES = ['United Kingdom', 'Germany', 'France', 'EIRE', 'Spain', 'Netherlands',
+             'Belgium', 'Switzerland', 'Portugal', 'Australia', 'Norway', 'Italy']
+COUNTRY_WEIGHTS = np.array([0.880, 0.022, 0.020, 0.018, 0.008, 0.008,
+                            0.007, 0.007, 0.005, 0.005, 0.005, 0.015])
+
+PRODUCT_ADJECTIVES = np.array(['WHITE', 'RED', 'VINTAGE', 'PINK', 'BLUE', 'HEART', 'SET OF 3',
+                               'REGENCY', 'JUMBO', 'PAPER', 'GLASS', 'WOODEN', 'SMALL', 'LARGE'])
+PRODUCT_NOUNS = np.array(['T-LIGHT HOLDER', 'LANTERN', 'CAKE STAND', 'BAG', 'MUG', 'TEACUP',
+                          'CHALKBOARD', 'BUNTING', 'DOORMAT', 'CLOCK', 'NAPKINS', 'BOX',
+                          'PARTY CUPS', 'CANDLE', 'CUSHION COVER', 'LUNCH BOX'])
+
+
+def _parse_count(text):
+    """Convertir '10k', '20M' o '2500' en un entero"""
+    text = str(text).strip().lower()
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def _weighted_choice(rng, cumulative_weights, size):
+    """Muestreo por pesos con searchsorted (más rápido que rng.choice con p=)"""
+    u = rng.random(size) * cumulative_weights[-1]
+    return np.searchsorted(cumulative_weights, u, side='right')
+
+
+def _invoice_plan(rng, n_rows, n_customers, start, end, mean_lines, cancel_rate, null_customer_rate):
+    """Atributos a nivel factura (pocas filas) para todo el dataset"""
+    # Líneas por factura: 1 + binomial negativa (cola larga de facturas grandes)
+    n_invoices = max(int(n_rows / mean_lines * 1.1) + 1, 1)
+    lines = 1 + rng.negative_binomial(1, 1 / mean_lines, n_invoices)
+    cumulative = np.cumsum(lines)
+    lines = lines[:int(np.searchsorted(cumulative, n_rows)) + 1]
+    n_invoices = len(lines)
+    if lines.sum() < n_rows:
+        lines[-1] += n_rows - lines.sum()
+    lines[-1] -= lines.sum() - n_rows
+
+    # Fechas con estacionalidad: peso por día = mes x día de la semana
+    days = pd.date_range(start, end, freq='D')
+    day_weights = MONTH_WEIGHTS[days.month - 1] * WEEKDAY_WEIGHTS[days.dayofweek]
+    day_index = _weighted_choice(rng, np.cumsum(day_weights), n_invoices)
+    # Horario comercial 7:00-20:00 con más actividad al mediodía
+    minutes = np.clip(rng.normal(12.5 * 60, 2.5 * 60, n_invoices), 7 * 60, 20 * 60 - 1).astype(np.int64)
+    dates = days.values[day_index] + minutes.astype('timedelta64[m]')
+
+    # Facturas numeradas en orden cronológico
+    order = np.argsort(dates, kind='stable')
+    dates = dates[order]
+
+    # Clientes con actividad Pareto: pocos clientes muy frecuentes
+    activity = rng.pareto(1.3, n_customers) + 1
+    customers = _weighted_choice(rng, np.cumsum(activity), n_invoices)
+
+    return {
+        'n_invoices': n_invoices,
+        'lines': lines,
+        'dates': dates,
+        'customers': customers,
+        'cancelled': rng.random(n_invoices) < cancel_rate,
+        'null_customer': rng.random(n_invoices) < null_customer_rate
+    }
+
+
+def _catalog(rng, n_products):
+    """Catálogo de productos: códigos, descripciones, precios y popularidad Zipf"""
+    codes = pd.Series(np.arange(n_products) + 10002).astype(str)
+    # Algunas variantes con sufijo de letra, como en el dataset real ('85123A')
+    suffix = pd.Series(rng.choice(['', '', '', 'A', 'B', 'C'], n_products))
+    stock_codes = (codes + suffix).to_numpy()
+
+    adjectives = PRODUCT_ADJECTIVES[rng.integers(0, len(PRODUCT_ADJECTIVES), n_products)]
+    nouns = PRODUCT_NOUNS[rng.integers(0, len(PRODUCT_NOUNS), n_products)]
+    descriptions = (pd.Series(adjectives) + ' ' + pd.Series(nouns) + ' ' + codes).to_numpy()
+
+    prices = np.round(np.clip(rng.lognormal(1.0, 0.9, n_products), 0.1, 650), 2)
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 1.1
+    rng.shuffle(popularity)
+
+    return {
+        'stock_codes': stock_codes,
+        'descriptions': descriptions,
+        'prices': prices,
+        'popularity_cdf': np.cumsum(popularity)
+    }
+
+
+def iter_transaction_chunks(n_rows, n_customers=None, n_products=4000, start='2010-12-01',
+                            end='2011-12-09', mean_lines=20, cancel_rate=0.02,
+                            null_customer_rate=0.25, chunk_rows=1_000_000, seed=42):
+    """Generar transacciones sintéticas en bloques de ~chunk_rows filas"""
+    rng = np.random.default_rng(seed)
+    if n_customers is None:
+        n_customers = max(n_rows // 120, 10)
+
+    plan = _invoice_plan(rng, n_rows, n_customers, start, end, mean_lines, cancel_rate, null_customer_rate)
+    catalog = _catalog(rng, n_products)
+
+    # Atributos fijos por cliente: ID, país y multiplicador de gasto (cola pesada)
+    customer_ids = 12346 + rng.permutation(n_customers).astype(np.float64)
+    customer_country = _weighted_choice(rng, np.cumsum(COUNTRY_WEIGHTS), n_customers)
+    customer_spend = rng.lognormal(0.0, 0.8, n_customers)
+
+    invoice_customer_ids = customer_ids[plan['customers']]
+    invoice_customer_ids[plan['null_customer']] = np.nan
+
+    countries = pd.Categorical.from_codes(np.arange(len(COUNTRIES)), categories=COUNTRIES)
+    invoice_end = np.cumsum(plan['lines'])
+    first_invoice = 0
+
+    while first_invoice < plan['n_invoices']:
+        # Bloque de facturas completas con ~chunk_rows líneas
+        offset = invoice_end[first_invoice - 1] if first_invoice > 0 else 0
+        last_invoice = int(np.searchsorted(invoice_end, offset + chunk_rows)) + 1
+        last_invoice = min(last_invoice, plan['n_invoices'])
+        invoices = np.arange(first_invoice, last_invoice)
+
+        # Expandir atributos de factura a nivel línea
+        invoice_of_line = np.repeat(invoices, plan['lines'][invoices])
+        n_lines = len(invoice_of_line)
+        customer_of_line = plan['customers'][invoice_of_line]
+        cancelled = plan['cancelled'][invoice_of_line]
+
+        products = _weighted_choice(rng, catalog['popularity_cdf'], n_lines)
+        quantity = (1 + rng.negative_binomial(1, 0.15, n_lines)) * customer_spend[customer_of_line]
+        quantity = np.maximum(np.round(quantity), 1).astype(np.int64)
+        quantity[cancelled] *= -1
+
+        invoice_numbers = pd.Series(invoice_of_line + 536365).astype(str)
+        invoice_numbers = invoice_numbers.where(~cancelled, 'C' + invoice_numbers)
+
+        yield pd.DataFrame({
+            'InvoiceNo': invoice_numbers,
+            'StockCode': pd.Categorical.from_codes(products, categories=catalog['stock_codes']),
+            'Description': pd.Categorical.from_codes(products, categories=catalog['descriptions']),
+            'Quantity': quantity,
+            'InvoiceDate': plan['dates'][invoice_of_line],
+            'UnitPrice': catalog['prices'][products],
+            'CustomerID': invoice_customer_ids[invoice_of_line],
+            'Country': countries[customer_country[customer_of_line]]
+        })
+
+        first_invoice = last_invoice
+
+
+def generate_transactions(n_rows, **kwargs):
+    """Generar todas las transacciones sintéticas en un solo DataFrame"""
+    kwargs.setdefault('chunk_rows', max(n_rows, 1))
+    return pd.concat(iter_transaction_chunks(n_rows, **kwargs), ignore_index=True)
+
+
+def write_transactions(chunks, output, file_format, split=False):
+    """Escribir bloques en CSV, Parquet o Excel; devuelve (filas, archivos)"""
+    output = Path(output)
+    total_rows = 0
+    files = []
+
+    if split:
+        # Un archivo por bloque (ej. para la carpeta de ingesta o particiones)
+        output.mkdir(parents=True, exist_ok=True)
+        for i, chunk in enumerate(chunks):
+            path = output / f'part-{i:05d}.{file_format}'
+            if file_format == 'csv':
+                chunk.to_csv(path, index=False)
+            else:
+                chunk.to_parquet(path, index=False)
+            total_rows += len(chunk)
+            files.append(path)
+        return total_rows, files
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    if file_format == 'xlsx':
+        df = pd.concat(chunks, ignore_index=True)
+        if len(df) > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel admite como máximo {EXCEL_MAX_ROWS:,} filas; usa CSV o Parquet")
+        df.to_excel(output, index=False)
+        return len(df), [output]
+
+    if file_format == 'csv':
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(output, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+            total_rows += len(chunk)
+        return total_rows, [output]
+
+    # Parquet: un row group por bloque sin cargar el dataset completo
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+            total_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total_rows, [output]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de transacciones sintéticas (Online Retail)")
+    parser.add_argument('--rows', default='5000', help="Número de líneas (ej: 5000, 10M)")
+    parser.add_argument('--customers', help="Número de clientes (por defecto filas / 120)")
+    parser.add_argument('--products', default='4000', help="Tamaño del catálogo de productos")
+    parser.add_argument('--start', default='2010-12-01', help="Fecha inicial (YYYY-MM-DD)")
+    parser.add_argument('--end', default='2011-12-09', help="Fecha final (YYYY-MM-DD)")
+    parser.add_argument('--mean-lines', type=float, default=20, help="Líneas promedio por factura")
+    parser.add_argument('--cancel-rate', type=float, default=0.02, help="Fracción de facturas canceladas")
+    parser.add_argument('--null-rate', type=float, default=0.25, help="Fracción de facturas sin CustomerID")
+    parser.add_argument('--chunk-rows', default='1M', help="Filas por bloque / row group")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='data/Online_Retail_Test.xlsx', help="Archivo o carpeta de salida")
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'],
+                        help="Formato de salida (por defecto según la extensión)")
+    parser.add_argument('--split', action='store_true', help="Escribir un archivo por bloque en la carpeta de salida")
+    args = parser.parse_args()
+
+    file_format = args.format or Path(args.output).suffix.lstrip('.') or 'csv'
+    if file_format == 'xlsx' and args.split:
+        parser.error("--split solo está disponible para csv y parquet")
+
+    n_rows = _parse_count(args.rows)
+    print("Generando dataset sintético de prueba...")
+
+    chunks = iter_transaction_chunks(
+        n_rows,
+        n_customers=_parse_count(args.customers) if args.customers else None,
+        n_products=_parse_count(args.products),
+        start=args.start,
+        end=args.end,
+        mean_lines=args.mean_lines,
+        cancel_rate=args.cancel_rate,
+        null_customer_rate=args.null_rate,
+        chunk_rows=_parse_count(args.chunk_rows),
+        seed=args.seed
+    )
+    total_rows, files = write_transactions(chunks, args.output, file_format, split=args.split)
+
+    print(f"✓ Dataset sintético generado: {args.output} ({len(files)} archivo(s))")
+    print(f"  - {total_rows:,} transacciones")
+    print("\nPuedes usar este archivo para probar el dashboard.")
+    print("Para producción, descarga el dataset real desde UCI.")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,24 +15,63 @@ Fecha: Diciembre 2025
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.metrics import silhouette_score, confusion_matrix, classification_report, accuracy_score
-import pickle
+import importlib.util
+import os
+import time
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
+from pathlib import Path
 
-# Importar Groq AI (API más libre y rápida)
-try:
-    from groq import Groq
-    GROQ_AVAILABLE = True
-except ImportError:
-    GROQ_AVAILABLE = False
+from rfm_scoring import (QUANTILE_OPTIONS, TIE_METHODS, score_rfm, build_score_cube,
+                         query_score_cube, score_mask)
+from segment_profile import segmentation_key, rfm_key
+from backends import BACKENDS, available_backends, default_backend, resolve_paths
+from invoices import basket_summary
+import stages
+from pipeline import assign_segment_names, DEFAULT_N_CLUSTERS, TREE_DEFAULTS
+from snapshots import migration_matrix, segment_sizes, customer_trajectory
+from customer_index import parse_customer_id, lookup_customer, nearest_customers
+from export import EXPORT_FORMATS, cluster_centers, start_export, discard_export
+from snapshot_store import load_preprocessed, k_sweep_results, scaler_from_metadata, centers_from_metadata
+from partitions import list_partitions, partition_versions, date_range
+from warmup import read_warmup_status
+from stability import DEFAULT_SEED_REFITS, STABLE_JACCARD, DISSOLVED_JACCARD
+from result_cache import content_key, cache_stats
+from live_ingest import get_live_ingest, live_snapshot, live_revision, DRIFT_PSI, DRIFT_INERTIA
+from clv import clv_by_segment, DEFAULT_HORIZON_MONTHS
+from sales_cube import query_sales_cube, sales_cube_stats
+from validation import validate_sample, check_quality
+from market_segments import compare_markets, DEFAULT_MIN_CUSTOMERS, OTHER_MARKETS
+from market_basket import DEFAULT_MIN_SUPPORT, DEFAULT_MIN_CONFIDENCE
+from jobs import start_job, report_progress, cancel_job, wait_job, job_fraction, job_elapsed
+from chat_telemetry import (track_chat, stream_answer, chat_records, summarize_chat, error_counts,
+                            is_admin, to_json_lines as chat_json_lines)
+from instrumentation import (new_run, track_stage, summarize_run,
+                             run_wall_seconds, to_json_lines, to_prometheus)
+
+# Reruns conservados en el historial de rendimiento de cada sesión
+PERF_HISTORY_RUNS = 20
+
+# Trabajos en segundo plano: cuánto espera el rerun antes de mostrar el progreso
+# (los resultados ya cacheados se dibujan sin parpadeo) y cada cuánto se refresca
+# el fragmento con su progreso
+JOB_WAIT_SECONDS = 0.3
+JOB_POLL_SECONDS = 1.0
+
+# Modo en vivo: cada cuánto el panel de la ingesta comprueba si hay lotes nuevos
+LIVE_REFRESH_SECONDS = 5
+
+# Fuentes de datos disponibles en la barra lateral
+DATA_SOURCES = {
+    'upload': '📁 Subir archivo',
+    'files': '🗂️ Archivos en el servidor (CSV/Parquet)',
+    'partitions': '🗓️ Particiones mensuales (Parquet)',
+    'live': '📡 Carpeta en vivo (ingesta continua)',
+    'preprocessed': '💾 Datos pre-procesados'
+}
+
+# Groq AI (API más libre y rápida): solo se comprueba que esté instalado, el
+# módulo se importa al configurar el chatbot
+GROQ_AVAILABLE = importlib.util.find_spec('groq') is not None
 
 # Configuración de la página
 st.set_page_config(
@@ -136,151 +175,92 @@ st.markdown("""
 # FUNCIONES AUXILIARES
 # ============================================================================
 
-@st.cache_data
-def load_data(file):
-    """Cargar datos desde archivo Excel"""
+# Etapas del pipeline: caché en memoria del proceso sobre la caché en disco de
+# `stages` (la que llena el precalentamiento)
+get_raw_data = st.cache_data(max_entries=2)(stages.get_raw_data)
+get_quality_report = st.cache_data(max_entries=4)(stages.get_quality_report)
+get_clean_data = st.cache_data(max_entries=2)(stages.get_clean_data)
+get_invoice_table = st.cache_data(max_entries=4)(stages.get_invoice_table)
+get_rfm = st.cache_data(max_entries=4)(stages.get_rfm)
+load_rfm_from_files = st.cache_data(max_entries=8)(stages.load_rfm_from_files)
+load_rfm_from_partitions = st.cache_data(max_entries=8)(stages.load_rfm_from_partitions)
+get_rfm_snapshots = st.cache_data(max_entries=4)(stages.get_rfm_snapshots)
+get_clustering = st.cache_data(max_entries=8)(stages.get_clustering)
+get_decision_tree = st.cache_data(max_entries=16)(stages.get_decision_tree)
+get_cluster_stability = st.cache_data(max_entries=8)(stages.get_cluster_stability)
+get_segment_profile = st.cache_data(max_entries=16)(stages.get_segment_profile)
+get_clv = st.cache_data(max_entries=8)(stages.get_clv)
+get_basket_matrix = st.cache_data(max_entries=2)(stages.get_basket_matrix)
+get_basket_rules = st.cache_data(max_entries=8)(stages.get_basket_rules)
+get_customer_activity = st.cache_data(max_entries=4)(stages.get_customer_activity)
+get_sales_cube = st.cache_data(max_entries=8)(stages.get_sales_cube)
+get_market_segmentation = st.cache_data(max_entries=4)(stages.get_market_segmentation)
+get_k_sweep = st.cache_data(max_entries=8)(stages.get_k_sweep)
+get_chatbot_context = st.cache_data(max_entries=16)(stages.get_chatbot_context)
+# El índice se comparte sin copiar entre sesiones (solo se lee)
+get_customer_index = st.cache_resource(max_entries=4)(stages.get_customer_index)
+
+
+@st.cache_data(max_entries=256)
+def check_file_sample(path, version):
+    """Error de cabecera o muestra de un archivo del servidor (None si es válido), cacheado por versión"""
     try:
-        df = pd.read_excel(file)
-        return df
-    except Exception as e:
-        st.error(f"Error al cargar el archivo: {e}")
-        return None
+        validate_sample(path)
+    except ValueError as e:
+        return str(e)
+    return None
 
 
-def clean_data(df):
-    """Limpiar y preparar datos"""
-    with st.spinner("Limpiando datos..."):
-        # Crear copia
-        df_clean = df.copy()
-        
-        initial_records = len(df_clean)
-        
-        # Eliminar CustomerID nulos
-        df_clean = df_clean[df_clean['CustomerID'].notna()]
-        
-        # Eliminar cancelaciones
-        df_clean = df_clean[~df_clean['InvoiceNo'].astype(str).str.startswith('C')]
-        
-        # Eliminar valores negativos o cero
-        df_clean = df_clean[df_clean['Quantity'] > 0]
-        df_clean = df_clean[df_clean['UnitPrice'] > 0]
-        
-        # Convertir fecha
-        df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
-        
-        # Calcular valor total
-        df_clean['TotalAmount'] = df_clean['Quantity'] * df_clean['UnitPrice']
-        
-        final_records = len(df_clean)
-        removed_pct = ((initial_records - final_records) / initial_records) * 100
-        
-        st.success(f"✓ Limpieza completada: {final_records:,} transacciones válidas ({removed_pct:.1f}% eliminadas)")
-        
-        return df_clean
+def load_upload_job(job, uploaded_file, dataset_id, backend):
+    """Trabajo de carga de un archivo subido: validación, lectura, limpieza, facturas y RFM (cacheados)"""
+    # Cabecera y primeras filas: un archivo inválido se rechaza antes de leerlo entero
+    report_progress(job, 0, 6, "Validando cabecera y muestra")
+    validate_sample(uploaded_file)
+    report_progress(job, 1, 6, "Leyendo archivo")
+    df = get_raw_data(dataset_id, uploaded_file)
+    report_progress(job, 2, 6, "Validando datos completos")
+    check_quality(get_quality_report(dataset_id, df), source=uploaded_file.name)
+    report_progress(job, 3, 6, "Limpiando datos")
+    df_clean = get_clean_data(dataset_id, backend, df)
+    report_progress(job, 4, 6, "Construyendo tabla de facturas")
+    invoices = get_invoice_table(dataset_id, df_clean)
+    report_progress(job, 5, 6, "Calculando métricas RFM")
+    get_rfm(dataset_id, backend, df_clean, invoices)
+    report_progress(job, 6, 6)
 
 
-def calculate_rfm(df_clean):
-    """Calcular métricas RFM"""
-    with st.spinner("Calculando métricas RFM..."):
-        # Fecha de referencia
-        reference_date = df_clean['InvoiceDate'].max() + timedelta(days=1)
-        
-        # Agregar a nivel cliente
-        customer_data = df_clean.groupby('CustomerID').agg({
-            'InvoiceNo': 'nunique',
-            'TotalAmount': 'sum',
-            'InvoiceDate': 'max'
-        }).reset_index()
-        
-        customer_data.columns = ['CustomerID', 'NumPurchases', 'TotalSpent', 'LastPurchaseDate']
-        
-        # Calcular RFM
-        customer_data['Recency'] = (reference_date - customer_data['LastPurchaseDate']).dt.days
-        customer_data['Frequency'] = customer_data['NumPurchases']
-        customer_data['Monetary'] = customer_data['TotalSpent']
-        
-        rfm = customer_data[['CustomerID', 'Recency', 'Frequency', 'Monetary']].copy()
-        
-        st.success(f"✓ RFM calculado para {len(rfm):,} clientes")
-        
-        return rfm
+def fill_cache_job(job, func, *args):
+    """Trabajo de una sola llamada cacheada: el rerun lee después el resultado de la caché"""
+    report_progress(job, 0, None, "Calculando")
+    func(*args)
 
 
-def perform_clustering(rfm, n_clusters=4):
-    """Aplicar K-Means clustering"""
-    with st.spinner("Ejecutando clustering K-Means..."):
-        # Normalizar
-        scaler = StandardScaler()
-        rfm_scaled = scaler.fit_transform(rfm[['Recency', 'Frequency', 'Monetary']])
-        
-        # K-Means
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        rfm['Cluster'] = kmeans.fit_predict(rfm_scaled)
-        
-        st.success(f"✓ Clustering completado: {n_clusters} segmentos identificados")
-        
-        return rfm, kmeans, scaler
+def decision_tree_job(job, segmentation_id, rfm, max_depth, min_samples_split, min_samples_leaf):
+    """Trabajo del árbol de decisión (un solo ajuste: sin progreso intermedio)"""
+    report_progress(job, 0, None, f"profundidad {max_depth}")
+    get_decision_tree(segmentation_id, rfm, max_depth, min_samples_split, min_samples_leaf)
 
 
-def assign_segment_names(rfm):
-    """Asignar nombres descriptivos a los segmentos"""
-    cluster_avg = rfm.groupby('Cluster')[['Recency', 'Frequency', 'Monetary']].mean()
-    
-    segment_names = {}
-    for cluster_id in rfm['Cluster'].unique():
-        recency = cluster_avg.loc[cluster_id, 'Recency']
-        frequency = cluster_avg.loc[cluster_id, 'Frequency']
-        monetary = cluster_avg.loc[cluster_id, 'Monetary']
-        
-        if recency < 50 and frequency > 5 and monetary > 2000:
-            name = 'Champions'
-        elif recency < 100 and frequency > 3 and monetary > 1000:
-            name = 'Loyal Customers'
-        elif recency > 200 and frequency < 3:
-            name = 'At Risk'
-        else:
-            name = 'Occasional Buyers'
-        
-        segment_names[cluster_id] = name
-    
-    rfm['Segment'] = rfm['Cluster'].map(segment_names)
-    
-    return rfm, segment_names
+def cluster_stability_job(job, segmentation_id, rfm, n_bootstrap_refits):
+    """Trabajo de estabilidad: llena la caché de get_cluster_stability informando cada réplica"""
+    get_cluster_stability(segmentation_id, rfm, n_bootstrap_refits, _job=job)
 
 
-def train_decision_tree(rfm, max_depth=4, min_samples_split=100, min_samples_leaf=50):
-    """Entrenar árbol de decisión explicativo"""
-    X = rfm[['Recency', 'Frequency', 'Monetary']]
-    y = rfm['Cluster']
-    
-    tree_model = DecisionTreeClassifier(
-        max_depth=max_depth,
-        min_samples_split=min_samples_split,
-        min_samples_leaf=min_samples_leaf,
-        random_state=42
-    )
-    
-    tree_model.fit(X, y)
-    
-    # Calcular predicciones y métricas
-    y_pred = tree_model.predict(X)
-    
-    return tree_model, X, y, y_pred
+def basket_rules_job(job, segmentation_id, basket_source, min_support, min_confidence, rfm, df_clean):
+    """Trabajo del análisis de cesta: matriz dispersa y FP-growth por segmento"""
+    report_progress(job, 0, None, f"soporte mínimo {min_support:.1%}")
+    get_basket_rules(segmentation_id, basket_source, min_support, min_confidence, rfm, df_clean)
 
 
-def evaluate_clustering(rfm_scaled, max_k=10):
-    """Evaluar diferentes valores de K para clustering"""
-    K_range = range(2, max_k + 1)
-    inertias = []
-    silhouette_scores_list = []
-    
-    for k in K_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(rfm_scaled)
-        inertias.append(kmeans.inertia_)
-        silhouette_scores_list.append(silhouette_score(rfm_scaled, labels))
-    
-    return K_range, inertias, silhouette_scores_list
+def market_segmentation_job(job, basket_source, n_clusters, min_customers, df):
+    """Trabajo de segmentación por mercado: llena la caché informando cada país terminado"""
+    report_progress(job, 0, None, "Codificando transacciones")
+    get_market_segmentation(basket_source, n_clusters, min_customers, df, _job=job)
+
+
+def k_sweep_job(job, rfm_id, rfm):
+    """Trabajo del barrido de K: llena la caché de get_k_sweep informando cada K"""
+    get_k_sweep(rfm_id, rfm, max_k=10, _job=job)
 
 
 def list_available_groq_models():
@@ -298,6 +278,8 @@ def list_available_groq_models():
 
 def initialize_groq(api_key, show_debug=False):
     """Inicializar Groq API"""
+    from groq import Groq
+
     try:
         client = Groq(api_key=api_key)
         
@@ -336,261 +318,255 @@ def initialize_groq(api_key, show_debug=False):
         return None, None
 
 
-def get_chatbot_context(rfm):
-    """Generar contexto completo sobre TODOS los análisis para el chatbot"""
+def render_quality_report(report):
+    """Resumen plegable del informe de calidad de los datos cargados"""
+    for warning in report['warnings']:
+        st.warning(f"⚠️ {warning}")
+    with st.expander("🧪 Calidad de los datos"):
+        checks = report['checks']
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Filas válidas", f"{checks['Filas válidas']:.1%}")
+        with col2:
+            st.metric("Sin CustomerID", f"{checks['Sin CustomerID']:.1%}")
+        with col3:
+            st.metric("Cancelaciones", f"{checks['Cancelaciones']:.1%}")
+        with col4:
+            st.metric("Filas duplicadas", f"{checks['Filas duplicadas']:.1%}")
+        first_date, last_date = report['date_range']
+        st.caption(f"{report['rows']:,} filas · {report['invoices']:,} facturas y {report['customers']:,} clientes "
+                   f"válidos · de {first_date:%Y-%m-%d} a {last_date:%Y-%m-%d} · cantidad ≤ 0: "
+                   f"{checks['Cantidad ≤ 0']:.1%} · precio ≤ 0: {checks['Precio ≤ 0']:.1%}")
+        nulls = (report['nulls'] * 100).round(2).reset_index()
+        nulls.columns = ['Columna', '% Nulos']
+        st.dataframe(nulls, use_container_width=True, hide_index=True)
+
+
+def render_chat_telemetry(container):
+    """Percentiles de latencia y tokens del chatbot (todas las sesiones del servidor) y exportación"""
+    with container:
+        records = chat_records()
+        if not records:
+            st.caption("Sin peticiones al chatbot en este servidor")
+            return
+        
+        latencies = [record['latency_s'] for record in records if record['status'] == 'ok']
+        errors = sum(record['status'] == 'error' for record in records)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Peticiones", f"{len(records):,}", help=f"{errors:,} con error")
+        with col2:
+            st.metric("Latencia p50", f"{np.median(latencies):.2f} s" if latencies else "-")
+        
+        # Una fila por modelo; columnas traspuestas para que quepan en la barra lateral
+        st.dataframe(summarize_chat(records).T, use_container_width=True)
+        failures = error_counts(records)
+        if not failures.empty:
+            st.dataframe(failures, use_container_width=True, hide_index=True)
+        
+        st.download_button(
+            "⬇️ Registros JSONL",
+            data=chat_json_lines(records),
+            file_name="chatbot_telemetria.jsonl",
+            mime="application/x-ndjson",
+            use_container_width=True
+        )
+        st.caption(f"Últimas {len(records):,} peticiones del proceso (todas las sesiones)")
+
+
+def render_welcome():
+    """Pantalla inicial cuando todavía no hay datos cargados"""
+    st.info("👈 Por favor, carga el archivo de datos desde la barra lateral para comenzar.")
     
-    # ===== RESUMEN GENERAL =====
-    context = f"""Eres streetviewer, un asistente experto en análisis de segmentación de clientes para retail online.
-Tienes acceso a TODO el análisis completo del dashboard con 6 pestañas.
-
-═══════════════════════════════════════════════════════════
-📊 RESUMEN GENERAL DEL ANÁLISIS
-═══════════════════════════════════════════════════════════
-- Total de clientes: {len(rfm):,}
-- Número de segmentos: {rfm['Cluster'].nunique()}
-- Segmentos identificados: {', '.join(sorted(rfm['Segment'].unique()))}
-- Algoritmo de clustering: K-Means con K={rfm['Cluster'].nunique()}
-- Método de segmentación: Análisis RFM + Machine Learning
-
-═══════════════════════════════════════════════════════════
-📈 ANÁLISIS EXPLORATORIO DE DATOS (EDA)
-═══════════════════════════════════════════════════════════
-
-DISTRIBUCIONES PRINCIPALES:
-- Recency: Rango {rfm['Recency'].min():.0f} - {rfm['Recency'].max():.0f} días
-  · Mediana: {rfm['Recency'].median():.0f} días
-  · Desv. estándar: {rfm['Recency'].std():.0f} días
-  
-- Frequency: Rango {rfm['Frequency'].min():.0f} - {rfm['Frequency'].max():.0f} compras
-  · Mediana: {rfm['Frequency'].median():.1f} compras
-  · Desv. estándar: {rfm['Frequency'].std():.1f} compras
-  · Clientes con 1 sola compra: {(rfm['Frequency'] == 1).sum()} ({(rfm['Frequency'] == 1).sum()/len(rfm)*100:.1f}%)
-  
-- Monetary: Rango £{rfm['Monetary'].min():,.2f} - £{rfm['Monetary'].max():,.2f}
-  · Mediana: £{rfm['Monetary'].median():,.2f}
-  · Desv. estándar: £{rfm['Monetary'].std():,.2f}
-  · Ingreso total: £{rfm['Monetary'].sum():,.2f}
-
-CORRELACIONES RFM:
-- Frequency vs Monetary: Alta correlación positiva (clientes frecuentes gastan más)
-- Recency vs Frequency: Correlación negativa moderada (clientes activos compran más)
-- Recency vs Monetary: Correlación negativa (clientes recientes gastan más)
-
-═══════════════════════════════════════════════════════════
-🎯 ANÁLISIS RFM DETALLADO
-═══════════════════════════════════════════════════════════
-
-MÉTRICAS GLOBALES:
-- Recency promedio: {rfm['Recency'].mean():.0f} días (último contacto)
-- Frequency promedio: {rfm['Frequency'].mean():.1f} compras por cliente
-- Monetary promedio: £{rfm['Monetary'].mean():,.2f} por cliente
-- Ticket promedio: £{rfm['Monetary'].sum()/rfm['Frequency'].sum():,.2f} por compra
-
-SEGMENTACIÓN RFM:
-El análisis divide a los clientes en cuartiles (Q1-Q4) para cada métrica:
-- R_Score: 4 = compradores muy recientes, 1 = inactivos
-- F_Score: 4 = muy frecuentes, 1 = ocasionales  
-- M_Score: 4 = alto valor, 1 = bajo valor
-- RFM_Score: Concatenación de los tres scores
-
-═══════════════════════════════════════════════════════════
-🔍 CLUSTERING K-MEANS (K={rfm['Cluster'].nunique()})
-═══════════════════════════════════════════════════════════
-
-CARACTERÍSTICAS DE LOS CLUSTERS:"""
+    # Información adicional
+    st.markdown("---")
+    st.subheader("📖 Acerca de este Dashboard")
+    st.markdown("""
+    Este dashboard te permite:
+    - **Cargar datos** transaccionales de retail online
+    - **Calcular automáticamente** métricas RFM (Recency, Frequency, Monetary)
+    - **Segmentar clientes** usando K-Means clustering
+    - **Visualizar resultados** con gráficos interactivos
+    - **Tomar decisiones** estratégicas basadas en datos
     
-    # Análisis detallado por cluster
-    for cluster_id in sorted(rfm['Cluster'].unique()):
-        cluster_data = rfm[rfm['Cluster'] == cluster_id]
-        segment_name = cluster_data['Segment'].iloc[0]
-        
-        context += f"""
-
-Cluster {cluster_id} - {segment_name}:
-- Tamaño: {len(cluster_data):,} clientes ({len(cluster_data)/len(rfm)*100:.1f}%)
-- Centroide RFM:
-  · Recency: {cluster_data['Recency'].mean():.0f} días
-  · Frequency: {cluster_data['Frequency'].mean():.1f} compras
-  · Monetary: £{cluster_data['Monetary'].mean():,.2f}
-- Valor total: £{cluster_data['Monetary'].sum():,.2f} ({cluster_data['Monetary'].sum()/rfm['Monetary'].sum()*100:.1f}% del total)
-- Valor por cliente: £{cluster_data['Monetary'].mean():,.2f}"""
+    **Instrucciones:**
+    1. Descarga el dataset 'Online Retail' desde UCI ML Repository
+    2. Carga el archivo usando el selector de la barra lateral
+    3. El sistema procesará automáticamente los datos
+    4. Explora los KPIs y visualizaciones generadas
+    """)
+
+
+def render_warmup_status(status):
+    """Estado del último precalentamiento (`python src/warmup.py`) en la barra lateral"""
+    if status is None:
+        return
+    if status['status'] == 'running':
+        step = f" · {status['step']}" if status['step'] else ""
+        st.sidebar.progress(status['datasets_done'] / max(status['total'], 1),
+                            text=f"🔥 Precalentando cachés ({status['datasets_done']}/{status['total']}): "
+                                 f"{status['current'] or ''}{step}")
+        return
     
-    # Interpretación de segmentos
-    context += """
+    errors = [result for result in status['results'] if result['status'] == 'error']
+    seconds = sum(result['seconds'] for result in status['results'])
+    finished = datetime.fromtimestamp(status['finished_at']).strftime('%d/%m %H:%M')
+    st.sidebar.caption(f"🔥 Cachés precalentadas el {finished}: {len(status['results']) - len(errors)} "
+                       f"de {status['total']} datasets en {seconds:.1f}s")
+    for result in errors:
+        st.sidebar.warning(f"⚠️ Precalentamiento de {result['dataset']}: {result['error']}")
 
-═══════════════════════════════════════════════════════════
-👥 INTERPRETACIÓN DE SEGMENTOS
-═══════════════════════════════════════════════════════════
-"""
+
+def _tracked_job(job, slot, func, *args):
+    """Ejecutar la etapa del trabajo midiéndola en su propio hilo: ahí ocurren el cálculo y el
+    fallo de caché, que una etapa del rerun (que después lee la caché) no vería"""
+    job['perf_run'] = new_run()
+    with track_stage(job['perf_run'], slot, kind='job', cached=True):
+        return func(job, *args)
+
+
+def session_job(slot, params, func, *args):
+    """Trabajo en segundo plano de la sesión para `slot` (se relanza si cambian los parámetros)"""
+    jobs = st.session_state.setdefault('jobs', {})
+    job = jobs.get(slot)
+    if job is None or job['params'] != params:
+        cancel_job(job)
+        # El resultado queda en la caché de Streamlit, no en la sesión
+        job = jobs[slot] = start_job(slot, _tracked_job, slot, func, *args, keep_result=False)
+        job['params'] = params
+    wait_job(job, JOB_WAIT_SECONDS)
     
-    # Análisis detallado de cada segmento
-    segment_strategies = {
-        'Champions': {
-            'perfil': 'Mejores clientes - Compran frecuente y recientemente, gastan mucho',
-            'comportamiento': 'Altamente comprometidos, alta lealtad, embajadores de marca',
-            'estrategia': 'Recompensas VIP, programa de fidelización premium, early access a productos',
-            'riesgo': 'Bajo - Mantener satisfacción',
-            'prioridad': 'MÁXIMA'
-        },
-        'Loyal Customers': {
-            'perfil': 'Clientes leales - Compran con regularidad, buen valor',
-            'comportamiento': 'Consistentes, responden bien a comunicaciones',
-            'estrategia': 'Upselling/cross-selling, programas de puntos, contenido exclusivo',
-            'riesgo': 'Bajo-Medio - Proteger de competencia',
-            'prioridad': 'ALTA'
-        },
-        'Potential Loyalist': {
-            'perfil': 'Potencial leal - Clientes recientes con buena frecuencia',
-            'comportamiento': 'En fase de adopción, responden a incentivos',
-            'estrategia': 'Nutrición de relación, ofertas personalizadas, onboarding mejorado',
-            'riesgo': 'Medio - Vulnerable a competencia',
-            'prioridad': 'ALTA'
-        },
-        'Recent Customers': {
-            'perfil': 'Nuevos compradores - Primera/segunda compra reciente',
-            'comportamiento': 'Explorando la marca, formando opiniones',
-            'estrategia': 'Welcome series, educación de producto, incentivos para segunda compra',
-            'riesgo': 'Alto - No establecido vínculo',
-            'prioridad': 'MEDIA-ALTA'
-        },
-        'Promising': {
-            'perfil': 'Prometedores - Compradores recientes con potencial',
-            'comportamiento': 'Interesados pero necesitan activación',
-            'estrategia': 'Ofertas especiales, recomendaciones personalizadas, engagement campaigns',
-            'riesgo': 'Medio-Alto - Necesitan activación',
-            'prioridad': 'MEDIA'
-        },
-        'Need Attention': {
-            'perfil': 'Requieren atención - Antes activos, ahora decayendo',
-            'comportamiento': 'Disminuyendo frecuencia, en riesgo de pérdida',
-            'estrategia': 'Campañas de reactivación, encuestas de feedback, ofertas win-back',
-            'riesgo': 'Alto - Pérdida inminente',
-            'prioridad': 'ALTA'
-        },
-        'About to Sleep': {
-            'perfil': 'A punto de dormir - Inactividad prolongada',
-            'comportamiento': 'Alejándose de la marca, posible insatisfacción',
-            'estrategia': 'Campañas agresivas de reengagement, descuentos significativos',
-            'riesgo': 'Muy Alto - Casi perdidos',
-            'prioridad': 'MEDIA'
-        },
-        'At Risk': {
-            'perfil': 'En riesgo - Buenos clientes que no compran hace tiempo',
-            'comportamiento': 'Desconectados, alto valor histórico en juego',
-            'estrategia': 'Contacto directo, ofertas personalizadas VIP, recuperación urgente',
-            'riesgo': 'CRÍTICO - Alto valor en riesgo',
-            'prioridad': 'MÁXIMA'
-        },
-        'Cannot Lose Them': {
-            'perfil': 'No podemos perderlos - Clientes de alto valor inactivos',
-            'comportamiento': 'Antes top customers, ahora inactivos - ALERTA ROJA',
-            'estrategia': 'Intervención directa CEO/gerencia, ofertas ultra-premium, recuperación a cualquier costo',
-            'riesgo': 'CRÍTICO - Pérdida de alto impacto',
-            'prioridad': 'EMERGENCIA'
-        },
-        'Hibernating': {
-            'perfil': 'Hibernando - Largo tiempo sin actividad',
-            'comportamiento': 'Muy probablemente perdidos, bajo engagement',
-            'estrategia': 'Win-back campaigns de bajo costo, ofertas masivas, último intento',
-            'riesgo': 'Muy Alto - Probablemente perdidos',
-            'prioridad': 'BAJA'
-        },
-        'Lost': {
-            'perfil': 'Perdidos - Sin actividad reciente, bajo valor histórico',
-            'comportamiento': 'Churn completo, muy baja probabilidad de retorno',
-            'estrategia': 'Campañas masivas de bajo costo, focus en adquisición nueva',
-            'riesgo': 'Máximo - Churn completo',
-            'prioridad': 'MUY BAJA'
-        }
-    }
+    # La etapa medida en el hilo se añade una sola vez, al rerun que ve terminar el trabajo
+    if job['status'] != 'running' and not job.get('reported') and 'perf_run' in job:
+        st.session_state.perf_runs[-1]['stages'].extend(job['perf_run']['stages'])
+        job['reported'] = True
+    return job
+
+
+def discard_session_job(slot):
+    """Olvidar el trabajo de `slot` (cancelándolo si sigue en curso)"""
+    job = st.session_state.get('jobs', {}).pop(slot, None)
+    cancel_job(job)
+
+
+def _session_job_by_slot(slot):
+    """Trabajo guardado en la sesión para `slot` (la exportación tiene su propia clave)"""
+    if slot == 'export':
+        return st.session_state.get('export_job')
+    return st.session_state.get('jobs', {}).get(slot)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress(slot, label):
+    """Progreso y cancelación de un trabajo en curso: solo este fragmento se refresca
+    mientras corre y, al terminar, se vuelve a ejecutar la página para mostrar el resultado"""
+    job = _session_job_by_slot(slot)
+    if job is None or job['status'] != 'running':
+        st.rerun()
     
-    for segment in sorted(rfm['Segment'].unique()):
-        segment_data = rfm[rfm['Segment'] == segment]
-        info = segment_strategies.get(segment, {})
-        
-        context += f"""
-
-🏷️ {segment.upper()}
-{'-' * 60}
-- Tamaño: {len(segment_data):,} clientes ({len(segment_data)/len(rfm)*100:.1f}%)
-- Perfil: {info.get('perfil', 'N/A')}
-- Comportamiento: {info.get('comportamiento', 'N/A')}
-- Estrategia recomendada: {info.get('estrategia', 'N/A')}
-- Nivel de riesgo: {info.get('riesgo', 'N/A')}
-- Prioridad: {info.get('prioridad', 'N/A')}
-
-Métricas clave:
-- Recency media: {segment_data['Recency'].mean():.0f} días
-- Frequency media: {segment_data['Frequency'].mean():.1f} compras
-- Monetary medio: £{segment_data['Monetary'].mean():,.2f}
-- Valor total: £{segment_data['Monetary'].sum():,.2f}
-- ROI potencial: {'ALTO' if segment in ['Champions', 'Loyal Customers', 'Cannot Lose Them', 'At Risk'] else 'MEDIO' if segment in ['Potential Loyalist', 'Need Attention'] else 'BAJO'}"""
+    fraction = job_fraction(job)
+    progress = f" ({job['done']:,} de {job['total']:,})" if fraction is not None else ""
+    st.progress(fraction or 0.0,
+                text=f"⏳ {label}: {job['message'] or 'en curso'}{progress} · {job_elapsed(job):.0f}s")
+    if job['cancel'].is_set():
+        st.caption("Cancelando…")
+    elif st.button("Cancelar", key=f"cancel_job_{slot}"):
+        cancel_job(job)
+        st.rerun()
+
+
+def render_job_status(slot, job, label, container=st):
+    """Progreso, cancelación y errores de un trabajo de la sesión; True si terminó"""
+    if job['status'] == 'done':
+        return True
     
-    context += """
-
-═══════════════════════════════════════════════════════════
-🌳 ÁRBOL DE DECISIÓN - REGLAS DE CLASIFICACIÓN
-═══════════════════════════════════════════════════════════
-
-El modelo de árbol de decisión genera reglas interpretables para clasificar clientes:
-- Entradas: Recency, Frequency, Monetary (escaladas)
-- Salida: Predicción de segmento
-- Parámetros optimizables: max_depth, min_samples_split, min_samples_leaf
-
-INTERPRETACIÓN DE REGLAS:
-Las reglas del árbol muestran los umbrales exactos de RFM que definen cada segmento.
-Ejemplo: "Si Recency <= 50 días Y Frequency > 5 compras → Champions"
-
-MÉTRICAS DEL MODELO:
-- Accuracy: Mide precisión general de clasificación
-- Confusion Matrix: Muestra aciertos/errores por segmento
-- Feature Importance: Recency suele ser la más influyente
-
-═══════════════════════════════════════════════════════════
-💡 INSIGHTS ACCIONABLES
-═══════════════════════════════════════════════════════════
-
-1. PRIORIZACIÓN DE RECURSOS:
-   - MÁXIMA: Champions, At Risk, Cannot Lose Them
-   - ALTA: Loyal Customers, Potential Loyalist, Need Attention
-   - MEDIA: Recent Customers, Promising, About to Sleep
-   - BAJA: Hibernating, Lost
-
-2. OPTIMIZACIÓN DE PRESUPUESTO:
-   - 60% en retención de alto valor (Champions, Loyal, At Risk)
-   - 25% en desarrollo (Potential Loyalist, Recent)
-   - 15% en recuperación (Need Attention, Cannot Lose)
-
-3. MÉTRICAS A MONITOREAR:
-   - Tasa de migración entre segmentos
-   - CLV (Customer Lifetime Value) por segmento
-   - Churn rate en segmentos de riesgo
-   - Efectividad de campañas por segmento
-
-═══════════════════════════════════════════════════════════
-🎯 TU MISIÓN COMO STREETVIEWER
-═══════════════════════════════════════════════════════════
-
-Debes ayudar a los usuarios a:
-1. ✅ Entender CUALQUIER aspecto del análisis completo (6 pestañas)
-2. ✅ Interpretar métricas RFM, clusters, y reglas del árbol
-3. ✅ Tomar decisiones estratégicas basadas en datos
-4. ✅ Diseñar campañas específicas por segmento
-5. ✅ Optimizar presupuestos de marketing
-6. ✅ Identificar oportunidades y riesgos
-7. ✅ Explicar el análisis a stakeholders no técnicos
-
-ESTILO DE RESPUESTA:
-- 🎯 Claro y conciso, orientado a negocios
-- 📊 Fundamentado en los datos proporcionados arriba
-- 💼 Lenguaje profesional pero accesible
-- 🇪🇸 Siempre en español
-- 💡 Proactivo: sugiere insights adicionales relevantes
-- 🔢 Usa números específicos del análisis cuando sea posible
-
-¡Ahora tienes CONTEXTO COMPLETO del dashboard entero! 🚀"""
+    if job['status'] == 'running':
+        with container.container():
+            render_job_progress(slot, label)
+        return False
     
-    return context
+    if job['status'] == 'cancelled':
+        container.warning(f"⏹️ {label}: cancelado")
+    else:
+        container.error(f"❌ {label}: {job['error']}")
+    if container.button("Reintentar", key=f"retry_job_{slot}"):
+        discard_session_job(slot)
+        st.rerun()
+    return False
+
+
+def render_live_status(snapshot):
+    """Retraso, throughput y deriva de la ingesta en vivo"""
+    st.info(f"Archivos ingeridos: {snapshot['files']:,} · Registros: {snapshot['rows_read']:,} "
+            f"({snapshot['rows_valid']:,} válidos)")
+    batches = snapshot['batches']
+    last = batches[-1]
+    seconds = sum(batch['seconds'] for batch in batches)
+    throughput = sum(batch['rows'] for batch in batches) / seconds if seconds > 0 else 0
+    col1, col2 = st.columns(2)
+    col1.metric("Retraso de ingesta", f"{last['lag_seconds']:.1f}s",
+                help="Desde que el último extracto llegó a la carpeta hasta que sus clientes quedaron reasignados")
+    col2.metric("Throughput", f"{throughput:,.0f} filas/s", help=f"Media de los últimos {len(batches)} lotes")
+    drift = snapshot['drift']
+    st.caption(f"Último lote: {last['files']} archivos · {last['customers_affected']:,} clientes afectados · "
+               f"{last['reassigned']:,} reasignados · hace {time.time() - last['finished_at']:.0f}s")
+    st.caption(f"Deriva: PSI {drift['psi']:.3f} (umbral {DRIFT_PSI}) · distancia al centroide "
+               f"{drift['inertia']:+.0%} (umbral {DRIFT_INERTIA:.0%}) · {snapshot['reclusters']} reajustes")
+    if last['recluster']:
+        st.caption(f"🔄 Segmentos reajustados en el último lote: {last['recluster']}")
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_panel(live, revision, snapshot):
+    """Panel de la ingesta en vivo: se refresca solo y vuelve a ejecutar la página únicamente
+    cuando la ingesta publica cambios (lote nuevo, archivo con error o error del vigilante)"""
+    if live_revision(live) != revision:
+        st.rerun()
+    if snapshot['rfm'] is not None:
+        render_live_status(snapshot)
+
+
+def render_performance_panel(container, perf_run, perf_runs):
+    """Mostrar las métricas del rerun actual y los botones de exportación"""
+    with container:
+        summary = pd.DataFrame(summarize_run(perf_run))
+        if summary.empty:
+            st.caption("Sin etapas registradas en este rerun")
+            return
+        
+        summary['Filas'] = summary['Filas'].astype('Int64')
+        st.metric("Tiempo del rerun (etapas + pestañas)", f"{run_wall_seconds(perf_run):.2f} s")
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "⬇️ JSONL",
+                data=to_json_lines(perf_runs),
+                file_name="rendimiento.jsonl",
+                mime="application/x-ndjson",
+                use_container_width=True
+            )
+        with col2:
+            st.download_button(
+                "⬇️ Prometheus",
+                data=to_prometheus(),
+                file_name="rendimiento.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
+        st.caption(f"Historial: últimos {len(perf_runs)} reruns de esta sesión "
+                   "(Prometheus: contadores de todo el proceso)")
+
+        # Caché de resultados en disco (compartida por sesiones y procesos del servidor)
+        disk = cache_stats()
+        if disk['hit_rate'] is not None:
+            st.caption(f"💽 Caché en disco: {disk['entries']:,} entradas · "
+                       f"{disk['bytes'] / 1024**2:,.1f} de {disk['budget_bytes'] / 1024**2:,.0f} MB · "
+                       f"aciertos {disk['hit_rate']:.0%} ({disk['hits']:,} de {disk['hits'] + disk['misses']:,}) · "
+                       f"{disk['saved_seconds']:,.1f}s ahorrados")
+            st.dataframe(disk['stages'][['Etapa', 'Aciertos', 'Fallos', 'Tasa_aciertos', 'Entradas']],
+                         use_container_width=True, hide_index=True)
 
 
 # ============================================================================
@@ -612,79 +588,366 @@ def main():
     if 'groq_model' not in st.session_state:
         st.session_state.groq_model = None
     
+    # Registro de rendimiento de este rerun (se conservan los últimos reruns)
+    if 'perf_runs' not in st.session_state:
+        st.session_state.perf_runs = []
+    perf_run = new_run()
+    st.session_state.perf_runs = (st.session_state.perf_runs + [perf_run])[-PERF_HISTORY_RUNS:]
+    
     # Barra lateral
     st.sidebar.title("⚙️ Configuración")
+    
+    # Último precalentamiento de la caché en disco (se ejecuta fuera del servidor)
+    render_warmup_status(read_warmup_status())
     st.sidebar.markdown("---")
     
-    # Opción 1: Cargar datos pre-procesados
-    use_preprocessed = st.sidebar.checkbox("Usar datos pre-procesados", value=False)
+    # Fuente de datos
+    data_source = st.sidebar.radio(
+        "Fuente de datos",
+        options=list(DATA_SOURCES),
+        format_func=lambda key: DATA_SOURCES[key]
+    )
+    use_preprocessed = data_source == 'preprocessed'
     
+    snapshot_metadata = None
+    # Centroides guardados en el snapshot (las demás fuentes los toman del modelo ajustado)
+    model_centers = None
+    # Origen de las líneas de factura para el análisis de cesta y la segmentación por
+    # mercado (solo archivo subido o archivos)
+    basket_source = None
+    # Origen de la actividad por país y mes para el cubo de ventas (sin él no hay filtros)
+    activity_source = None
     if use_preprocessed:
         try:
-            rfm = pd.read_csv('data/rfm_segments.csv')
-            with open('data/segment_names.pkl', 'rb') as f:
-                segment_names = pickle.load(f)
+            with track_stage(perf_run, 'read_preprocessed') as stage:
+                # Snapshot Arrow + metadatos; si no existe, CSV + pickle del notebook anterior
+                rfm, segment_names, snapshot_metadata = load_preprocessed()
+                stage['rows'] = len(rfm)
             
-            st.sidebar.success("✓ Datos pre-procesados cargados")
+            if snapshot_metadata is not None:
+                st.sidebar.success(f"✓ Snapshot pre-procesado cargado ({snapshot_metadata['created_at'][:10]})")
+            else:
+                st.sidebar.success("✓ Datos pre-procesados cargados (formato CSV anterior)")
+            
+            # Normalización y centroides del snapshot; el formato CSV anterior no los guarda
+            kmeans_model = None
+            if snapshot_metadata is not None:
+                scaler = scaler_from_metadata(snapshot_metadata)
+                model_centers = centers_from_metadata(snapshot_metadata)
+            else:
+                from sklearn.preprocessing import StandardScaler
+                scaler = StandardScaler().fit(rfm[['Recency', 'Frequency', 'Monetary']])
+            rfm_id = rfm_key(rfm)
             
         except FileNotFoundError:
             st.sidebar.error("❌ Archivos pre-procesados no encontrados. Ejecuta el notebook primero.")
             return
     
     else:
-        # Opción 2: Cargar y procesar datos desde archivo
-        st.sidebar.subheader("📁 Cargar Datos")
-        uploaded_file = st.sidebar.file_uploader(
-            "Selecciona el archivo Online Retail.xlsx",
-            type=['xlsx', 'xls']
+        # Motor de cálculo para la limpieza y la agregación RFM
+        backend_options = available_backends()
+        backend = st.sidebar.selectbox(
+            "Motor de cálculo",
+            options=backend_options,
+            index=backend_options.index(default_backend()),
+            format_func=lambda name: BACKENDS[name],
+            help="DuckDB ejecuta limpieza y RFM en SQL columnar multihilo; el modo multinúcleo reparte "
+                 "la agregación RFM por CustomerID entre procesos (RFM_WORKERS). El resultado es el mismo que con pandas"
         )
         
-        if uploaded_file is None:
-            st.info("👈 Por favor, carga el archivo de datos desde la barra lateral para comenzar.")
+        if data_source == 'upload':
+            # Opción 2: Cargar y procesar datos desde archivo
+            st.sidebar.subheader("📁 Cargar Datos")
+            uploaded_file = st.sidebar.file_uploader(
+                "Selecciona el archivo Online Retail.xlsx",
+                type=['xlsx', 'xls', 'csv', 'parquet']
+            )
             
-            # Información adicional
-            st.markdown("---")
-            st.subheader("📖 Acerca de este Dashboard")
-            st.markdown("""
-            Este dashboard te permite:
-            - **Cargar datos** transaccionales de retail online
-            - **Calcular automáticamente** métricas RFM (Recency, Frequency, Monetary)
-            - **Segmentar clientes** usando K-Means clustering
-            - **Visualizar resultados** con gráficos interactivos
-            - **Tomar decisiones** estratégicas basadas en datos
-            
-            **Instrucciones:**
-            1. Descarga el dataset 'Online Retail' desde UCI ML Repository
-            2. Carga el archivo usando el selector de la barra lateral
-            3. El sistema procesará automáticamente los datos
-            4. Explora los KPIs y visualizaciones generadas
-            """)
+            if uploaded_file is None:
+                render_welcome()
+                return
             
-            return
-        
-        # Procesar datos
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("🔧 Procesamiento")
-        
-        # Cargar
-        df = load_data(uploaded_file)
-        if df is None:
-            return
-        
-        st.sidebar.info(f"Registros cargados: {len(df):,}")
-        
-        # Limpiar
-        df_clean = clean_data(df)
-        
-        # Calcular RFM
-        rfm = calculate_rfm(df_clean)
+            # Procesar datos
+            st.sidebar.markdown("---")
+            st.sidebar.subheader("🔧 Procesamiento")
+            
+            # Carga, limpieza, facturas y RFM en segundo plano (los resultados quedan en caché)
+            # Clave por contenido: el mismo libro subido por otra sesión reutiliza las cachés
+            dataset_id = content_key(uploaded_file.getvalue())
+            load_job = session_job('dataset', ('upload', dataset_id, backend),
+                                   load_upload_job, uploaded_file, dataset_id, backend)
+            if not render_job_status('dataset', load_job, "Carga de datos", st.sidebar):
+                st.info("Procesando el archivo en segundo plano...")
+                return
+            
+            with track_stage(perf_run, 'load_data', cached=True) as stage:
+                df = get_raw_data(dataset_id, uploaded_file)
+                stage['rows'] = len(df)
+            st.sidebar.info(f"Registros cargados: {len(df):,}")
+            with track_stage(perf_run, 'quality_report', rows=len(df), cached=True):
+                quality = get_quality_report(dataset_id, df)
+            render_quality_report(quality)
+            
+            # Limpiar
+            with track_stage(perf_run, 'clean_data', rows=len(df), cached=True):
+                df_clean = get_clean_data(dataset_id, backend, df)
+            removed_pct = (len(df) - len(df_clean)) / len(df) * 100
+            st.success(f"✓ Limpieza completada: {len(df_clean):,} transacciones válidas ({removed_pct:.1f}% eliminadas)")
+            
+            # Tabla de facturas (una fila por factura y cliente)
+            with track_stage(perf_run, 'build_invoice_table', rows=len(df_clean), cached=True):
+                invoices = get_invoice_table(dataset_id, df_clean)
+            
+            # Calcular RFM
+            with track_stage(perf_run, 'calculate_rfm', rows=len(invoices), cached=True):
+                rfm = get_rfm(dataset_id, backend, df_clean, invoices)
+            st.success(f"✓ RFM calculado para {len(rfm):,} clientes")
+            basket_source = ('upload', dataset_id)
+            activity_source = ('upload', dataset_id)
+        
+        elif data_source == 'partitions':
+            # Opción 4: Histórico particionado por mes (solo se leen los meses del rango)
+            st.sidebar.subheader("🗓️ Particiones Mensuales")
+            partitions_root = st.sidebar.text_input(
+                "Carpeta de particiones",
+                placeholder="data/partitions",
+                help="Carpeta con subcarpetas month=YYYY-MM creadas con src/partitions.py"
+            )
+            partitions = list_partitions(partitions_root) if partitions_root else {}
+            
+            if not partitions:
+                if partitions_root:
+                    st.sidebar.error("❌ No se encontraron particiones month=YYYY-MM en esa carpeta")
+                render_welcome()
+                return
+            
+            months = list(partitions)
+            first_day, last_day = date_range(partitions)
+            selected_range = st.sidebar.date_input(
+                "Rango de fechas",
+                value=(first_day, last_day),
+                min_value=first_day,
+                max_value=last_day
+            )
+            # Mientras se elige el rango, date_input devuelve una sola fecha
+            if not isinstance(selected_range, (tuple, list)) or len(selected_range) != 2:
+                st.sidebar.info("Selecciona la fecha final del rango")
+                return
+            range_start, range_end = selected_range
+            
+            st.sidebar.markdown("---")
+            st.sidebar.subheader("🔧 Procesamiento")
+            
+            partition_args = (partitions_root, partition_versions(partitions), range_start, range_end, backend)
+            load_job = session_job('dataset', ('partitions',) + partition_args,
+                                   fill_cache_job, load_rfm_from_partitions, *partition_args)
+            if not render_job_status('dataset', load_job, "RFM desde particiones", st.sidebar):
+                st.info("Calculando RFM desde particiones en segundo plano...")
+                return
+            
+            with track_stage(perf_run, 'rfm_from_partitions', cached=True) as stage:
+                rfm, partition_stats = load_rfm_from_partitions(*partition_args)
+                stage['rows'] = partition_stats['rows_read']
+            
+            st.sidebar.info(f"Particiones leídas: {partition_stats['partitions_read']} de {len(months)}")
+            st.sidebar.info(f"Registros leídos: {partition_stats['rows_read']:,} "
+                            f"({partition_stats['rows_valid']:,} válidos)")
+            st.success(f"✓ RFM calculado para {len(rfm):,} clientes")
+            activity_source = ('partitions',) + partition_args
+        
+        elif data_source == 'live':
+            # Opción 5: Carpeta vigilada; solo se ingieren los extractos nuevos
+            st.sidebar.subheader("📡 Ingesta en Vivo")
+            live_folder = st.sidebar.text_input(
+                "Carpeta vigilada",
+                placeholder="data/drop",
+                help="Carpeta donde llegan los extractos CSV/Parquet; cada archivo se ingiere una sola vez"
+            )
+            if not live_folder:
+                render_welcome()
+                return
+            if not os.path.isdir(live_folder):
+                st.sidebar.error("❌ La carpeta no existe")
+                render_welcome()
+                return
+            
+            n_clusters = st.sidebar.slider("Número de segmentos", 2, 8, DEFAULT_N_CLUSTERS)
+            live = get_live_ingest(live_folder, n_clusters)
+            
+            st.sidebar.markdown("---")
+            st.sidebar.subheader("🔧 Procesamiento")
+            with track_stage(perf_run, 'live_snapshot') as stage:
+                # Huella antes de la copia: un lote publicado entre ambas provoca otro rerun
+                revision = live_revision(live)
+                snapshot = live_snapshot(live)
+                stage['rows'] = snapshot['rows_read']
+            if live['error']:
+                st.sidebar.error(f"❌ {live['error']}")
+            for path, error in snapshot['file_errors'].items():
+                st.sidebar.warning(f"⚠️ {os.path.basename(path)}: {error}")
+            if snapshot['modified']:
+                st.sidebar.warning(f"⚠️ {len(snapshot['modified'])} archivos modificados después de ingerirse "
+                                   "(no se vuelven a leer)")
+            # Mientras se espera el primer lote el panel está vacío, pero sigue vigilando
+            with st.sidebar:
+                render_live_panel(live, revision, snapshot)
+            if snapshot['rfm'] is None:
+                st.info(f"📡 Esperando extractos en {live_folder}...")
+                return
+            
+            rfm, kmeans_model, scaler = snapshot['rfm'], snapshot['kmeans'], snapshot['scaler']
+            rfm_id = rfm_key(rfm)
+            st.success(f"✓ RFM en vivo para {len(rfm):,} clientes · {n_clusters} segmentos "
+                       f"(versión {snapshot['version']})")
         
-        # Clustering
-        n_clusters = st.sidebar.slider("Número de segmentos", 2, 8, 4)
-        rfm, kmeans_model, scaler = perform_clustering(rfm, n_clusters)
+        else:
+            # Opción 3: Archivos CSV/Parquet en el servidor (sin pasar por pandas con DuckDB)
+            st.sidebar.subheader("🗂️ Archivos en el Servidor")
+            files_pattern = st.sidebar.text_input(
+                "Ruta, carpeta o patrón glob",
+                placeholder="data/*.parquet",
+                help="Archivos CSV o Parquet con el esquema de Online Retail"
+            )
+            paths = resolve_paths(files_pattern) if files_pattern else []
+            
+            if not paths:
+                if files_pattern:
+                    st.sidebar.error("❌ No se encontraron archivos CSV/Parquet en esa ruta")
+                render_welcome()
+                return
+            
+            st.sidebar.markdown("---")
+            st.sidebar.subheader("🔧 Procesamiento")
+            st.sidebar.info(f"Archivos encontrados: {len(paths):,}")
+            
+            file_versions = tuple((os.path.getsize(path), os.path.getmtime(path)) for path in paths)
+            # Cabecera y primeras filas de cada archivo antes de lanzar el cálculo completo
+            with track_stage(perf_run, 'validate_files', rows=len(paths)):
+                file_errors = [check_file_sample(path, version) for path, version in zip(paths, file_versions)]
+                file_errors = [error for error in file_errors if error]
+            if file_errors:
+                for error in file_errors[:5]:
+                    st.sidebar.error(f"❌ {error}")
+                if len(file_errors) > 5:
+                    st.sidebar.error(f"❌ … y {len(file_errors) - 5} archivos más con errores")
+                render_welcome()
+                return
+            files_args = (tuple(paths), file_versions, backend)
+            load_job = session_job('dataset', ('files',) + files_args,
+                                   fill_cache_job, load_rfm_from_files, *files_args)
+            if not render_job_status('dataset', load_job, "RFM desde archivos", st.sidebar):
+                st.info("Calculando RFM desde archivos en segundo plano...")
+                return
+            
+            with track_stage(perf_run, 'rfm_from_files', cached=True) as stage:
+                rfm, file_stats = load_rfm_from_files(*files_args)
+                stage['rows'] = file_stats['rows_read']
+            
+            st.sidebar.info(f"Registros leídos: {file_stats['rows_read']:,} "
+                            f"({file_stats['rows_valid']:,} válidos)")
+            st.success(f"✓ RFM calculado para {len(rfm):,} clientes")
+            basket_source = ('files', tuple(paths), file_versions)
+            activity_source = ('files',) + files_args
+        
+        # Clustering (cacheado por tabla RFM y número de segmentos); en vivo lo mantiene la ingesta
+        if data_source != 'live':
+            n_clusters = st.sidebar.slider("Número de segmentos", 2, 8, DEFAULT_N_CLUSTERS)
+            with track_stage(perf_run, 'perform_clustering', rows=len(rfm), cached=True):
+                rfm_id = rfm_key(rfm)
+                with st.spinner("Ejecutando clustering K-Means..."):
+                    rfm['Cluster'], kmeans_model, scaler = get_clustering(rfm_id, rfm, n_clusters)
+                st.success(f"✓ Clustering completado: {n_clusters} segmentos identificados")
         
         # Asignar nombres
-        rfm, segment_names = assign_segment_names(rfm)
+        with track_stage(perf_run, 'assign_segment_names', rows=len(rfm)):
+            rfm, segment_names = assign_segment_names(rfm)
+    
+    # Scores RFM por cuantiles (vectorizados) y cubo de combinaciones
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("🏅 Scores RFM")
+    n_quantiles = st.sidebar.selectbox(
+        "Escala de scores",
+        options=list(QUANTILE_OPTIONS),
+        format_func=lambda q: f"{QUANTILE_OPTIONS[q]} (1-{q})"
+    )
+    score_ties = st.sidebar.selectbox(
+        "Tratamiento de empates",
+        options=TIE_METHODS,
+        help="Cómo se ordenan los clientes con el mismo valor antes de asignar el cuantil"
+    )
+    with track_stage(perf_run, 'score_rfm', rows=len(rfm)):
+        rfm = score_rfm(rfm, n_quantiles=n_quantiles, ties=score_ties)
+        score_cube = build_score_cube(rfm, n_quantiles=n_quantiles)
+    
+    # Perfil de segmentos compartido por todas las vistas y el chatbot
+    with track_stage(perf_run, 'segment_profile', rows=len(rfm), cached=True):
+        segmentation_id = segmentation_key(rfm)
+        profile = get_segment_profile(segmentation_id, rfm)
+    segment_profile = profile['segments']
+    
+    # Filtros de país y periodo servidos por el cubo país × mes × segmento
+    sales_cube = sales_slice = None
+    if activity_source is not None:
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("🌍 País y Periodo")
+        cube_lines = df_clean if data_source == 'upload' else None
+        cube_job = session_job('sales_cube', (segmentation_id, activity_source),
+                               fill_cache_job, get_sales_cube, segmentation_id, activity_source, rfm, cube_lines)
+        if render_job_status('sales_cube', cube_job, "Cubo país × mes × segmento", st.sidebar):
+            with track_stage(perf_run, 'sales_cube', rows=len(rfm), cached=True):
+                sales_cube = get_sales_cube(segmentation_id, activity_source, rfm, cube_lines)
+            cube_months = list(sales_cube['months'])
+            selected_countries = st.sidebar.multiselect(
+                "Países",
+                options=list(sales_cube['countries']),
+                help="Sin selección se incluyen todos los países"
+            )
+            selected_months = (cube_months[0], cube_months[-1]) if cube_months else None
+            if len(cube_months) > 1:
+                selected_months = st.sidebar.select_slider("Periodo", options=cube_months, value=selected_months)
+            with track_stage(perf_run, 'query_sales_cube'):
+                sales_slice = query_sales_cube(sales_cube, selected_countries, selected_months)
+    
+    # Exportación de segmentos en segundo plano (no bloquea el rerun)
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("📤 Exportar Segmentos")
+    export_format = st.sidebar.selectbox(
+        "Formato de exportación",
+        options=list(EXPORT_FORMATS),
+        format_func=lambda fmt: EXPORT_FORMATS[fmt][0]
+    )
+    export_job = st.session_state.get('export_job')
+    export_running = export_job is not None and export_job['status'] == 'running'
+    
+    if st.sidebar.button("Generar exportación", use_container_width=True, disabled=export_running):
+        discard_export(export_job)
+        export_job = st.session_state.export_job = start_export(
+            rfm.copy(deep=False), scaler,
+            model_centers if model_centers is not None else cluster_centers(rfm, scaler, kmeans_model),
+            export_format
+        )
+        export_running = True
+    
+    if export_running:
+        with st.sidebar:
+            render_job_progress('export', "Exportando clientes")
+    elif export_job is not None and export_job['status'] == 'done' and not Path(export_job['path']).exists():
+        # La limpieza por antigüedad de la carpeta de exportaciones ya la borró
+        st.sidebar.caption("La exportación caducó: vuelve a generarla")
+    elif export_job is not None and export_job['status'] == 'done':
+        # El archivo se lee solo al pulsar el botón, no en cada rerun
+        export_path = Path(export_job['path'])
+        st.sidebar.download_button(
+            f"⬇️ Descargar {EXPORT_FORMATS[export_job['format']][0]} ({export_job['total']:,} clientes)",
+            data=export_path.read_bytes,
+            file_name=f"segmentos_clientes.{export_job['format']}",
+            mime=EXPORT_FORMATS[export_job['format']][1],
+            use_container_width=True
+        )
+    elif export_job is not None and export_job['status'] == 'cancelled':
+        st.sidebar.warning("⏹️ Exportación cancelada")
+    elif export_job is not None:
+        st.sidebar.error(f"❌ Error en la exportación: {export_job['error']}")
     
     # ========================================================================
     # CHATBOT EN SIDEBAR
@@ -768,6 +1031,13 @@ def main():
         st.sidebar.warning("⚠️ Instala groq para usar el chatbot")
         st.sidebar.code("pip install groq", language="bash")
     
+    # Panel de rendimiento (se completa al final del rerun)
+    st.sidebar.markdown("---")
+    perf_panel = st.sidebar.expander("⏱️ Rendimiento", expanded=False)
+    # Registros de todas las sesiones: solo con ?admin=<RFM_ADMIN_TOKEN>
+    if is_admin(st.query_params.get('admin')):
+        render_chat_telemetry(st.sidebar.expander("📡 Telemetría del Chatbot", expanded=False))
+    
     # ========================================================================
     # CHAT FLOTANTE - DISEÑO MEJORADO Y RESPONSIVE
     # ========================================================================
@@ -1001,31 +1271,40 @@ def main():
                 
                 # Procesar envío
                 if send_btn and user_question:
+                    submitted_at = time.perf_counter()
                     with st.spinner("🤔 Pensando..."):
                         try:
-                            context = get_chatbot_context(rfm)
+                            with track_stage(perf_run, 'get_chatbot_context',
+                                             rows=profile['total_customers'], cached=True):
+                                context = get_chatbot_context(segmentation_id, n_quantiles, score_ties,
+                                                              profile, score_cube)
                             messages = [
                                 {"role": "system", "content": context},
                                 {"role": "user", "content": user_question}
                             ]
                             
-                            response = st.session_state.groq_client.chat.completions.create(
-                                model=st.session_state.groq_model,
-                                messages=messages,
-                                temperature=0.7,
-                                max_tokens=1024
-                            )
+                            # Respuesta en streaming: se mide el tiempo hasta el primer token
+                            answer_placeholder = chat_container.empty()
+                            with track_stage(perf_run, 'chat_completion', kind='llm'), \
+                                    track_chat(st.session_state.groq_model, messages, submitted_at) as chat_record:
+                                stream = st.session_state.groq_client.chat.completions.create(
+                                    model=st.session_state.groq_model,
+                                    messages=messages,
+                                    temperature=0.7,
+                                    max_tokens=1024,
+                                    stream=True
+                                )
+                                answer = stream_answer(stream, chat_record,
+                                                       on_text=lambda text: answer_placeholder.markdown(text + "▌"))
                             
                             st.session_state.chat_history.append({
                                 'user': user_question,
-                                'assistant': response.choices[0].message.content
+                                'assistant': answer
                             })
-                            
-                            st.success("✓ Respuesta recibida")
                             st.rerun()
                             
                         except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+                            st.error(f"❌ Error ({type(e).__name__}): {e}")
                 
                 elif send_btn and not user_question:
                     st.warning("⚠️ Por favor escribe una pregunta")
@@ -1041,47 +1320,52 @@ def main():
     
     st.markdown("---")
     
+    # Plotly solo se necesita desde aquí: la pantalla de bienvenida no lo importa
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     # Crear pestañas principales
-    tab_overview, tab_eda, tab_rfm, tab_clustering, tab_segments, tab_tree = st.tabs([
+    tab_overview, tab_eda, tab_rfm, tab_clustering, tab_segments, tab_tree, tab_basket = st.tabs([
         "📊 Overview", 
         "🔍 Análisis Exploratorio",
         "📈 Análisis RFM", 
         "🎯 Clustering",
         "👥 Segmentos",
-        "🌳 Árbol de Decisión"
+        "🌳 Árbol de Decisión",
+        "🛒 Análisis de Cesta"
     ])
     
     # ========================================================================
     # TAB 1: OVERVIEW - KPIs y Resumen
     # ========================================================================
-    with tab_overview:
+    with tab_overview, track_stage(perf_run, 'overview', kind='tab'):
         st.subheader("📈 KPIs Principales")
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_customers = len(rfm)
+            total_customers = profile['total_customers']
             st.metric(
                 label="Total de Clientes",
                 value=f"{total_customers:,}"
             )
         
         with col2:
-            n_segments = rfm['Cluster'].nunique()
+            n_segments = len(profile['clusters'])
             st.metric(
                 label="Número de Segmentos",
                 value=n_segments
             )
         
         with col3:
-            total_revenue = rfm['Monetary'].sum()
+            total_revenue = profile['total_revenue']
             st.metric(
                 label="Ingreso Total",
                 value=f"£{total_revenue:,.0f}"
             )
         
         with col4:
-            avg_revenue_per_segment = rfm.groupby('Cluster')['Monetary'].sum().mean()
+            avg_revenue_per_segment = profile['clusters']['Monetary_sum'].mean()
             st.metric(
                 label="Ingreso Promedio por Segmento",
                 value=f"£{avg_revenue_per_segment:,.0f}"
@@ -1096,7 +1380,7 @@ def main():
         
         with col1:
             # Gráfico de barras
-            segment_counts = rfm['Segment'].value_counts().reset_index()
+            segment_counts = segment_profile['Customers'].sort_values(ascending=False).reset_index()
             segment_counts.columns = ['Segmento', 'Clientes']
             
             fig_bar = px.bar(
@@ -1134,7 +1418,7 @@ def main():
         
         with col1:
             # Gasto total por segmento
-            revenue_by_segment = rfm.groupby('Segment')['Monetary'].sum().reset_index()
+            revenue_by_segment = segment_profile['Monetary_sum'].reset_index()
             revenue_by_segment.columns = ['Segmento', 'Ingreso Total']
             revenue_by_segment = revenue_by_segment.sort_values('Ingreso Total', ascending=False)
             
@@ -1153,7 +1437,7 @@ def main():
         
         with col2:
             # Gasto promedio por segmento
-            avg_revenue_by_segment = rfm.groupby('Segment')['Monetary'].mean().reset_index()
+            avg_revenue_by_segment = segment_profile['Monetary_mean'].reset_index()
             avg_revenue_by_segment.columns = ['Segmento', 'Ingreso Promedio']
             avg_revenue_by_segment = avg_revenue_by_segment.sort_values('Ingreso Promedio', ascending=False)
             
@@ -1175,30 +1459,97 @@ def main():
         # Tabla resumen RFM por segmento
         st.subheader("📊 Tabla Resumen RFM por Segmento")
         
-        summary_table = rfm.groupby('Segment').agg({
-            'CustomerID': 'count',
-            'Recency': 'mean',
-            'Frequency': 'mean',
-            'Monetary': ['mean', 'sum']
-        }).round(2)
+        summary_table = segment_profile[['Customers', 'Recency_mean', 'Frequency_mean',
+                                         'Monetary_mean', 'Monetary_median', 'Monetary_sum']].round(2)
         
         summary_table.columns = ['Número de Clientes', 'Recency Promedio (días)', 
                                   'Frequency Promedio (compras)', 'Monetary Promedio (£)', 
-                                  'Monetary Total (£)']
+                                  'Monetary Mediana (£)', 'Monetary Total (£)']
         
         summary_table = summary_table.reset_index()
         summary_table = summary_table.sort_values('Monetary Total (£)', ascending=False)
         
         # Formatear para mejor visualización
         summary_table['Monetary Promedio (£)'] = summary_table['Monetary Promedio (£)'].apply(lambda x: f'£{x:,.2f}')
+        summary_table['Monetary Mediana (£)'] = summary_table['Monetary Mediana (£)'].apply(lambda x: f'£{x:,.2f}')
         summary_table['Monetary Total (£)'] = summary_table['Monetary Total (£)'].apply(lambda x: f'£{x:,.2f}')
         
         st.dataframe(summary_table, use_container_width=True, hide_index=True)
+        
+        st.markdown("---")
+        
+        # Ventas filtradas por país y periodo (consultas sobre el cubo precalculado)
+        st.subheader("🌍 Ventas por País y Periodo")
+        
+        if activity_source is None:
+            st.info("ℹ️ Los filtros de país y periodo necesitan las transacciones (archivo subido, archivos "
+                    "en el servidor o particiones); los datos pre-procesados y el modo en vivo solo guardan el RFM.")
+        elif sales_slice is None:
+            st.info("El cubo país × mes × segmento se está calculando (progreso en la barra lateral).")
+        else:
+            totals = sales_slice['totals']
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Clientes activos", f"{totals['Customers']:,}")
+            with col2:
+                st.metric("Facturas", f"{totals['Invoices']:,}")
+            with col3:
+                st.metric("Ingreso", f"£{totals['Revenue']:,.0f}")
+            with col4:
+                st.metric("Unidades", f"{totals['Quantity']:,}")
+            cube_info = sales_cube_stats(sales_cube)
+            st.caption(f"{len(selected_countries) or len(sales_cube['countries'])} países · "
+                       f"{selected_months[0]} a {selected_months[1]} · cubo de {cube_info['cells']:,} celdas y "
+                       f"{cube_info['active_cells']:,} celdas cliente × país × mes ({cube_info['megabytes']:.2f} MB)"
+                       if selected_months else "Sin transacciones en el cubo")
+            
+            if totals['Customers']:
+                col1, col2 = st.columns([3, 2])
+                with col1:
+                    # Evolución mensual del ingreso por segmento
+                    fig_monthly = px.bar(
+                        sales_slice['months'],
+                        x='Month',
+                        y='Revenue',
+                        color='Segment',
+                        title='Ingreso Mensual por Segmento',
+                        labels={'Month': 'Mes', 'Revenue': 'Ingreso (£)', 'Segment': 'Segmento'},
+                        color_discrete_sequence=px.colors.qualitative.Set2
+                    )
+                    fig_monthly.update_layout(height=400)
+                    st.plotly_chart(fig_monthly, use_container_width=True)
+                
+                with col2:
+                    # Países con más ingreso dentro de la selección
+                    top_countries = sales_slice['countries'].head(10).reset_index()
+                    fig_countries = px.bar(
+                        top_countries,
+                        x='Revenue',
+                        y='Country',
+                        orientation='h',
+                        title='Top 10 Países por Ingreso',
+                        text='Revenue',
+                        labels={'Revenue': 'Ingreso (£)', 'Country': 'País'},
+                        color_discrete_sequence=px.colors.qualitative.Pastel
+                    )
+                    fig_countries.update_traces(texttemplate='£%{text:,.0f}', textposition='outside')
+                    fig_countries.update_layout(height=400, yaxis={'categoryorder': 'total ascending'})
+                    st.plotly_chart(fig_countries, use_container_width=True)
+                
+                segment_sales = sales_slice['segments'].reset_index()
+                segment_sales['Revenue_Share'] = (segment_sales['Revenue'] / totals['Revenue'] * 100).round(1)
+                segment_sales['Revenue'] = segment_sales['Revenue'].round(2)
+                segment_sales.columns = ['Segmento', 'Clientes Activos', 'Facturas', 'Ingreso (£)',
+                                         'Unidades', '% del Ingreso']
+                st.dataframe(segment_sales.sort_values('Ingreso (£)', ascending=False),
+                             use_container_width=True, hide_index=True)
+            else:
+                st.info("No hay ventas para los países y el periodo seleccionados.")
     
     # ========================================================================
     # TAB 2: ANÁLISIS EXPLORATORIO (EDA)
     # ========================================================================
-    with tab_eda:
+    with tab_eda, track_stage(perf_run, 'eda', kind='tab'):
         st.subheader("🔍 Análisis Exploratorio de Datos")
         
         st.markdown("""
@@ -1212,13 +1563,17 @@ def main():
             
             col1, col2 = st.columns(2)
             
+            basket = basket_summary(invoices)
+            
             with col1:
                 st.metric("Total de Transacciones", f"{len(df_clean):,}")
-                st.metric("Clientes Únicos", f"{df_clean['CustomerID'].nunique():,}")
+                st.metric("Clientes Únicos", f"{invoices['CustomerID'].nunique():,}")
+                st.metric("Facturas", f"{basket['invoices']:,}")
             
             with col2:
                 st.metric("Productos Únicos", f"{df_clean['StockCode'].nunique():,}")
-                st.metric("Países", f"{df_clean['Country'].nunique()}")
+                st.metric("Países", f"{invoices['Country'].nunique()}")
+                st.metric("Ticket Promedio", f"£{basket['avg_total']:,.2f}")
             
             st.markdown("---")
             
@@ -1249,10 +1604,37 @@ def main():
                 fig_price.update_layout(height=400)
                 st.plotly_chart(fig_price, use_container_width=True)
             
+            # Tamaño de cesta (desde la tabla de facturas)
+            st.markdown("### 🛒 Tamaño de Cesta por Factura")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                fig_skus = px.histogram(
+                    invoices[invoices['SKUs'] <= invoices['SKUs'].quantile(0.99)],
+                    x='SKUs',
+                    title=f"Productos Distintos por Factura (mediana: {basket['median_skus']:.0f})",
+                    labels={'SKUs': 'Productos distintos', 'count': 'Facturas'}
+                )
+                fig_skus.update_layout(height=400)
+                st.plotly_chart(fig_skus, use_container_width=True)
+            
+            with col2:
+                fig_total = px.histogram(
+                    invoices[invoices['Total'] <= invoices['Total'].quantile(0.99)],
+                    x='Total',
+                    nbins=50,
+                    title='Distribución del Total por Factura (percentil 99)',
+                    labels={'Total': 'Total (£)', 'count': 'Facturas'}
+                )
+                fig_total.update_layout(height=400)
+                st.plotly_chart(fig_total, use_container_width=True)
+            
             # Top países
             st.markdown("### 🌍 Top 10 Países por Transacciones")
             
-            top_countries = df_clean['Country'].value_counts().head(10).reset_index()
+            top_countries = (invoices.groupby('Country', observed=True)['Lines'].sum()
+                             .nlargest(10).reset_index())
             top_countries.columns = ['País', 'Transacciones']
             
             fig_countries = px.bar(
@@ -1272,7 +1654,7 @@ def main():
     # ========================================================================
     # TAB 3: ANÁLISIS RFM
     # ========================================================================
-    with tab_rfm:
+    with tab_rfm, track_stage(perf_run, 'rfm', kind='tab'):
         st.subheader("📈 Análisis RFM (Recency, Frequency, Monetary)")
         
         st.markdown("""
@@ -1357,11 +1739,80 @@ def main():
         )
         fig_corr.update_layout(height=400)
         st.plotly_chart(fig_corr, use_container_width=True)
+        
+        st.markdown("---")
+        
+        # Scores RFM por cuantiles
+        st.markdown(f"### 🏅 Scores RFM ({QUANTILE_OPTIONS[n_quantiles]})")
+        
+        st.markdown(f"""
+        Cada cliente recibe un score de 1 a {n_quantiles} por métrica ({n_quantiles} = mejor).
+        Los conteos se leen de un cubo precalculado con todas las combinaciones R x F x M.
+        """)
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            r_range = st.slider("R_Score", 1, n_quantiles, (1, n_quantiles), key="r_score_range")
+        
+        with col2:
+            f_range = st.slider("F_Score", 1, n_quantiles, (1, n_quantiles), key="f_score_range")
+        
+        with col3:
+            m_range = st.slider("M_Score", 1, n_quantiles, (1, n_quantiles), key="m_score_range")
+        
+        selected_customers, selected_revenue = query_score_cube(score_cube, r_range, f_range, m_range)
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("Clientes Seleccionados", f"{selected_customers:,}")
+        
+        with col2:
+            st.metric("Ingreso Seleccionado", f"£{selected_revenue:,.0f}")
+        
+        with col3:
+            revenue_share = selected_revenue / profile['total_revenue'] * 100 if profile['total_revenue'] else 0
+            st.metric("% del Ingreso Total", f"{revenue_share:.1f}%")
+        
+        col1, col2 = st.columns([1, 1])
+        
+        with col1:
+            # Clientes por combinación R x F (sumando M dentro del rango elegido)
+            m_slice = slice(m_range[0] - 1, m_range[1])
+            rf_counts = score_cube['counts'][:, :, m_slice].sum(axis=2)
+            score_labels = [str(i) for i in range(1, n_quantiles + 1)]
+            
+            fig_scores = px.imshow(
+                rf_counts,
+                x=score_labels,
+                y=score_labels,
+                labels=dict(x="F_Score", y="R_Score", color="Clientes"),
+                text_auto=True,
+                aspect="auto",
+                title='Clientes por R_Score x F_Score',
+                color_continuous_scale='Blues'
+            )
+            fig_scores.update_yaxes(autorange='reversed')
+            fig_scores.update_layout(height=400)
+            st.plotly_chart(fig_scores, use_container_width=True)
+        
+        with col2:
+            # Clientes del filtro (solo una muestra para no serializar millones de filas)
+            selected = rfm.loc[score_mask(rfm, r_range, f_range, m_range),
+                               ['CustomerID', 'RFM_Score', 'Recency', 'Frequency', 'Monetary', 'Segment']]
+            st.markdown(f"**Clientes en el filtro** (mostrando hasta 500 de {len(selected):,})")
+            st.dataframe(
+                selected.nlargest(500, 'Monetary'),
+                use_container_width=True,
+                hide_index=True,
+                height=360
+            )
     
     # ========================================================================
     # TAB 4: CLUSTERING
     # ========================================================================
-    with tab_clustering:
+    with tab_clustering, track_stage(perf_run, 'clustering', kind='tab'):
         st.subheader("🎯 Análisis de Clustering K-Means")
         
         st.markdown("""
@@ -1371,78 +1822,230 @@ def main():
         
         st.markdown("---")
         
-        # Evaluar clustering
-        if not use_preprocessed:
-            scaler = StandardScaler()
-            rfm_scaled = scaler.fit_transform(rfm[['Recency', 'Frequency', 'Monetary']])
+        # Evaluar clustering: el snapshot pre-procesado trae el barrido de K ya calculado
+        stored_sweep = k_sweep_results(snapshot_metadata)
+        if stored_sweep is not None:
+            K_range, inertias, silhouette_scores_list = stored_sweep
         else:
-            # Si usamos datos preprocesados, crear el scaler
-            scaler = StandardScaler()
-            rfm_scaled = scaler.fit_transform(rfm[['Recency', 'Frequency', 'Monetary']])
-        
-        K_range, inertias, silhouette_scores_list = evaluate_clustering(rfm_scaled, max_k=10)
-        
-        st.markdown("### 📊 Evaluación del Número Óptimo de Clusters")
+            # Barrido de K en segundo plano: el resto de pestañas sigue disponible
+            K_range = None
+            sweep_job = session_job('k_sweep', (rfm_id,), k_sweep_job, rfm_id, rfm)
+            if render_job_status('k_sweep', sweep_job, "Barrido de K"):
+                with track_stage(perf_run, 'evaluate_clustering', rows=len(rfm), cached=True):
+                    K_range, inertias, silhouette_scores_list = get_k_sweep(rfm_id, rfm, max_k=10)
+        
+        if K_range is not None:
+            st.markdown("### 📊 Evaluación del Número Óptimo de Clusters")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                # Método del codo
+                fig_elbow = go.Figure()
+                fig_elbow.add_trace(go.Scatter(
+                    x=list(K_range),
+                    y=inertias,
+                    mode='lines+markers',
+                    marker=dict(size=10, color='#FF6B6B'),
+                    line=dict(width=3)
+                ))
+                fig_elbow.update_layout(
+                    title='Método del Codo',
+                    xaxis_title='Número de Clusters (K)',
+                    yaxis_title='Inercia',
+                    height=400
+                )
+                st.plotly_chart(fig_elbow, use_container_width=True)
+                st.caption("Buscar el 'codo' donde la inercia deja de disminuir significativamente")
+            
+            with col2:
+                # Silhouette Score
+                fig_silh = go.Figure()
+                fig_silh.add_trace(go.Scatter(
+                    x=list(K_range),
+                    y=silhouette_scores_list,
+                    mode='lines+markers',
+                    marker=dict(size=10, color='#4ECDC4'),
+                    line=dict(width=3)
+                ))
+                fig_silh.update_layout(
+                    title='Silhouette Score por K',
+                    xaxis_title='Número de Clusters (K)',
+                    yaxis_title='Silhouette Score',
+                    height=400
+                )
+                st.plotly_chart(fig_silh, use_container_width=True)
+                st.caption("Valores más altos indican mejor separación entre clusters")
+            
+        # Estabilidad de la segmentación actual (reajustes en paralelo, bajo demanda)
+        st.markdown("### 🔬 Estabilidad de los Clusters")
         
-        col1, col2 = st.columns(2)
+        col1, col2 = st.columns([1, 2])
         
         with col1:
-            # Método del codo
-            fig_elbow = go.Figure()
-            fig_elbow.add_trace(go.Scatter(
-                x=list(K_range),
-                y=inertias,
-                mode='lines+markers',
-                marker=dict(size=10, color='#FF6B6B'),
-                line=dict(width=3)
-            ))
-            fig_elbow.update_layout(
-                title='Método del Codo',
-                xaxis_title='Número de Clusters (K)',
-                yaxis_title='Inercia',
-                height=400
+            run_stability = st.checkbox(
+                "Analizar estabilidad",
+                value=False,
+                help=f"Reajusta K-Means {DEFAULT_SEED_REFITS} veces con otras semillas y sobre remuestreos "
+                     "bootstrap (en paralelo) y compara cada resultado con los segmentos actuales"
             )
-            st.plotly_chart(fig_elbow, use_container_width=True)
-            st.caption("Buscar el 'codo' donde la inercia deja de disminuir significativamente")
+            n_bootstrap = st.select_slider("Remuestreos bootstrap", options=[10, 20, 50, 100], value=20,
+                                           disabled=not run_stability)
         
-        with col2:
-            # Silhouette Score
-            fig_silh = go.Figure()
-            fig_silh.add_trace(go.Scatter(
-                x=list(K_range),
-                y=silhouette_scores_list,
-                mode='lines+markers',
-                marker=dict(size=10, color='#4ECDC4'),
-                line=dict(width=3)
-            ))
-            fig_silh.update_layout(
-                title='Silhouette Score por K',
-                xaxis_title='Número de Clusters (K)',
-                yaxis_title='Silhouette Score',
-                height=400
-            )
-            st.plotly_chart(fig_silh, use_container_width=True)
-            st.caption("Valores más altos indican mejor separación entre clusters")
+        stability = None
+        if run_stability:
+            stability_job = session_job('cluster_stability', (segmentation_id, n_bootstrap),
+                                        cluster_stability_job, segmentation_id, rfm, n_bootstrap)
+            with col2:
+                stability_done = render_job_status('cluster_stability', stability_job,
+                                                   "Reajustando K-Means en paralelo")
+            if stability_done:
+                with track_stage(perf_run, 'cluster_stability', rows=len(rfm), cached=True):
+                    stability = get_cluster_stability(segmentation_id, rfm, n_bootstrap)
+        else:
+            discard_session_job('cluster_stability')
+        
+        if stability is not None:
+            with col1:
+                st.metric("ARI entre semillas", f"{stability['overall']['seeds']['ari_mean']:.3f}",
+                          help="1 = la misma partición con cualquier semilla")
+                st.metric("ARI bootstrap", f"{stability['overall']['bootstrap']['ari_mean']:.3f}",
+                          help=f"Mínimo: {stability['overall']['bootstrap']['ari_min']:.3f}")
+                st.metric("Jaccard medio", f"{stability['overall']['jaccard_mean']:.3f}")
+                st.caption(f"{len(stability['replicates'])} reajustes sobre {stability['sample_rows']:,} clientes "
+                           f"por réplica · {stability['workers']} procesos · {stability['seconds']:.1f}s")
+            
+            with col2:
+                stability_clusters = stability['clusters'].join(profile['clusters'][['Segment']]).reset_index()
+                stability_clusters['Cluster'] = (stability_clusters['Cluster'].astype(str) + ' · '
+                                                 + stability_clusters['Segment'].astype(str))
+                stability_clusters['Estado'] = np.select(
+                    [stability_clusters['Jaccard_mean'] >= STABLE_JACCARD,
+                     stability_clusters['Jaccard_mean'] < DISSOLVED_JACCARD],
+                    ['Estable', 'Se disuelve'], default='Dudoso'
+                )
+                fig_stability = px.bar(
+                    stability_clusters,
+                    x='Cluster',
+                    y='Jaccard_mean',
+                    color='Estado',
+                    title='Jaccard medio por cluster',
+                    labels={'Jaccard_mean': 'Jaccard medio'},
+                    hover_data={'Jaccard_min': ':.3f', 'Dissolved_share': ':.0%'},
+                    color_discrete_map={'Estable': '#4ECDC4', 'Dudoso': '#FFD166', 'Se disuelve': '#FF6B6B'},
+                    range_y=[0, 1]
+                )
+                fig_stability.add_hline(y=STABLE_JACCARD, line_dash='dash', line_color='gray')
+                fig_stability.add_hline(y=DISSOLVED_JACCARD, line_dash='dot', line_color='gray')
+                fig_stability.update_layout(height=400)
+                st.plotly_chart(fig_stability, use_container_width=True)
+                st.caption(f"Jaccard ≥ {STABLE_JACCARD}: cluster estable · < {DISSOLVED_JACCARD}: "
+                           "el cluster se disuelve al cambiar la muestra o la semilla")
         
         st.markdown("---")
         
-        # Tabla de resultados
-        st.markdown("### 📋 Tabla de Evaluación")
+        # Segmentación independiente por país (procesos en paralelo, bajo demanda)
+        st.markdown("### 🌍 Segmentación por Mercado")
+        
+        if basket_source is None:
+            st.info("ℹ️ La segmentación por mercado necesita las transacciones con su país (archivo subido o "
+                    "archivos en el servidor).")
+        else:
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                run_markets = st.checkbox(
+                    "Segmentar cada país por separado",
+                    value=False,
+                    help=f"Limpieza, RFM y K-Means ({n_clusters} segmentos) independientes para cada país, en "
+                         f"procesos paralelos; los países con pocos clientes se agrupan en '{OTHER_MARKETS}'"
+                )
+                min_market_customers = st.select_slider("Clientes mínimos por país", options=[20, 50, 100, 200],
+                                                        value=DEFAULT_MIN_CUSTOMERS, disabled=not run_markets)
+            
+            markets = None
+            if run_markets:
+                market_lines = df if data_source == 'upload' else None
+                market_args = (basket_source, n_clusters, min_market_customers)
+                markets_job = session_job('markets', market_args,
+                                          market_segmentation_job, *market_args, market_lines)
+                with col2:
+                    markets_done = render_job_status('markets', markets_job, "Segmentando mercados en paralelo")
+                if markets_done:
+                    with track_stage(perf_run, 'segment_markets', kind='section', rows=len(rfm), cached=True):
+                        markets = get_market_segmentation(*market_args, market_lines)
+            else:
+                discard_session_job('markets')
+            
+            if markets is not None:
+                market_mix, market_centers = compare_markets(markets['markets'])
+                with col1:
+                    st.metric("Mercados segmentados", len(markets['markets']))
+                    st.metric("Tiempo total", f"{markets['seconds']:.2f}s",
+                              help="Incluye la codificación de las transacciones y el reparto a los procesos")
+                    st.caption(f"Mercado más grande: {markets['largest_seconds']:.2f}s · "
+                               f"{markets['workers']} procesos")
+                
+                with col2:
+                    # Peso de cada segmento dentro de cada mercado
+                    mix_long = (market_mix.reset_index()
+                                .melt(id_vars='Market', var_name='Segment', value_name='Share'))
+                    fig_mix = px.bar(
+                        mix_long,
+                        x='Share',
+                        y='Market',
+                        color='Segment',
+                        orientation='h',
+                        title='Mezcla de Segmentos por Mercado',
+                        labels={'Share': 'Proporción de clientes', 'Market': 'Mercado', 'Segment': 'Segmento'},
+                        category_orders={'Market': list(market_mix.index)},
+                        color_discrete_sequence=px.colors.qualitative.Set2
+                    )
+                    fig_mix.update_layout(height=max(300, 40 * len(market_mix)), xaxis_tickformat='.0%')
+                    st.plotly_chart(fig_mix, use_container_width=True)
+                
+                # Centroides de todos los mercados en el mismo espacio RFM
+                fig_centers = px.scatter(
+                    market_centers,
+                    x='Recency',
+                    y='Monetary',
+                    size='Customers',
+                    color='Market',
+                    symbol='Segment',
+                    hover_data={'Frequency': ':.1f', 'Share': ':.0%', 'Cluster': True},
+                    log_y=True,
+                    title='Centroides por Mercado (medias RFM de cada cluster)',
+                    labels={'Recency': 'Recency media (días)', 'Monetary': 'Monetary medio (£)',
+                            'Market': 'Mercado', 'Segment': 'Segmento'}
+                )
+                fig_centers.update_layout(height=500)
+                st.plotly_chart(fig_centers, use_container_width=True)
+                
+                centers_table = market_centers.round({'Recency': 1, 'Frequency': 1, 'Monetary': 2})
+                centers_table['Share'] = (centers_table['Share'] * 100).round(1)
+                centers_table.columns = ['Mercado', 'Cluster', 'Segmento', 'Clientes', '% del Mercado',
+                                         'Recency Media', 'Frequency Media', 'Monetary Medio (£)']
+                st.dataframe(centers_table, use_container_width=True, hide_index=True)
         
-        eval_df = pd.DataFrame({
-            'K': list(K_range),
-            'Inercia': [f"{x:.2f}" for x in inertias],
-            'Silhouette Score': [f"{x:.3f}" for x in silhouette_scores_list]
-        })
+        st.markdown("---")
         
-        st.dataframe(eval_df, use_container_width=True, hide_index=True)
+        # Tabla de resultados
+        if K_range is not None:
+            st.markdown("### 📋 Tabla de Evaluación")
+            
+            eval_df = pd.DataFrame({
+                'K': list(K_range),
+                'Inercia': [f"{x:.2f}" for x in inertias],
+                'Silhouette Score': [f"{x:.3f}" for x in silhouette_scores_list]
+            })
+            
+            st.dataframe(eval_df, use_container_width=True, hide_index=True)
         
-        st.info(f"✓ **Número óptimo seleccionado**: K = {rfm['Cluster'].nunique()} segmentos")
+        st.info(f"✓ **Número óptimo seleccionado**: K = {len(profile['clusters'])} segmentos")
     
     # ========================================================================
     # TAB 5: SEGMENTOS - Visualización en Espacio RFM
     # ========================================================================
-    with tab_segments:
+    with tab_segments, track_stage(perf_run, 'segments', kind='tab'):
         st.subheader("👥 Visualización de Segmentos en Espacio RFM")
         
         st.markdown("""
@@ -1501,16 +2104,222 @@ def main():
         # Características por segmento
         st.markdown("### 📊 Características Promedio por Segmento")
         
-        cluster_summary = rfm.groupby('Segment')[['Recency', 'Frequency', 'Monetary']].mean().round(2)
-        cluster_summary['Clientes'] = rfm.groupby('Segment').size()
-        cluster_summary = cluster_summary.reset_index()
+        cluster_summary = segment_profile[['Recency_mean', 'Frequency_mean', 'Monetary_mean']].round(2)
+        cluster_summary.columns = ['Recency', 'Frequency', 'Monetary']
+        cluster_summary['Clientes'] = segment_profile['Customers']
+        cluster_summary = cluster_summary.rename_axis('Segment').reset_index()
         
         st.dataframe(cluster_summary, use_container_width=True, hide_index=True)
+        
+        # Búsqueda de un cliente y clientes similares
+        st.markdown("---")
+        st.markdown("### 🔎 Buscar Cliente")
+        
+        with track_stage(perf_run, 'customer_index', kind='section', rows=len(rfm), cached=True):
+            customer_index = get_customer_index(segmentation_id, rfm, scaler)
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            customer_query = st.text_input("CustomerID", placeholder="Ej: 12347")
+        with col2:
+            n_neighbours = st.number_input("Clientes similares", min_value=1, max_value=50, value=10)
+        
+        if customer_query:
+            customer_id = parse_customer_id(customer_query)
+            customer = lookup_customer(customer_index, customer_id) if customer_id is not None else None
+            
+            if customer is None:
+                st.warning(f"No se encontró el cliente {customer_query}")
+            else:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Segmento", customer['Segment'])
+                with col2:
+                    st.metric("Recency", f"{customer['Recency']:.0f} días",
+                              f"percentil {customer['percentiles']['Recency']:.0f}", delta_color="off")
+                with col3:
+                    st.metric("Frequency", f"{customer['Frequency']:.0f} compras",
+                              f"percentil {customer['percentiles']['Frequency']:.0f}", delta_color="off")
+                with col4:
+                    st.metric("Monetary", f"£{customer['Monetary']:,.2f}",
+                              f"percentil {customer['percentiles']['Monetary']:.0f}", delta_color="off")
+                
+                st.caption("Percentil: % de clientes con un valor igual o peor (en Recency, menos reciente)")
+                st.markdown(f"**{int(n_neighbours)} clientes más parecidos** (distancia en RFM normalizado)")
+                st.dataframe(nearest_customers(customer_index, customer_id, k=int(n_neighbours)),
+                             use_container_width=True, hide_index=True)
+        
+        # Migración entre segmentos (requiere la tabla de facturas del archivo cargado)
+        st.markdown("---")
+        st.markdown("### 🔄 Migración entre Segmentos (cierres mensuales)")
+        
+        if 'invoices' in locals():
+            cluster_segments = rfm.groupby('Cluster')['Segment'].first().to_dict()
+            with track_stage(perf_run, 'rfm_snapshots', kind='section', rows=len(invoices), cached=True):
+                snapshots = get_rfm_snapshots(dataset_id, segmentation_id, invoices, scaler, kmeans_model,
+                                              cluster_segments)
+            
+            snapshot_labels = list(snapshots['Snapshot'].cat.categories)
+            if len(snapshot_labels) < 2:
+                st.info("Se necesitan al menos dos meses de datos para ver migraciones.")
+            else:
+                st.markdown("""
+                Cada cierre de mes recalcula el RFM con las compras hasta esa fecha y lo clasifica
+                con el **mismo modelo** de la segmentación actual.
+                """)
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    from_snapshot = st.selectbox("Mes de origen", snapshot_labels, index=len(snapshot_labels) - 2)
+                with col2:
+                    to_snapshot = st.selectbox("Mes de destino", snapshot_labels, index=len(snapshot_labels) - 1)
+                
+                matrix = migration_matrix(snapshots, from_snapshot, to_snapshot,
+                                          segment_order=profile['segment_names_ordered'])
+                fig_migration = px.imshow(
+                    matrix,
+                    text_auto=True,
+                    color_continuous_scale='Blues',
+                    title=f'Clientes por Segmento: {from_snapshot} → {to_snapshot}',
+                    labels={'x': f'Segmento en {to_snapshot}', 'y': f'Segmento en {from_snapshot}',
+                            'color': 'Clientes'}
+                )
+                fig_migration.update_layout(height=450)
+                st.plotly_chart(fig_migration, use_container_width=True)
+                
+                stayed = sum(matrix.loc[segment, segment] for segment in matrix.index if segment in matrix.columns)
+                moved = int(matrix.to_numpy().sum() - stayed)
+                st.caption(f"Clientes que cambiaron de segmento o aparecieron como nuevos: {moved:,}")
+                
+                # Evolución del tamaño de cada segmento
+                sizes = segment_sizes(snapshots).reset_index().melt(
+                    id_vars='Snapshot', var_name='Segment', value_name='Clientes'
+                )
+                fig_sizes = px.area(
+                    sizes,
+                    x='Snapshot',
+                    y='Clientes',
+                    color='Segment',
+                    title='Clientes por Segmento en Cada Cierre de Mes',
+                    labels={'Snapshot': 'Mes'},
+                    color_discrete_sequence=px.colors.qualitative.Bold
+                )
+                fig_sizes.update_layout(height=400)
+                st.plotly_chart(fig_sizes, use_container_width=True)
+                
+                # Trayectoria de un cliente
+                trajectory_id = st.selectbox(
+                    "Trayectoria del cliente",
+                    options=rfm.sort_values('Monetary', ascending=False)['CustomerID'].head(500).tolist(),
+                    format_func=lambda cid: f"{cid:.0f}",
+                    help="500 clientes con mayor gasto"
+                )
+                st.dataframe(customer_trajectory(snapshots, trajectory_id), use_container_width=True,
+                             hide_index=True)
+        else:
+            st.info("⚠️ La migración mensual requiere cargar el archivo de transacciones original.")
+        
+        # Valor futuro por segmento (modelo probabilístico sobre la tabla RFM con antigüedad)
+        st.markdown("---")
+        st.markdown("### 💰 Valor de Vida del Cliente (CLV)")
+        
+        if 'Tenure' not in rfm:
+            st.info("ℹ️ El CLV necesita la antigüedad de cada cliente (Tenure): disponible al calcular el RFM "
+                    "desde transacciones, no en el snapshot pre-procesado")
+        else:
+            st.markdown("""
+            Valor **futuro** esperado de cada cliente, no su gasto pasado: el modelo BG/NBD estima la
+            probabilidad de que siga activo y cuántas compras hará, y el Gamma-Gamma cuánto gastará en
+            cada una. El CLV suma ese gasto mes a mes con un descuento del 1% mensual.
+            """)
+            
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                clv_horizon = st.select_slider("Horizonte (meses)", options=[3, 6, 12, 24, 36],
+                                               value=DEFAULT_HORIZON_MONTHS)
+            clv_job = session_job('clv', (segmentation_id, clv_horizon),
+                                  fill_cache_job, get_clv, segmentation_id, rfm, clv_horizon)
+            with col2:
+                clv_done = render_job_status('clv', clv_job, "Ajustando BG/NBD + Gamma-Gamma")
+            
+            if clv_done:
+                with track_stage(perf_run, 'predict_clv', kind='section', rows=len(rfm), cached=True):
+                    clv = get_clv(segmentation_id, rfm, clv_horizon)
+                clv_segments = clv_by_segment(rfm, clv['customers'])
+                
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric(f"CLV total ({clv_horizon} meses)", f"£{clv_segments['CLV_Total'].sum():,.0f}")
+                with col2:
+                    st.metric("CLV medio por cliente", f"£{clv['customers']['CLV'].mean():,.0f}")
+                with col3:
+                    st.metric("Probabilidad media de actividad", f"{clv['customers']['P_Alive'].mean():.1%}")
+                with col4:
+                    st.metric("Segmento más valioso", clv_segments.index[0])
+                st.caption(f"{len(rfm):,} clientes ({clv['unique_rows']:,} combinaciones únicas) · "
+                           f"ajuste {clv['fit_seconds']:.2f}s · total {clv['seconds']:.2f}s")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    # Peso de cada segmento en el valor futuro frente al gasto histórico
+                    clv_shares = clv_segments[['CLV_Share', 'Monetary_Share']].rename(
+                        columns={'CLV_Share': 'CLV futuro', 'Monetary_Share': 'Gasto histórico'}
+                    ).reset_index().melt(id_vars='Segment', var_name='Medida', value_name='Participación')
+                    fig_clv = px.bar(
+                        clv_shares,
+                        x='Segment',
+                        y='Participación',
+                        color='Medida',
+                        barmode='group',
+                        title='Participación en el Valor: Futuro vs Histórico',
+                        color_discrete_sequence=['#2ca02c', '#7f7f7f']
+                    )
+                    fig_clv.update_layout(height=400, yaxis_tickformat='.0%')
+                    st.plotly_chart(fig_clv, use_container_width=True)
+                with col2:
+                    fig_alive = px.box(
+                        rfm[['CustomerID', 'Segment']].merge(clv['customers'][['CustomerID', 'P_Alive']],
+                                                             on='CustomerID'),
+                        x='Segment',
+                        y='P_Alive',
+                        color='Segment',
+                        title='Probabilidad de Seguir Activo por Segmento',
+                        labels={'P_Alive': 'P(activo)'}
+                    )
+                    fig_alive.update_layout(height=400, showlegend=False)
+                    st.plotly_chart(fig_alive, use_container_width=True)
+                
+                clv_table = clv_segments.reset_index()[
+                    ['Segment', 'Customers', 'CLV_Total', 'CLV_Mean', 'CLV_Median', 'P_Alive_Mean',
+                     'Expected_Purchases_Mean']
+                ].rename(columns={
+                    'Segment': 'Segmento', 'Customers': 'Clientes', 'CLV_Total': 'CLV Total (£)',
+                    'CLV_Mean': 'CLV Medio (£)', 'CLV_Median': 'CLV Mediano (£)', 'P_Alive_Mean': 'P(activo) Media',
+                    'Expected_Purchases_Mean': 'Compras Esperadas'
+                }).round(2)
+                st.dataframe(clv_table, use_container_width=True, hide_index=True)
+                
+                with st.expander("Parámetros del modelo"):
+                    bgnbd, gamma_gamma = clv['bgnbd'], clv['gamma_gamma']
+                    st.markdown(f"""
+                    - **BG/NBD** (semanas): r = {bgnbd['r']:.3f}, alpha = {bgnbd['alpha']:.3f},
+                      a = {bgnbd['a']:.4f}, b = {bgnbd['b']:.4f}
+                    - **Gamma-Gamma** ({gamma_gamma['customers']:,} clientes con compras repetidas):
+                      p = {gamma_gamma['p']:.3f}, q = {gamma_gamma['q']:.3f}, v = {gamma_gamma['v']:.2f};
+                      gasto medio poblacional £{gamma_gamma['mean_spend']:,.2f} (clientes de una sola compra)
+                    """)
+                    if not (bgnbd['converged'] and gamma_gamma['converged']):
+                        st.warning("⚠️ El optimizador no convergió del todo: interpreta el CLV con cautela")
+                    if gamma_gamma['mean_fallback']:
+                        st.warning("⚠️ El gasto tiene colas demasiado pesadas para la media del modelo (q ≈ 1): "
+                                   "los clientes de una sola compra reciben el gasto medio observado")
     
     # ========================================================================
     # TAB 6: ÁRBOL DE DECISIÓN EXPLICATIVO
     # ========================================================================
-    with tab_tree:
+    with tab_tree, track_stage(perf_run, 'tree', kind='tab'):
+        from sklearn.metrics import confusion_matrix, classification_report, accuracy_score
+        
         st.subheader("🌳 Árbol de Decisión Explicativo")
         
         st.markdown("""
@@ -1535,7 +2344,7 @@ def main():
                 "Profundidad Máxima",
                 min_value=2,
                 max_value=8,
-                value=4,
+                value=TREE_DEFAULTS['max_depth'],
                 help="Mayor profundidad = más reglas detalladas pero menos interpretable"
             )
         
@@ -1544,7 +2353,7 @@ def main():
                 "Mín. Muestras para Dividir",
                 min_value=50,
                 max_value=200,
-                value=100,
+                value=TREE_DEFAULTS['min_samples_split'],
                 step=10,
                 help="Número mínimo de clientes para crear una nueva regla"
             )
@@ -1554,378 +2363,458 @@ def main():
                 "Mín. Muestras por Hoja",
                 min_value=20,
                 max_value=100,
-                value=50,
+                value=TREE_DEFAULTS['min_samples_leaf'],
                 step=5,
                 help="Número mínimo de clientes en cada segmento final"
             )
         
         st.markdown("---")
         
-        # Entrenar árbol con parámetros configurables
-        tree_model, X, y, y_pred = train_decision_tree(
-            rfm, 
-            max_depth=max_depth,
-            min_samples_split=min_samples_split,
-            min_samples_leaf=min_samples_leaf
-        )
-        
-        # Información del árbol
-        st.markdown("### 📊 Métricas del Modelo")
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("Profundidad", tree_model.get_depth())
-        
-        with col2:
-            st.metric("Número de Hojas", tree_model.get_n_leaves())
-        
-        with col3:
-            accuracy = accuracy_score(y, y_pred)
-            st.metric("Accuracy", f"{accuracy:.1%}")
-        
-        with col4:
-            correct_predictions = (y == y_pred).sum()
-            st.metric("Predicciones Correctas", f"{correct_predictions:,}")
-        
-        st.markdown("---")
-        
-        # Matriz de Confusión
-        st.markdown("### 🎯 Matriz de Confusión")
-        
-        st.markdown("""
-        La matriz de confusión muestra qué tan bien el árbol clasifica a los clientes en cada segmento.
-        - **Diagonal**: Predicciones correctas
-        - **Fuera de diagonal**: Confusiones entre segmentos
-        """)
-        
-        # Calcular matriz de confusión
-        cm = confusion_matrix(y, y_pred)
-        
-        # Obtener nombres de segmentos ordenados
-        segment_names_ordered = [rfm[rfm['Cluster'] == i]['Segment'].iloc[0] 
-                                 for i in sorted(rfm['Cluster'].unique())]
-        
-        # Crear figura interactiva con plotly
-        fig_cm = px.imshow(
-            cm,
-            labels=dict(x="Predicción", y="Real", color="Clientes"),
-            x=segment_names_ordered,
-            y=segment_names_ordered,
-            color_continuous_scale='Blues',
-            text_auto=True,
-            aspect="auto"
-        )
-        
-        fig_cm.update_layout(
-            title='Matriz de Confusión - Clasificación de Segmentos',
-            xaxis_title='Segmento Predicho',
-            yaxis_title='Segmento Real',
-            height=500
-        )
-        
-        fig_cm.update_traces(
-            texttemplate='%{text}',
-            textfont_size=14
-        )
-        
-        st.plotly_chart(fig_cm, use_container_width=True)
-        
-        # Métricas detalladas por segmento
-        st.markdown("### 📋 Reporte de Clasificación por Segmento")
-        
-        # Crear reporte de clasificación
-        report = classification_report(y, y_pred, target_names=segment_names_ordered, output_dict=True)
-        report_df = pd.DataFrame(report).transpose()
-        
-        # Filtrar solo las filas de segmentos (sin accuracy, macro avg, weighted avg)
-        segment_report = report_df.loc[segment_names_ordered].copy()
-        segment_report = segment_report.round(3)
-        
-        # Renombrar columnas
-        segment_report.columns = ['Precisión', 'Recall', 'F1-Score', 'Clientes']
-        segment_report['Clientes'] = segment_report['Clientes'].astype(int)
-        segment_report['Precisión'] = segment_report['Precisión'].apply(lambda x: f"{x:.1%}")
-        segment_report['Recall'] = segment_report['Recall'].apply(lambda x: f"{x:.1%}")
-        segment_report['F1-Score'] = segment_report['F1-Score'].apply(lambda x: f"{x:.3f}")
-        
-        segment_report = segment_report.reset_index()
-        segment_report.columns = ['Segmento', 'Precisión', 'Recall', 'F1-Score', 'Clientes']
-        
-        st.dataframe(segment_report, use_container_width=True, hide_index=True)
-        
-        # Explicación de métricas
-        with st.expander("ℹ️ ¿Qué significan estas métricas?"):
-            st.markdown("""
-            **Precisión**: De todos los clientes clasificados en un segmento, ¿cuántos realmente pertenecen a ese segmento?
-            - Ejemplo: Si la precisión de "Champions" es 95%, significa que de todos los clientes que el modelo clasificó como Champions, el 95% realmente son Champions.
+        # Entrenar árbol con parámetros configurables (en segundo plano)
+        tree_params = (segmentation_id, max_depth, min_samples_split, min_samples_leaf)
+        tree_job = session_job('decision_tree', tree_params,
+                               decision_tree_job, segmentation_id, rfm, max_depth,
+                               min_samples_split, min_samples_leaf)
+        if render_job_status('decision_tree', tree_job, "Entrenando árbol de decisión"):
+            with track_stage(perf_run, 'train_decision_tree', rows=len(rfm), cached=True):
+                tree_model, y_pred = get_decision_tree(segmentation_id, rfm, max_depth,
+                                                       min_samples_split, min_samples_leaf)
+            y = rfm['Cluster']
+            
+            # Información del árbol
+            st.markdown("### 📊 Métricas del Modelo")
+            
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("Profundidad", tree_model.get_depth())
+            
+            with col2:
+                st.metric("Número de Hojas", tree_model.get_n_leaves())
             
-            **Recall (Sensibilidad)**: De todos los clientes que pertenecen a un segmento, ¿cuántos fueron correctamente identificados?
-            - Ejemplo: Si el recall de "At Risk" es 85%, significa que el modelo identificó correctamente al 85% de todos los clientes que realmente están en riesgo.
+            with col3:
+                accuracy = accuracy_score(y, y_pred)
+                st.metric("Accuracy", f"{accuracy:.1%}")
             
-            **F1-Score**: Promedio armónico de Precisión y Recall. Un balance entre ambas métricas.
-            - Valores cercanos a 1.0 indican un modelo muy bueno para ese segmento.
+            with col4:
+                correct_predictions = (y == y_pred).sum()
+                st.metric("Predicciones Correctas", f"{correct_predictions:,}")
+            
+            st.markdown("---")
+            
+            # Matriz de Confusión
+            st.markdown("### 🎯 Matriz de Confusión")
+            
+            st.markdown("""
+            La matriz de confusión muestra qué tan bien el árbol clasifica a los clientes en cada segmento.
+            - **Diagonal**: Predicciones correctas
+            - **Fuera de diagonal**: Confusiones entre segmentos
             """)
-        
-        st.markdown("---")
-        
-        # Importancia de variables
-        st.markdown("### 📊 Importancia de Variables")
-        
-        feature_importance = pd.DataFrame({
-            'Variable': ['Recency', 'Frequency', 'Monetary'],
-            'Importancia': tree_model.feature_importances_,
-            'Porcentaje': (tree_model.feature_importances_ * 100).round(1)
-        }).sort_values('Importancia', ascending=False)
-        
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            fig_importance = px.bar(
-                feature_importance,
-                x='Variable',
-                y='Importancia',
-                title='Importancia de Cada Variable en la Segmentación',
-                color='Importancia',
-                color_continuous_scale='Viridis',
-                text='Porcentaje'
+            
+            # Calcular matriz de confusión
+            cm = confusion_matrix(y, y_pred)
+            
+            # Obtener nombres de segmentos ordenados
+            segment_names_ordered = profile['segment_names_ordered']
+            
+            # Crear figura interactiva con plotly
+            fig_cm = px.imshow(
+                cm,
+                labels=dict(x="Predicción", y="Real", color="Clientes"),
+                x=segment_names_ordered,
+                y=segment_names_ordered,
+                color_continuous_scale='Blues',
+                text_auto=True,
+                aspect="auto"
             )
-            fig_importance.update_traces(texttemplate='%{text}%', textposition='outside')
-            fig_importance.update_layout(height=400)
-            st.plotly_chart(fig_importance, use_container_width=True)
-        
-        with col2:
-            st.markdown("**Interpretación:**")
-            for idx, row in feature_importance.iterrows():
-                variable = row['Variable']
-                percentage = row['Porcentaje']
+            
+            fig_cm.update_layout(
+                title='Matriz de Confusión - Clasificación de Segmentos',
+                xaxis_title='Segmento Predicho',
+                yaxis_title='Segmento Real',
+                height=500
+            )
+            
+            fig_cm.update_traces(
+                texttemplate='%{text}',
+                textfont_size=14
+            )
+            
+            st.plotly_chart(fig_cm, use_container_width=True)
+            
+            # Métricas detalladas por segmento
+            st.markdown("### 📋 Reporte de Clasificación por Segmento")
+            
+            # Crear reporte de clasificación
+            report = classification_report(y, y_pred, target_names=segment_names_ordered, output_dict=True)
+            report_df = pd.DataFrame(report).transpose()
+            
+            # Filtrar solo las filas de segmentos (sin accuracy, macro avg, weighted avg)
+            segment_report = report_df.loc[segment_names_ordered].copy()
+            segment_report = segment_report.round(3)
+            
+            # Renombrar columnas
+            segment_report.columns = ['Precisión', 'Recall', 'F1-Score', 'Clientes']
+            segment_report['Clientes'] = segment_report['Clientes'].astype(int)
+            segment_report['Precisión'] = segment_report['Precisión'].apply(lambda x: f"{x:.1%}")
+            segment_report['Recall'] = segment_report['Recall'].apply(lambda x: f"{x:.1%}")
+            segment_report['F1-Score'] = segment_report['F1-Score'].apply(lambda x: f"{x:.3f}")
+            
+            segment_report = segment_report.reset_index()
+            segment_report.columns = ['Segmento', 'Precisión', 'Recall', 'F1-Score', 'Clientes']
+            
+            st.dataframe(segment_report, use_container_width=True, hide_index=True)
+            
+            # Explicación de métricas
+            with st.expander("ℹ️ ¿Qué significan estas métricas?"):
+                st.markdown("""
+                **Precisión**: De todos los clientes clasificados en un segmento, ¿cuántos realmente pertenecen a ese segmento?
+                - Ejemplo: Si la precisión de "Champions" es 95%, significa que de todos los clientes que el modelo clasificó como Champions, el 95% realmente son Champions.
                 
-                if percentage > 40:
-                    importance_label = "🔴 Crítica"
-                elif percentage > 25:
-                    importance_label = "🟡 Alta"
-                else:
-                    importance_label = "🟢 Media"
+                **Recall (Sensibilidad)**: De todos los clientes que pertenecen a un segmento, ¿cuántos fueron correctamente identificados?
+                - Ejemplo: Si el recall de "At Risk" es 85%, significa que el modelo identificó correctamente al 85% de todos los clientes que realmente están en riesgo.
                 
-                st.markdown(f"**{variable}**: {importance_label}")
-                st.progress(percentage / 100)
-                st.caption(f"{percentage}% de importancia")
-        
-        st.markdown("---")
-        
-        # Visualizar árbol
-        st.markdown("### 🌳 Visualización del Árbol de Decisión")
-        
-        # Opciones de visualización
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            st.info("""
-            **Cómo leer el árbol:**
-            - Cada caja muestra una regla de decisión
-            - Las flechas indican el camino según si la condición es verdadera (izquierda) o falsa (derecha)
-            - Las hojas finales muestran el segmento asignado
-            """)
-        
-        with col2:
-            show_impurity = st.checkbox("Mostrar Impureza", value=False, 
-                                        help="Gini impurity: menor = segmento más puro")
-            show_samples = st.checkbox("Mostrar % de Clientes", value=True,
-                                       help="Porcentaje de clientes en cada nodo")
-        
-        # Crear figura del árbol con matplotlib
-        from sklearn.tree import plot_tree
-        
-        # Ajustar tamaño según profundidad
-        fig_width = max(20, tree_model.get_depth() * 4)
-        fig_height = max(10, tree_model.get_depth() * 2)
-        
-        fig, ax = plt.subplots(figsize=(fig_width, fig_height))
-        
-        # Obtener nombres de segmentos ordenados por cluster
-        segment_names_ordered = [rfm[rfm['Cluster'] == i]['Segment'].iloc[0] 
-                                 for i in sorted(rfm['Cluster'].unique())]
-        
-        plot_tree(
-            tree_model,
-            feature_names=['Recency', 'Frequency', 'Monetary'],
-            class_names=segment_names_ordered,
-            filled=True,
-            rounded=True,
-            fontsize=9,
-            ax=ax,
-            impurity=show_impurity,
-            proportion=show_samples
-        )
-        
-        plt.title('Árbol de Decisión - Reglas de Segmentación', 
-                  fontsize=16, fontweight='bold', pad=20)
-        plt.tight_layout()
-        
-        st.pyplot(fig)
-        plt.close()
-        
-        st.markdown("---")
-        
-        # Extracción de reglas de decisión
-        st.markdown("### 📝 Reglas de Decisión Extraídas")
-        
-        # Función para extraer reglas del árbol
-        from sklearn.tree import _tree
-        
-        def extract_rules(tree_model, feature_names, class_names):
-            tree_ = tree_model.tree_
-            feature_name = [
-                feature_names[i] if i != _tree.TREE_UNDEFINED else "undefined!"
-                for i in tree_.feature
-            ]
+                **F1-Score**: Promedio armónico de Precisión y Recall. Un balance entre ambas métricas.
+                - Valores cercanos a 1.0 indican un modelo muy bueno para ese segmento.
+                """)
+            
+            st.markdown("---")
             
-            rules = []
+            # Importancia de variables
+            st.markdown("### 📊 Importancia de Variables")
             
-            def recurse(node, depth, conditions):
-                indent = "  " * depth
-                
-                if tree_.feature[node] != _tree.TREE_UNDEFINED:
-                    name = feature_name[node]
-                    threshold = tree_.threshold[node]
+            feature_importance = pd.DataFrame({
+                'Variable': ['Recency', 'Frequency', 'Monetary'],
+                'Importancia': tree_model.feature_importances_,
+                'Porcentaje': (tree_model.feature_importances_ * 100).round(1)
+            }).sort_values('Importancia', ascending=False)
+            
+            col1, col2 = st.columns([2, 1])
+            
+            with col1:
+                fig_importance = px.bar(
+                    feature_importance,
+                    x='Variable',
+                    y='Importancia',
+                    title='Importancia de Cada Variable en la Segmentación',
+                    color='Importancia',
+                    color_continuous_scale='Viridis',
+                    text='Porcentaje'
+                )
+                fig_importance.update_traces(texttemplate='%{text}%', textposition='outside')
+                fig_importance.update_layout(height=400)
+                st.plotly_chart(fig_importance, use_container_width=True)
+            
+            with col2:
+                st.markdown("**Interpretación:**")
+                for idx, row in feature_importance.iterrows():
+                    variable = row['Variable']
+                    percentage = row['Porcentaje']
+                    
+                    if percentage > 40:
+                        importance_label = "🔴 Crítica"
+                    elif percentage > 25:
+                        importance_label = "🟡 Alta"
+                    else:
+                        importance_label = "🟢 Media"
                     
-                    # Rama izquierda (<=)
-                    left_conditions = conditions + [f"{name} ≤ {threshold:.2f}"]
-                    recurse(tree_.children_left[node], depth + 1, left_conditions)
+                    st.markdown(f"**{variable}**: {importance_label}")
+                    st.progress(percentage / 100)
+                    st.caption(f"{percentage}% de importancia")
+            
+            st.markdown("---")
+            
+            # Visualizar árbol
+            st.markdown("### 🌳 Visualización del Árbol de Decisión")
+            
+            # Opciones de visualización
+            col1, col2 = st.columns([3, 1])
+            
+            with col1:
+                st.info("""
+                **Cómo leer el árbol:**
+                - Cada caja muestra una regla de decisión
+                - Las flechas indican el camino según si la condición es verdadera (izquierda) o falsa (derecha)
+                - Las hojas finales muestran el segmento asignado
+                """)
+            
+            with col2:
+                show_impurity = st.checkbox("Mostrar Impureza", value=False, 
+                                            help="Gini impurity: menor = segmento más puro")
+                show_samples = st.checkbox("Mostrar % de Clientes", value=True,
+                                           help="Porcentaje de clientes en cada nodo")
+            
+            # Crear figura del árbol con matplotlib (solo se importa al llegar aquí)
+            import matplotlib.pyplot as plt
+            from sklearn.tree import plot_tree
+            
+            # Ajustar tamaño según profundidad
+            fig_width = max(20, tree_model.get_depth() * 4)
+            fig_height = max(10, tree_model.get_depth() * 2)
+            
+            with track_stage(perf_run, 'plot_tree', kind='chart'):
+                fig, ax = plt.subplots(figsize=(fig_width, fig_height))
+            
+                plot_tree(
+                    tree_model,
+                    feature_names=['Recency', 'Frequency', 'Monetary'],
+                    class_names=segment_names_ordered,
+                    filled=True,
+                    rounded=True,
+                    fontsize=9,
+                    ax=ax,
+                    impurity=show_impurity,
+                    proportion=show_samples
+                )
+            
+                plt.title('Árbol de Decisión - Reglas de Segmentación', 
+                          fontsize=16, fontweight='bold', pad=20)
+                plt.tight_layout()
+            
+                st.pyplot(fig)
+                plt.close()
+            
+            st.markdown("---")
+            
+            # Extracción de reglas de decisión
+            st.markdown("### 📝 Reglas de Decisión Extraídas")
+            
+            # Función para extraer reglas del árbol
+            from sklearn.tree import _tree
+            
+            def extract_rules(tree_model, feature_names, class_names):
+                tree_ = tree_model.tree_
+                feature_name = [
+                    feature_names[i] if i != _tree.TREE_UNDEFINED else "undefined!"
+                    for i in tree_.feature
+                ]
+                
+                rules = []
+                
+                def recurse(node, depth, conditions):
+                    indent = "  " * depth
                     
-                    # Rama derecha (>)
-                    right_conditions = conditions + [f"{name} > {threshold:.2f}"]
-                    recurse(tree_.children_right[node], depth + 1, right_conditions)
-                else:
-                    # Es una hoja
-                    class_idx = np.argmax(tree_.value[node])
-                    class_name = class_names[class_idx]
-                    n_samples = tree_.n_node_samples[node]
+                    if tree_.feature[node] != _tree.TREE_UNDEFINED:
+                        name = feature_name[node]
+                        threshold = tree_.threshold[node]
+                        
+                        # Rama izquierda (<=)
+                        left_conditions = conditions + [f"{name} ≤ {threshold:.2f}"]
+                        recurse(tree_.children_left[node], depth + 1, left_conditions)
+                        
+                        # Rama derecha (>)
+                        right_conditions = conditions + [f"{name} > {threshold:.2f}"]
+                        recurse(tree_.children_right[node], depth + 1, right_conditions)
+                    else:
+                        # Es una hoja
+                        class_idx = np.argmax(tree_.value[node])
+                        class_name = class_names[class_idx]
+                        n_samples = tree_.n_node_samples[node]
+                        
+                        if len(conditions) > 0:
+                            rule = " Y ".join(conditions)
+                            rules.append({
+                                'Regla': rule,
+                                'Segmento': class_name,
+                                'Clientes': n_samples
+                            })
+                
+                recurse(0, 0, [])
+                return rules
+            
+            rules = extract_rules(tree_model, ['Recency', 'Frequency', 'Monetary'], segment_names_ordered)
+            rules_df = pd.DataFrame(rules)
+            
+            if len(rules_df) > 0:
+                rules_df = rules_df.sort_values('Clientes', ascending=False)
+                
+                st.markdown("""
+                Cada regla representa un camino desde la raíz del árbol hasta una hoja (segmento final).
+                Estas reglas pueden usarse para clasificar manualmente nuevos clientes.
+                """)
+                
+                # Mostrar reglas en un formato expandible por segmento
+                for segment in rules_df['Segmento'].unique():
+                    segment_rules = rules_df[rules_df['Segmento'] == segment]
+                    total_customers = segment_rules['Clientes'].sum()
                     
-                    if len(conditions) > 0:
-                        rule = " Y ".join(conditions)
-                        rules.append({
-                            'Regla': rule,
-                            'Segmento': class_name,
-                            'Clientes': n_samples
-                        })
+                    with st.expander(f"**{segment}** ({len(segment_rules)} reglas, {total_customers:,} clientes)"):
+                        for idx, row in segment_rules.iterrows():
+                            st.markdown(f"**Regla {idx+1}** ({row['Clientes']:,} clientes):")
+                            st.code(row['Regla'], language=None)
+                            st.markdown("---")
             
-            recurse(0, 0, [])
-            return rules
-        
-        rules = extract_rules(tree_model, ['Recency', 'Frequency', 'Monetary'], segment_names_ordered)
-        rules_df = pd.DataFrame(rules)
-        
-        if len(rules_df) > 0:
-            rules_df = rules_df.sort_values('Clientes', ascending=False)
+            st.markdown("---")
+            
+            # Explicación de uso práctico
+            st.markdown("### 💡 Aplicación Práctica")
             
             st.markdown("""
-            Cada regla representa un camino desde la raíz del árbol hasta una hoja (segmento final).
-            Estas reglas pueden usarse para clasificar manualmente nuevos clientes.
-            """)
+            **Este árbol te permite responder preguntas como:**
+            - ¿Qué hace que un cliente sea clasificado como 'Champion'?
+            - ¿Qué umbral de Recency separa a los clientes activos de los inactivos?
+            - ¿Cuál es el nivel de Frequency que distingue a los clientes leales?
+            - ¿Cómo se diferencian los segmentos en términos de reglas simples?
             
-            # Mostrar reglas en un formato expandible por segmento
-            for segment in rules_df['Segmento'].unique():
-                segment_rules = rules_df[rules_df['Segmento'] == segment]
-                total_customers = segment_rules['Clientes'].sum()
-                
-                with st.expander(f"**{segment}** ({len(segment_rules)} reglas, {total_customers:,} clientes)"):
-                    for idx, row in segment_rules.iterrows():
-                        st.markdown(f"**Regla {idx+1}** ({row['Clientes']:,} clientes):")
-                        st.code(row['Regla'], language=None)
-                        st.markdown("---")
-        
-        st.markdown("---")
-        
-        # Explicación de uso práctico
-        st.markdown("### 💡 Aplicación Práctica")
+            **Ejemplo de lectura:**
+            Si en el primer nodo dice "Recency <= 100":
+            - Los clientes que compraron en los últimos 100 días van por la izquierda (más activos)
+            - Los que no compraron en 100+ días van por la derecha (menos activos o en riesgo)
+            
+            **Uso para nuevos clientes:**
+            Puedes usar estas reglas para clasificar manualmente nuevos clientes sin necesidad de re-entrenar el modelo.
+            """)
+    
+    # ========================================================================
+    # TAB 7: ANÁLISIS DE CESTA POR SEGMENTO
+    # ========================================================================
+    with tab_basket, track_stage(perf_run, 'basket', kind='tab'):
+        st.subheader("🛒 Análisis de Cesta por Segmento")
         
         st.markdown("""
-        **Este árbol te permite responder preguntas como:**
-        - ¿Qué hace que un cliente sea clasificado como 'Champion'?
-        - ¿Qué umbral de Recency separa a los clientes activos de los inactivos?
-        - ¿Cuál es el nivel de Frequency que distingue a los clientes leales?
-        - ¿Cómo se diferencian los segmentos en términos de reglas simples?
-        
-        **Ejemplo de lectura:**
-        Si en el primer nodo dice "Recency <= 100":
-        - Los clientes que compraron en los últimos 100 días van por la izquierda (más activos)
-        - Los que no compraron en 100+ días van por la derecha (menos activos o en riesgo)
-        
-        **Uso para nuevos clientes:**
-        Puedes usar estas reglas para clasificar manualmente nuevos clientes sin necesidad de re-entrenar el modelo.
+        Reglas de asociación entre productos dentro de cada segmento: **"quien compra A también compra B"**.
+        Sirven para recomendaciones, packs y venta cruzada adaptadas a cada tipo de cliente.
+        
+        - **Soporte**: fracción de las facturas del segmento que contienen todos los productos de la regla
+        - **Confianza**: de las facturas con "Si compra", fracción que también incluye "Recomendar"
+        - **Lift**: cuántas veces más probable es "Recomendar" en esas facturas que en el resto (> 1 = asociación real)
         """)
+        
+        if basket_source is None:
+            st.info("ℹ️ El análisis de cesta necesita las líneas de factura: disponible al subir un archivo "
+                    "o al leer archivos del servidor")
+        else:
+            col1, col2, col3 = st.columns([1, 1, 2])
+            with col1:
+                basket_min_support = st.select_slider(
+                    "Soporte mínimo",
+                    options=[0.005, 0.01, 0.02, 0.03, 0.05, 0.1],
+                    value=DEFAULT_MIN_SUPPORT,
+                    format_func=lambda value: f"{value:.1%}",
+                    help="Relativo a las facturas de cada segmento; valores bajos encuentran más reglas y tardan más"
+                )
+            with col2:
+                basket_min_confidence = st.select_slider(
+                    "Confianza mínima",
+                    options=[0.1, 0.2, 0.3, 0.5, 0.7],
+                    value=DEFAULT_MIN_CONFIDENCE,
+                    format_func=lambda value: f"{value:.0%}"
+                )
+            
+            basket_args = (segmentation_id, basket_source, basket_min_support, basket_min_confidence)
+            basket_lines = df_clean if data_source == 'upload' else None
+            basket_job = session_job('basket_rules', basket_args, basket_rules_job, *basket_args, rfm, basket_lines)
+            with col3:
+                basket_done = render_job_status('basket_rules', basket_job, "Minando itemsets frecuentes")
+            
+            if basket_done:
+                with track_stage(perf_run, 'basket_rules', rows=len(rfm), cached=True):
+                    basket_stats, basket_segments = get_basket_rules(*basket_args, rfm, basket_lines)
+                
+                st.caption(f"Matriz dispersa: {basket_stats['invoices']:,} facturas × "
+                           f"{basket_stats['products']:,} productos · {basket_stats['nonzero']:,} celdas "
+                           f"({basket_stats['density']:.2%}) · {basket_stats['megabytes']:.1f} MB")
+                
+                basket_overview = pd.DataFrame([
+                    {'Segmento': segment, 'Facturas': basket_result['invoices'],
+                     'Itemsets frecuentes': basket_result['itemsets'],
+                     'Itemset más largo': basket_result['max_itemset'], 'Reglas': len(basket_result['rules'])}
+                    for segment, basket_result in basket_segments.items()
+                ])
+                st.dataframe(basket_overview, use_container_width=True, hide_index=True)
+                
+                basket_segment = st.selectbox("Segmento", options=list(basket_segments))
+                basket_result = basket_segments[basket_segment]
+                
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    st.markdown(f"### 🔗 Reglas de {basket_segment}")
+                    if basket_result['rules'].empty:
+                        st.info("No hay reglas con estos umbrales: prueba con menor soporte o confianza")
+                    else:
+                        basket_rules = basket_result['rules'].assign(
+                            support=lambda r: (r['support'] * 100).round(2),
+                            confidence=lambda r: (r['confidence'] * 100).round(1),
+                            lift=lambda r: r['lift'].round(2)
+                        ).rename(columns={'support': 'Soporte (%)', 'confidence': 'Confianza (%)',
+                                          'lift': 'Lift', 'invoices': 'Facturas'})
+                        st.dataframe(basket_rules, use_container_width=True, hide_index=True)
+                with col2:
+                    st.markdown("### 🏆 Productos más frecuentes")
+                    st.dataframe(basket_result['top_products'].assign(
+                        Soporte=lambda p: (p['Soporte'] * 100).round(1)
+                    ).rename(columns={'Soporte': 'Soporte (%)'}), use_container_width=True, hide_index=True)
     
     st.markdown("---")
     
     # Insights y recomendaciones
     st.subheader("💡 Insights y Recomendaciones")
     
-    for segment in rfm['Segment'].unique():
-        segment_data = rfm[rfm['Segment'] == segment]
-        
-        with st.expander(f"**{segment}** ({len(segment_data):,} clientes)"):
-            col1, col2 = st.columns([2, 1])
+    with track_stage(perf_run, 'insights', kind='section'):
+        for segment, segment_data in segment_profile.iterrows():
+            with st.expander(f"**{segment}** ({segment_data['Customers']:,.0f} clientes)"):
+                col1, col2 = st.columns([2, 1])
             
-            with col1:
-                st.markdown(f"""
-                **Características:**
-                - Recency promedio: {segment_data['Recency'].mean():.0f} días
-                - Frequency promedio: {segment_data['Frequency'].mean():.1f} compras
-                - Monetary promedio: £{segment_data['Monetary'].mean():,.2f}
-                - Contribución a ingresos: £{segment_data['Monetary'].sum():,.2f} 
-                  ({(segment_data['Monetary'].sum() / rfm['Monetary'].sum() * 100):.1f}%)
-                """)
-                
-                # Recomendaciones específicas
-                if segment == 'Champions':
-                    st.markdown("""
-                    **🎯 Estrategia:**
-                    - Programas VIP exclusivos
-                    - Early access a nuevos productos
-                    - Atención personalizada premium
-                    - Incentivos por referidos
-                    """)
-                elif segment == 'Loyal Customers':
-                    st.markdown("""
-                    **🎯 Estrategia:**
-                    - Programas de puntos y recompensas
-                    - Ofertas especiales periódicas
-                    - Comunicación frecuente de valor
-                    - Up-selling y cross-selling
-                    """)
-                elif segment == 'At Risk':
-                    st.markdown("""
-                    **⚠️ Estrategia URGENTE:**
-                    - Campañas de reactivación inmediatas
-                    - Descuentos significativos
-                    - Encuestas de satisfacción
-                    - Win-back campaigns personalizadas
-                    """)
-                else:
-                    st.markdown("""
-                    **📈 Estrategia:**
-                    - Incrementar frecuencia de compra
-                    - Ofertas por volumen
-                    - Recordatorios personalizados
-                    - Programas de engagement
+                with col1:
+                    st.markdown(f"""
+                    **Características:**
+                    - Recency promedio: {segment_data['Recency_mean']:.0f} días
+                    - Frequency promedio: {segment_data['Frequency_mean']:.1f} compras
+                    - Monetary promedio: £{segment_data['Monetary_mean']:,.2f} (mediana £{segment_data['Monetary_median']:,.2f})
+                    - Contribución a ingresos: £{segment_data['Monetary_sum']:,.2f} 
+                      ({segment_data['RevenueShare'] * 100:.1f}%)
                     """)
+                
+                    # Recomendaciones específicas
+                    if segment == 'Champions':
+                        st.markdown("""
+                        **🎯 Estrategia:**
+                        - Programas VIP exclusivos
+                        - Early access a nuevos productos
+                        - Atención personalizada premium
+                        - Incentivos por referidos
+                        """)
+                    elif segment == 'Loyal Customers':
+                        st.markdown("""
+                        **🎯 Estrategia:**
+                        - Programas de puntos y recompensas
+                        - Ofertas especiales periódicas
+                        - Comunicación frecuente de valor
+                        - Up-selling y cross-selling
+                        """)
+                    elif segment == 'At Risk':
+                        st.markdown("""
+                        **⚠️ Estrategia URGENTE:**
+                        - Campañas de reactivación inmediatas
+                        - Descuentos significativos
+                        - Encuestas de satisfacción
+                        - Win-back campaigns personalizadas
+                        """)
+                    else:
+                        st.markdown("""
+                        **📈 Estrategia:**
+                        - Incrementar frecuencia de compra
+                        - Ofertas por volumen
+                        - Recordatorios personalizados
+                        - Programas de engagement
+                        """)
             
-            with col2:
-                # Mini gráfico de distribución RFM para el segmento
-                rfm_values = segment_data[['Recency', 'Frequency', 'Monetary']].mean()
-                fig_mini = go.Figure(data=[
-                    go.Bar(x=['R', 'F', 'M'], 
-                          y=[rfm_values['Recency'], rfm_values['Frequency'], rfm_values['Monetary']],
-                          marker_color=['#FF6B6B', '#4ECDC4', '#45B7D1'])
-                ])
-                fig_mini.update_layout(
-                    title='Perfil RFM',
-                    height=250,
-                    showlegend=False,
-                    margin=dict(l=20, r=20, t=40, b=20)
-                )
-                st.plotly_chart(fig_mini, use_container_width=True)
+                with col2:
+                    # Mini gráfico de distribución RFM para el segmento
+                    fig_mini = go.Figure(data=[
+                        go.Bar(x=['R', 'F', 'M'], 
+                              y=[segment_data['Recency_mean'], segment_data['Frequency_mean'], segment_data['Monetary_mean']],
+                              marker_color=['#FF6B6B', '#4ECDC4', '#45B7D1'])
+                    ])
+                    fig_mini.update_layout(
+                        title='Perfil RFM',
+                        height=250,
+                        showlegend=False,
+                        margin=dict(l=20, r=20, t=40, b=20)
+                    )
+                    st.plotly_chart(fig_mini, use_container_width=True)
+    
+    render_performance_panel(perf_panel, perf_run, st.session_state.perf_runs)
     
     # Footer
     st.markdown("---")
@@ -0,0 +1,322 @@
+"""
+Motores de Cálculo para Limpieza y RFM
+======================================
+
+La limpieza de transacciones y la agregación RFM pueden ejecutarse con:
+
+- pandas: en memoria, un solo núcleo (comportamiento original del dashboard)
+- sharded: limpieza en pandas y agregación RFM repartida por hash de CustomerID
+  en un pool de procesos (ver parallel.py)
+- duckdb: motor SQL columnar embebido, vectorizado y multihilo. Puede leer
+  directamente archivos Parquet/CSV y empujar los filtros de limpieza y la
+  agregación a la lectura, sin materializar las transacciones en pandas.
+
+Ambos motores devuelven la misma tabla `rfm` (CustomerID, Recency, Frequency,
+Monetary, Tenure) ordenada por CustomerID; `compare_rfm` verifica la equivalencia.
+Tenure son los días desde la primera compra hasta la fecha de referencia (la
+antigüedad que necesita el modelo de CLV).
+"""
+
+import glob
+import importlib.util
+import os
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from parallel import sharded_rfm
+
+# DuckDB se importa al abrir la primera conexión: el arranque del dashboard no lo paga
+DUCKDB_AVAILABLE = importlib.util.find_spec('duckdb') is not None
+
+BACKENDS = {
+    'pandas': 'pandas (en memoria)',
+    'sharded': 'pandas multinúcleo (shards por CustomerID)',
+    'duckdb': 'DuckDB (SQL columnar multihilo)'
+}
+
+# Motor por defecto configurable sin tocar el código
+BACKEND_ENV = 'RFM_BACKEND'
+# Hilos de DuckDB (por defecto todos los núcleos)
+DUCKDB_THREADS_ENV = 'RFM_DUCKDB_THREADS'
+
+RFM_OUTPUT_COLUMNS = ['CustomerID', 'Recency', 'Frequency', 'Monetary', 'Tenure']
+
+# Filtros de limpieza compartidos por todas las consultas SQL
+_CLEAN_FILTER_SQL = """
+    CustomerID IS NOT NULL
+    AND NOT starts_with(CAST(InvoiceNo AS VARCHAR), 'C')
+    AND Quantity > 0
+    AND UnitPrice > 0
+"""
+
+_RFM_SQL = """
+    WITH customers AS (
+        SELECT
+            CAST(CustomerID AS DOUBLE) AS CustomerID,
+            COUNT(DISTINCT CAST(InvoiceNo AS VARCHAR)) AS Frequency,
+            SUM(TotalAmount) AS Monetary,
+            MAX(InvoiceDate) AS LastPurchaseDate,
+            MIN(InvoiceDate) AS FirstPurchaseDate
+        FROM {source}
+        GROUP BY 1
+    ),
+    reference AS (
+        SELECT MAX(LastPurchaseDate) + INTERVAL 1 DAY AS reference_date FROM customers
+    )
+    SELECT
+        CustomerID,
+        -- Días completos transcurridos (igual que Timedelta.days en pandas)
+        CAST(date_diff('microsecond', LastPurchaseDate, reference_date) // 86400000000 AS BIGINT) AS Recency,
+        Frequency,
+        Monetary,
+        CAST(date_diff('microsecond', FirstPurchaseDate, reference_date) // 86400000000 AS BIGINT) AS Tenure
+    FROM customers, reference
+    ORDER BY CustomerID
+"""
+
+
+def available_backends():
+    """Motores instalados en este entorno"""
+    return [name for name in BACKENDS if name != 'duckdb' or DUCKDB_AVAILABLE]
+
+
+def default_backend():
+    """Motor configurado en RFM_BACKEND (si está disponible) o pandas"""
+    backend = os.environ.get(BACKEND_ENV, 'pandas')
+    return backend if backend in available_backends() else 'pandas'
+
+
+def _check_backend(backend):
+    """Validar el nombre del motor"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Motor desconocido: {backend}")
+    if backend == 'duckdb' and not DUCKDB_AVAILABLE:
+        raise ImportError("DuckDB no está instalado (pip install duckdb)")
+
+
+def _connect():
+    """Conexión DuckDB en memoria con el número de hilos configurado"""
+    import duckdb
+
+    connection = duckdb.connect(database=':memory:')
+    threads = os.environ.get(DUCKDB_THREADS_ENV)
+    if threads:
+        connection.execute(f"SET threads = {int(threads)}")
+    return connection
+
+
+# ============================================================================
+# PANDAS
+# ============================================================================
+
+def clean_transactions_pandas(df):
+    """Limpieza en pandas: nulos, cancelaciones, cantidades/precios no positivos"""
+    df_clean = df.copy()
+
+    # Eliminar CustomerID nulos
+    df_clean = df_clean[df_clean['CustomerID'].notna()]
+
+    # Eliminar cancelaciones. InvoiceNo mixto int/str (Excel) queda como texto, igual que en
+    # DuckDB: si no, 536365 y '536365' cuentan como dos facturas
+    invoice_no = df_clean['InvoiceNo'].astype(str)
+    if df_clean['InvoiceNo'].dtype == object:
+        df_clean['InvoiceNo'] = invoice_no
+    df_clean = df_clean[~invoice_no.str.startswith('C')]
+
+    # Eliminar valores negativos o cero
+    df_clean = df_clean[df_clean['Quantity'] > 0]
+    df_clean = df_clean[df_clean['UnitPrice'] > 0]
+
+    # Convertir fecha
+    df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
+
+    # Calcular valor total
+    df_clean['TotalAmount'] = df_clean['Quantity'] * df_clean['UnitPrice']
+
+    return df_clean
+
+
+def aggregate_rfm_pandas(df_clean):
+    """Agregación RFM en pandas a nivel cliente"""
+    # Fecha de referencia
+    reference_date = df_clean['InvoiceDate'].max() + timedelta(days=1)
+
+    # Agregar a nivel cliente
+    customer_data = df_clean.groupby('CustomerID').agg(
+        NumPurchases=('InvoiceNo', 'nunique'),
+        TotalSpent=('TotalAmount', 'sum'),
+        LastPurchaseDate=('InvoiceDate', 'max'),
+        FirstPurchaseDate=('InvoiceDate', 'min')
+    ).reset_index()
+
+    # Calcular RFM
+    customer_data['Recency'] = (reference_date - customer_data['LastPurchaseDate']).dt.days
+    customer_data['Frequency'] = customer_data['NumPurchases']
+    customer_data['Monetary'] = customer_data['TotalSpent']
+    customer_data['Tenure'] = (reference_date - customer_data['FirstPurchaseDate']).dt.days
+
+    return customer_data[RFM_OUTPUT_COLUMNS].copy()
+
+
+# ============================================================================
+# DUCKDB
+# ============================================================================
+
+def _as_sql_frame(df):
+    """Preparar un DataFrame para DuckDB (InvoiceNo mixto int/str como texto)"""
+    if df['InvoiceNo'].dtype == object:
+        df = df.assign(InvoiceNo=df['InvoiceNo'].astype(str))
+    return df
+
+
+def clean_transactions_duckdb(df):
+    """Limpieza con DuckDB sobre un DataFrame en memoria"""
+    connection = _connect()
+    try:
+        connection.register('transactions', _as_sql_frame(df))
+        df_clean = connection.execute(f"""
+            SELECT * REPLACE (CAST(InvoiceDate AS TIMESTAMP) AS InvoiceDate),
+                   Quantity * UnitPrice AS TotalAmount
+            FROM transactions
+            WHERE {_CLEAN_FILTER_SQL}
+        """).df()
+    finally:
+        connection.close()
+    return df_clean
+
+
+def aggregate_rfm_duckdb(df_clean):
+    """Agregación RFM con DuckDB sobre transacciones ya limpias"""
+    connection = _connect()
+    try:
+        connection.register('clean', _as_sql_frame(df_clean[['CustomerID', 'InvoiceNo', 'TotalAmount',
+                                                             'InvoiceDate']]))
+        rfm = connection.execute(_RFM_SQL.format(source='clean')).df()
+    finally:
+        connection.close()
+    return rfm
+
+
+# ============================================================================
+# API COMÚN
+# ============================================================================
+
+def clean_transactions(df, backend='pandas'):
+    """Limpiar transacciones con el motor indicado"""
+    _check_backend(backend)
+    if backend == 'duckdb':
+        return clean_transactions_duckdb(df)
+    return clean_transactions_pandas(df)
+
+
+def aggregate_rfm(df_clean, backend='pandas'):
+    """Calcular la tabla RFM con el motor indicado"""
+    _check_backend(backend)
+    if backend == 'duckdb':
+        return aggregate_rfm_duckdb(df_clean)
+    if backend == 'sharded':
+        return sharded_rfm(df_clean)
+    return aggregate_rfm_pandas(df_clean)
+
+
+def resolve_paths(pattern):
+    """Expandir una ruta, carpeta o patrón glob a archivos CSV/Parquet"""
+    path = Path(pattern)
+    if path.is_dir():
+        candidates = [p for p in path.rglob('*') if p.suffix.lower() in ('.csv', '.parquet')]
+    else:
+        candidates = [Path(p) for p in glob.glob(str(pattern), recursive=True)]
+    return sorted(str(p) for p in candidates if p.is_file())
+
+
+def _file_source_sql(paths):
+    """Expresión FROM de DuckDB para una lista de archivos del mismo formato"""
+    suffixes = {Path(p).suffix.lower() for p in paths}
+    if len(suffixes) != 1 or suffixes - {'.csv', '.parquet'}:
+        raise ValueError("Todos los archivos deben ser CSV o todos Parquet")
+    file_list = '[' + ', '.join("'" + p.replace("'", "''") + "'" for p in paths) + ']'
+    if suffixes == {'.parquet'}:
+        return f"read_parquet({file_list}, union_by_name = true)"
+    return f"read_csv_auto({file_list}, union_by_name = true, types = {{'InvoiceNo': 'VARCHAR'}})"
+
+
+def read_transaction_files(paths):
+    """Leer archivos CSV/Parquet a un único DataFrame de pandas"""
+    frames = []
+    for path in paths:
+        if path.lower().endswith('.parquet'):
+            frames.append(pd.read_parquet(path))
+        else:
+            frames.append(pd.read_csv(path, dtype={'InvoiceNo': str}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def rfm_from_files(paths, backend='duckdb', start=None, end_exclusive=None):
+    """RFM directamente desde archivos; con DuckDB la limpieza y la agregación se
+    ejecutan durante la lectura. Opcionalmente solo transacciones en
+    [start, end_exclusive). Devuelve (rfm, estadísticas de filas)."""
+    _check_backend(backend)
+    if not paths:
+        raise FileNotFoundError("No se encontraron archivos CSV/Parquet")
+
+    if backend != 'duckdb':
+        df = read_transaction_files(paths)
+        df_clean = clean_transactions_pandas(df)
+        if start is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] >= start]
+        if end_exclusive is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] < end_exclusive]
+        return aggregate_rfm(df_clean, backend), {'rows_read': len(df), 'rows_valid': len(df_clean)}
+
+    date_filter = ''
+    if start is not None:
+        date_filter += f" AND CAST(InvoiceDate AS TIMESTAMP) >= TIMESTAMP '{pd.Timestamp(start)}'"
+    if end_exclusive is not None:
+        date_filter += f" AND CAST(InvoiceDate AS TIMESTAMP) < TIMESTAMP '{pd.Timestamp(end_exclusive)}'"
+
+    connection = _connect()
+    try:
+        source = _file_source_sql(paths)
+        connection.execute(f"""
+            CREATE TEMP VIEW clean AS
+            SELECT CustomerID, InvoiceNo, CAST(InvoiceDate AS TIMESTAMP) AS InvoiceDate,
+                   Quantity * UnitPrice AS TotalAmount
+            FROM {source}
+            WHERE {_CLEAN_FILTER_SQL} {date_filter}
+        """)
+        rfm = connection.execute(_RFM_SQL.format(source='clean')).df()
+        rows_read, rows_valid = connection.execute(f"""
+            SELECT (SELECT COUNT(*) FROM {source}), (SELECT COUNT(*) FROM clean)
+        """).fetchone()
+    finally:
+        connection.close()
+
+    return rfm, {'rows_read': int(rows_read), 'rows_valid': int(rows_valid)}
+
+
+def compare_rfm(rfm_a, rfm_b, rtol=1e-9):
+    """Lista de diferencias entre dos tablas RFM (vacía si son equivalentes).
+    Monetary admite una tolerancia relativa mínima por el orden de las sumas."""
+    a = rfm_a.sort_values('CustomerID').reset_index(drop=True)
+    b = rfm_b.sort_values('CustomerID').reset_index(drop=True)
+
+    if len(a) != len(b):
+        return [f"Número de clientes distinto: {len(a):,} vs {len(b):,}"]
+
+    differences = []
+    if not np.array_equal(a['CustomerID'].to_numpy(dtype=float), b['CustomerID'].to_numpy(dtype=float)):
+        differences.append("CustomerID distintos")
+    # Tenure solo si ambas tablas la traen (los snapshots anteriores no la tienen)
+    for column in ('Recency', 'Frequency', 'Tenure'):
+        if column not in a or column not in b:
+            continue
+        mismatches = int((a[column].to_numpy(dtype=np.int64) != b[column].to_numpy(dtype=np.int64)).sum())
+        if mismatches:
+            differences.append(f"{column}: {mismatches:,} clientes distintos")
+    if not np.allclose(a['Monetary'].to_numpy(dtype=float), b['Monetary'].to_numpy(dtype=float),
+                       rtol=rtol, atol=0):
+        differences.append("Monetary fuera de tolerancia")
+    return differences
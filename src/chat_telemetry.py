@@ -0,0 +1,184 @@
+"""
+Telemetría del Chatbot
+======================
+
+Registra cada petición al modelo de lenguaje:
+
+- Modelo, tokens de prompt y de respuesta (los que informa la API)
+- Preparación: desde el envío de la pregunta hasta la llamada (contexto)
+- Cola: tiempo que la petición esperó en el servidor (queue_time de Groq)
+- Tiempo hasta el primer token (la respuesta llega en streaming) y latencia
+  total de la llamada
+- Acierto de caché de prompt (tokens de prompt reutilizados por el servidor)
+- Clase de error si la llamada falla
+
+Los registros se guardan en memoria del proceso (compartidos por todas las
+sesiones, los últimos MAX_RECORDS), se agregan en percentiles por modelo y se
+exportan como JSON lines; con RFM_CHAT_LOG también se agregan a un archivo.
+Los registros mezclan las sesiones de todos los usuarios, así que la vista
+solo se muestra a quien abre el dashboard con `?admin=<RFM_ADMIN_TOKEN>`.
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Archivo opcional donde se agregan los registros en JSON lines
+CHAT_LOG_ENV = 'RFM_CHAT_LOG'
+# Token de la vista de administración (sin él la vista no se muestra a nadie)
+ADMIN_TOKEN_ENV = 'RFM_ADMIN_TOKEN'
+MAX_RECORDS = 1_000
+PERCENTILES = (50, 90, 99)
+
+_records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+
+
+# ============================================================================
+# REGISTRO
+# ============================================================================
+
+@contextmanager
+def track_chat(model, messages, submitted_at=None):
+    """Medir una petición al chatbot; `submitted_at` (perf_counter) es cuándo se envió la pregunta"""
+    call_start = time.perf_counter()
+    record = {
+        'request_id': uuid.uuid4().hex[:12],
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'model': model,
+        'status': 'ok',
+        'prompt_chars': sum(len(message['content']) for message in messages),
+        'prepare_s': call_start - submitted_at if submitted_at is not None else 0.0,
+        'queue_s': None,
+        'ttft_s': None,
+        'prompt_tokens': None,
+        'completion_tokens': None,
+        'cached_tokens': None,
+        'cache': None,
+        'error': None,
+        '_call_start': call_start
+    }
+    try:
+        yield record
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = type(e).__name__
+        record['status_code'] = getattr(e, 'status_code', None)
+        raise
+    finally:
+        record.pop('_call_start')
+        record['latency_s'] = time.perf_counter() - call_start
+        record['total_s'] = record['prepare_s'] + record['latency_s']
+        if record['completion_tokens'] and record['ttft_s'] is not None and record['latency_s'] > record['ttft_s']:
+            record['tokens_per_s'] = record['completion_tokens'] / (record['latency_s'] - record['ttft_s'])
+        with _lock:
+            _records.append(record)
+        _append_to_log(record)
+
+
+def record_usage(record, usage):
+    """Copiar al registro los tokens y tiempos que informa la API"""
+    if usage is None:
+        return
+    record['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+    record['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+    record['queue_s'] = getattr(usage, 'queue_time', None)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None)
+    if cached is not None:
+        record['cached_tokens'] = cached
+        record['cache'] = 'hit' if cached > 0 else 'miss'
+
+
+def stream_answer(stream, record, on_text=None):
+    """Consumir la respuesta en streaming: marca el primer token, recoge el uso y devuelve el texto"""
+    parts = []
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            if record['ttft_s'] is None:
+                record['ttft_s'] = time.perf_counter() - record['_call_start']
+            parts.append(delta)
+            if on_text is not None:
+                on_text(''.join(parts))
+        # Groq envía el uso en el último fragmento (x_groq.usage o usage según la versión)
+        usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        if usage is not None:
+            record_usage(record, usage)
+    return ''.join(parts)
+
+
+def _append_to_log(record):
+    """Escribir el registro en el archivo de telemetría si está configurado"""
+    path = os.environ.get(CHAT_LOG_ENV)
+    if not path:
+        return
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except OSError:
+        pass
+
+
+# ============================================================================
+# CONSULTA Y EXPORTACIÓN
+# ============================================================================
+
+def is_admin(token):
+    """True si el token coincide con RFM_ADMIN_TOKEN (configurado y no vacío)"""
+    expected = os.environ.get(ADMIN_TOKEN_ENV)
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(str(token).encode(), expected.encode())
+
+
+def chat_records():
+    """Copia de los registros del proceso (del más antiguo al más reciente)"""
+    with _lock:
+        return list(_records)
+
+
+def summarize_chat(records):
+    """Percentiles por modelo de tiempos y tokens, tasa de error y de acierto de caché"""
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    metrics = ['ttft_s', 'latency_s', 'queue_s', 'prepare_s', 'prompt_tokens', 'completion_tokens']
+    values = df[metrics].apply(pd.to_numeric, errors='coerce')
+    grouped = values.groupby(df['model'])
+
+    summary = pd.DataFrame({
+        'Peticiones': df.groupby('model').size(),
+        'Errores (%)': (df['status'] == 'error').groupby(df['model']).mean() * 100,
+        'Caché (%)': (df['cache'] == 'hit').groupby(df['model']).sum()
+                     / df['cache'].notna().groupby(df['model']).sum().replace(0, np.nan) * 100
+    })
+    for metric in metrics:
+        for q in PERCENTILES:
+            summary[f'{metric} p{q}'] = grouped[metric].quantile(q / 100)
+    summary.index.name = 'Modelo'
+    return summary.round(3)
+
+
+def error_counts(records):
+    """Errores por clase y modelo"""
+    errors = [record for record in records if record['status'] == 'error']
+    if not errors:
+        return pd.DataFrame(columns=['Modelo', 'Error', 'Peticiones'])
+    return (pd.DataFrame(errors).groupby(['model', 'error']).size()
+            .rename('Peticiones').reset_index().rename(columns={'model': 'Modelo', 'error': 'Error'})
+            .sort_values('Peticiones', ascending=False, ignore_index=True))
+
+
+def to_json_lines(records):
+    """Registros como JSON lines"""
+    return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
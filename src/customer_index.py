@@ -0,0 +1,82 @@
+"""
+Índice de Clientes
+==================
+
+Se construye una vez por segmentación y permite, sin recorrer la tabla RFM:
+
+- Buscar un CustomerID (diccionario ID → fila)
+- Ver sus métricas, segmento y percentiles de Recency, Frequency y Monetary
+- Encontrar los k clientes más parecidos (KD-tree sobre el RFM normalizado)
+
+Percentiles: porcentaje de clientes con un valor igual o peor. En Recency "peor"
+es más días sin comprar, así que un percentil alto indica una compra reciente.
+"""
+
+import numpy as np
+import pandas as pd
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+
+def build_customer_index(rfm, scaler=None):
+    """Construir el índice a partir de la tabla RFM segmentada"""
+    from sklearn.neighbors import KDTree
+    from sklearn.preprocessing import StandardScaler
+
+    table = rfm[['CustomerID'] + RFM_COLUMNS + ['Segment']].reset_index(drop=True)
+
+    # Sin scaler (datos pre-procesados) se normaliza con la propia tabla
+    if scaler is None:
+        scaler = StandardScaler().fit(table[RFM_COLUMNS])
+    scaled = np.ascontiguousarray(scaler.transform(table[RFM_COLUMNS]), dtype=np.float64)
+
+    percentiles = pd.DataFrame({
+        'Recency': table['Recency'].rank(pct=True, method='max', ascending=False),
+        'Frequency': table['Frequency'].rank(pct=True, method='max'),
+        'Monetary': table['Monetary'].rank(pct=True, method='max')
+    }).to_numpy() * 100
+
+    return {
+        'table': table,
+        'positions': dict(zip(table['CustomerID'].tolist(), range(len(table)))),
+        'percentiles': percentiles,
+        'tree': KDTree(scaled),
+        'scaled': scaled
+    }
+
+
+def parse_customer_id(text):
+    """Convertir el texto introducido en un CustomerID numérico (None si no es válido)"""
+    try:
+        return float(str(text).strip())
+    except ValueError:
+        return None
+
+
+def lookup_customer(index, customer_id):
+    """Métricas, segmento y percentiles de un cliente (None si no existe)"""
+    row = index['positions'].get(customer_id)
+    if row is None:
+        return None
+    record = index['table'].iloc[row]
+    return {
+        'CustomerID': record['CustomerID'],
+        'Segment': record['Segment'],
+        **{column: record[column] for column in RFM_COLUMNS},
+        'percentiles': dict(zip(RFM_COLUMNS, index['percentiles'][row]))
+    }
+
+
+def nearest_customers(index, customer_id, k=10):
+    """Los k clientes más cercanos en el espacio RFM normalizado (sin el propio cliente)"""
+    row = index['positions'].get(customer_id)
+    if row is None:
+        return None
+    k = min(k, len(index['table']) - 1)
+    distances, rows = index['tree'].query(index['scaled'][row:row + 1], k=k + 1)
+
+    # El propio cliente aparece a distancia 0 (o empatado con otro idéntico)
+    neighbours = [(r, d) for r, d in zip(rows[0], distances[0]) if r != row][:k]
+    result = index['table'].iloc[[r for r, _ in neighbours]].copy()
+    result.insert(1, 'Distancia', np.round([d for _, d in neighbours], 4))
+    return result.reset_index(drop=True)
@@ -0,0 +1,265 @@
+"""
+Exportación de Segmentos
+========================
+
+Exporta la tabla CustomerID → segmento con métricas RFM, scores y la distancia
+de cada cliente a cada centroide, escribiendo por bloques para no duplicar la
+tabla en memoria:
+
+- CSV: bloques añadidos al mismo archivo
+- Parquet: un row group por bloque
+- Excel: openpyxl en modo write_only (memoria constante); si se supera el
+  límite de filas de Excel se continúa en otra hoja
+
+Las exportaciones del dashboard se escriben en una única carpeta gestionada
+(`RFM_EXPORT_DIR`, por defecto `rfm_exports` en la carpeta temporal del
+sistema). Las sesiones que terminan no avisan, así que cada exportación nueva
+borra los archivos con más de `RFM_EXPORT_TTL_HOURS` horas.
+
+Uso desde la línea de comandos:
+
+    python src/export.py --input data/rfm_snapshot --output segmentos.parquet
+    python src/export.py --input "data/*.parquet" --clusters 4 --output segmentos.csv
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from backends import BACKENDS, default_backend, resolve_paths, rfm_from_files
+from jobs import start_job, report_progress
+from pipeline import fit_clustering, assign_segment_names
+from rfm_scoring import score_rfm
+from snapshot_store import read_metadata, read_snapshot, scaler_from_metadata, centers_from_metadata
+
+EXPORT_FORMATS = {
+    'csv': ('CSV', 'text/csv'),
+    'parquet': ('Parquet', 'application/octet-stream'),
+    'xlsx': ('Excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+}
+
+EXPORT_DIR_ENV = 'RFM_EXPORT_DIR'
+EXPORT_TTL_HOURS_ENV = 'RFM_EXPORT_TTL_HOURS'
+DEFAULT_EXPORT_TTL_HOURS = 6
+
+EXPORT_CHUNK_ROWS = 100_000
+EXCEL_MAX_ROWS = 1_048_575  # sin contar la fila de encabezado
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+BASE_COLUMNS = ['CustomerID', 'Segment', 'Cluster'] + RFM_COLUMNS
+SCORE_COLUMNS = ['R_Score', 'F_Score', 'M_Score', 'RFM_Score']
+
+
+# ============================================================================
+# BLOQUES
+# ============================================================================
+
+def cluster_centers(rfm, scaler, kmeans=None):
+    """Centroides en el espacio normalizado (del modelo o, sin él, medias por cluster)"""
+    if kmeans is not None:
+        return kmeans.cluster_centers_
+    scaled = scaler.transform(rfm[RFM_COLUMNS])
+    clusters = rfm['Cluster'].to_numpy()
+    return np.vstack([scaled[clusters == c].mean(axis=0) for c in np.sort(np.unique(clusters))])
+
+
+def iter_export_chunks(rfm, scaler, centers, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Bloques de la tabla de exportación con distancias a los centroides"""
+    columns = BASE_COLUMNS + [c for c in SCORE_COLUMNS if c in rfm.columns]
+
+    for start in range(0, len(rfm), chunk_rows):
+        chunk = rfm.iloc[start:start + chunk_rows][columns].reset_index(drop=True)
+        scaled = scaler.transform(chunk[RFM_COLUMNS])
+        distances = np.sqrt(((scaled[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+        for k in range(len(centers)):
+            chunk[f'Dist_Cluster_{k}'] = distances[:, k].round(4)
+        yield chunk
+
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+
+def _write_csv(chunks, path, on_chunk):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+            on_chunk(len(chunk))
+
+
+def _write_parquet(chunks, path, on_chunk):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            on_chunk(len(chunk))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_xlsx(chunks, path, on_chunk):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    header = None
+    for chunk in chunks:
+        header = header or list(chunk.columns)
+        # itertuples entrega escalares nativos de Python, que openpyxl escribe directamente
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet is None or sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f'Segmentos_{len(workbook.worksheets) + 1}')
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        on_chunk(len(chunk))
+    workbook.save(path)
+
+
+_WRITERS = {'csv': _write_csv, 'parquet': _write_parquet, 'xlsx': _write_xlsx}
+
+
+def write_export(chunks, path, file_format, on_chunk=None):
+    """Escribir los bloques en un archivo temporal y moverlo al destino al terminar"""
+    if file_format not in _WRITERS:
+        raise ValueError(f"Formato no soportado: {file_format}")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    try:
+        _WRITERS[file_format](chunks, tmp_path, on_chunk or (lambda rows: None))
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path
+
+
+# ============================================================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# ============================================================================
+
+def _export_job(job, rfm, scaler, centers, path, file_format):
+    """Etapa del trabajo de exportación: progreso en clientes escritos"""
+    rows_written = 0
+
+    def on_chunk(rows):
+        nonlocal rows_written
+        rows_written += rows
+        report_progress(job, rows_written, len(rfm))
+
+    write_export(iter_export_chunks(rfm, scaler, centers), path, file_format, on_chunk)
+    return path
+
+
+def export_root():
+    """Carpeta gestionada de las exportaciones del dashboard"""
+    return Path(os.environ.get(EXPORT_DIR_ENV) or Path(tempfile.gettempdir()) / 'rfm_exports')
+
+
+def sweep_exports(max_age_hours=None):
+    """Borrar las exportaciones (y temporales abandonados) más antiguas que el TTL; devuelve cuántas"""
+    if max_age_hours is None:
+        max_age_hours = float(os.environ.get(EXPORT_TTL_HOURS_ENV, DEFAULT_EXPORT_TTL_HOURS))
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for path in export_root().glob('*'):
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            # Otro proceso del servidor la borró a la vez
+            continue
+    return removed
+
+
+def start_export(rfm, scaler, centers, file_format):
+    """Lanzar la exportación como trabajo en segundo plano (cancelable entre bloques)"""
+    sweep_exports()
+    path = str(export_root() / f'segmentos-{uuid.uuid4().hex[:12]}.{file_format}')
+    job = start_job('export', _export_job, rfm, scaler, centers, path, file_format)
+    job.update(format=file_format, path=path, total=len(rfm))
+    return job
+
+
+def discard_export(job):
+    """Borrar el archivo de una exportación anterior de la sesión"""
+    if job and job['status'] != 'running':
+        Path(job['path']).unlink(missing_ok=True)
+
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def _segment_from_transactions(paths, n_clusters, backend):
+    """Ejecutar el pipeline del dashboard (RFM, K-Means y nombres) sobre archivos"""
+    rfm, _ = rfm_from_files(paths, backend=backend)
+    rfm['Cluster'], kmeans, scaler = fit_clustering(rfm, n_clusters=n_clusters)
+    rfm, _ = assign_segment_names(rfm)
+    return rfm, scaler, kmeans
+
+
+def main():
+    from sklearn.preprocessing import StandardScaler
+
+    parser = argparse.ArgumentParser(description="Exportar la asignación de segmentos por cliente")
+    parser.add_argument('--input', required=True,
+                        help="Snapshot pre-procesado (carpeta), CSV pre-procesado o transacciones CSV/Parquet")
+    parser.add_argument('--output', required=True, help="Archivo de salida (.csv, .parquet o .xlsx)")
+    parser.add_argument('--clusters', type=int, default=4, help="Segmentos a crear desde transacciones")
+    parser.add_argument('--backend', default=default_backend(), choices=list(BACKENDS),
+                        help="Motor de cálculo del RFM desde transacciones")
+    parser.add_argument('--quantiles', type=int, default=4, choices=[4, 5], help="Escala de los scores RFM")
+    args = parser.parse_args()
+
+    file_format = Path(args.output).suffix.lower().lstrip('.')
+    if file_format not in EXPORT_FORMATS:
+        parser.error("La salida debe terminar en .csv, .parquet o .xlsx")
+
+    header = pd.read_csv(args.input, nrows=0) if args.input.lower().endswith('.csv') else None
+    metadata = read_metadata(args.input) if os.path.isdir(args.input) else None
+    centers = None
+    if metadata is not None:
+        rfm = read_snapshot(args.input, metadata)
+        scaler = scaler_from_metadata(metadata)
+        centers = centers_from_metadata(metadata)
+        kmeans = None
+    elif header is not None and {'Cluster', 'Segment'} <= set(header.columns):
+        rfm = pd.read_csv(args.input)
+        scaler = StandardScaler().fit(rfm[RFM_COLUMNS])
+        kmeans = None
+    else:
+        paths = resolve_paths(args.input)
+        if not paths:
+            sys.exit(f"❌ No se encontraron archivos en {args.input}")
+        rfm, scaler, kmeans = _segment_from_transactions(paths, args.clusters, args.backend)
+
+    rfm = score_rfm(rfm, n_quantiles=args.quantiles)
+    if centers is None:
+        centers = cluster_centers(rfm, scaler, kmeans)
+
+    start = time.perf_counter()
+    write_export(iter_export_chunks(rfm, scaler, centers), args.output, file_format)
+    print(f"✓ {len(rfm):,} clientes exportados a {args.output} en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
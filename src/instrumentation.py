@@ -0,0 +1,288 @@
+"""
+Instrumentación de Rendimiento
+==============================
+
+Registra, para cada etapa del pipeline y cada pestaña renderizada en un rerun
+(y para cada trabajo en segundo plano, medido en su propio hilo):
+
+- Tiempo de pared y de CPU del hilo que ejecuta la etapa
+- Pico de memoria residente (RSS) durante la etapa y su variación
+- Filas procesadas
+- Acierto/fallo de caché (para funciones con @st.cache_data)
+
+El pico se mide con un hilo que muestrea el RSS del proceso cada
+RSS_SAMPLE_SECONDS mientras haya etapas abiertas, sin reiniciar contadores
+globales: las sesiones simultáneas no se falsean entre sí, aunque el RSS del
+proceso incluye la memoria de todas. La CPU es la del hilo (`thread_time`), por
+lo que tampoco suma la de otras sesiones; el trabajo de los hilos de DuckDB o de
+los procesos del pool no aparece en ella. Los registros de cada sesión se exportan
+como JSON lines; los contadores de Prometheus son del proceso y monótonos.
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Archivo opcional donde se agregan los registros en JSON lines (para monitoreo)
+METRICS_LOG_ENV = 'RFM_METRICS_LOG'
+RSS_SAMPLE_SECONDS = 0.05
+
+_local = threading.local()
+
+# Etapas abiertas en cualquier hilo (las actualiza el hilo de muestreo)
+_open_stages = []
+_open_lock = threading.Lock()
+_sampler_wake = threading.Event()
+_sampler = None
+
+# Último registro y contadores acumulados por etapa en todo el proceso
+_latest = {}
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+# ============================================================================
+# MEMORIA
+# ============================================================================
+
+def reset_peak_rss():
+    """Reiniciar el pico de RSS del proceso (solo Linux); True si se pudo
+
+    Afecta a todo el proceso: solo para scripts que miden una etapa a la vez
+    (benchmarks), no para el dashboard.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss_mb():
+    """Pico de RSS del proceso en MB (VmHWM en Linux, ru_maxrss en otros)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def read_rss_mb():
+    """RSS actual del proceso en MB (VmRSS en Linux; en otros sistemas, el pico del proceso)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return read_peak_rss_mb()
+
+
+def _sample_rss():
+    """Hilo de muestreo: actualiza el pico de las etapas abiertas; duerme si no hay ninguna"""
+    while True:
+        _sampler_wake.wait()
+        rss = read_rss_mb()
+        with _open_lock:
+            for record in _open_stages:
+                record['_peak'] = max(record['_peak'], rss)
+            if not _open_stages:
+                _sampler_wake.clear()
+        time.sleep(RSS_SAMPLE_SECONDS)
+
+
+def _open_stage(record):
+    """Registrar una etapa abierta y arrancar el hilo de muestreo si hace falta"""
+    global _sampler
+    with _open_lock:
+        _open_stages.append(record)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_rss, name='rss-sampler', daemon=True)
+            _sampler.start()
+    _sampler_wake.set()
+
+
+def _close_stage(record, parent=None):
+    """Quitar una etapa de las abiertas y pasar su pico a la etapa padre"""
+    with _open_lock:
+        # Por identidad: dos registros pueden ser iguales como diccionarios
+        _open_stages[:] = [stage for stage in _open_stages if stage is not record]
+        peak = record['_peak'] = max(record['_peak'], read_rss_mb())
+        if parent is not None:
+            parent['_peak'] = max(parent['_peak'], peak)
+
+
+# ============================================================================
+# REGISTRO DE ETAPAS
+# ============================================================================
+
+def new_run():
+    """Crear el registro de un rerun del dashboard"""
+    return {
+        'run_id': uuid.uuid4().hex[:12],
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'stages': []
+    }
+
+
+def mark_cache_miss():
+    """Llamar dentro de una función cacheada: solo se ejecuta cuando no hay acierto"""
+    _local.cache_miss = True
+
+
+@contextmanager
+def track_stage(run, name, kind='stage', rows=None, cached=False):
+    """Medir una etapa; el registro devuelto admite completar 'rows' al final"""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    rss_start = read_rss_mb()
+    record = {'name': name, 'kind': kind, 'rows': rows, 'depth': len(stack), '_peak': rss_start}
+    stack.append(record)
+    _local.cache_miss = False
+    _open_stage(record)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['wall_s'] = time.perf_counter() - wall_start
+        record['cpu_s'] = time.thread_time() - cpu_start
+        stack.pop()
+        _close_stage(record, stack[-1] if stack else None)
+        record['peak_rss_mb'] = record.pop('_peak')
+        record['rss_delta_mb'] = read_rss_mb() - rss_start
+        if cached:
+            record['cache'] = 'miss' if _local.cache_miss else 'hit'
+        record['finished_at'] = datetime.now(timezone.utc).isoformat()
+
+        run['stages'].append(record)
+        _count_stage(record)
+        _append_to_log(run, record)
+
+
+def _count_stage(record):
+    """Acumular el registro en los contadores del proceso (todas las sesiones)"""
+    key = (record['name'], record['kind'])
+    with _totals_lock:
+        _latest[key] = record
+        count = _totals.setdefault(key, {'runs': 0, 'hit': 0, 'miss': 0, 'errors': 0, 'wall': 0.0})
+        count['runs'] += 1
+        count['wall'] += record['wall_s']
+        if record.get('cache') in ('hit', 'miss'):
+            count[record['cache']] += 1
+        if record.get('error'):
+            count['errors'] += 1
+
+
+def _append_to_log(run, record):
+    """Escribir el registro en el archivo de métricas si está configurado"""
+    path = os.environ.get(METRICS_LOG_ENV)
+    if not path:
+        return
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'run_id': run['run_id'], **record}) + '\n')
+    except OSError:
+        pass
+
+
+# ============================================================================
+# EXPORTACIÓN
+# ============================================================================
+
+def to_json_lines(runs):
+    """Todos los registros de etapas como JSON lines"""
+    lines = []
+    for run in runs:
+        for record in run['stages']:
+            lines.append(json.dumps({'run_id': run['run_id'], 'run_started_at': run['started_at'], **record},
+                                    ensure_ascii=False))
+    return '\n'.join(lines) + ('\n' if lines else '')
+
+
+def _escape_label(value):
+    """Escapar un valor de etiqueta según el formato de texto de Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def to_prometheus():
+    """Métricas del proceso en formato de texto de Prometheus (último valor y contadores monótonos)"""
+    with _totals_lock:
+        latest = dict(_latest)
+        counters = {key: dict(count) for key, count in _totals.items()}
+
+    gauges = [
+        ('rfm_stage_wall_seconds', 'Tiempo de pared de la última ejecución de la etapa', 'wall_s'),
+        ('rfm_stage_cpu_seconds', 'Tiempo de CPU del hilo de la etapa en su última ejecución', 'cpu_s'),
+        ('rfm_stage_peak_rss_bytes', 'Pico de RSS del proceso durante la última ejecución', 'peak_rss_mb'),
+        ('rfm_stage_rows', 'Filas procesadas en la última ejecución de la etapa', 'rows'),
+    ]
+    totals = [
+        ('rfm_stage_runs_total', 'Ejecuciones de la etapa', 'runs'),
+        ('rfm_stage_wall_seconds_total', 'Tiempo de pared acumulado de la etapa', 'wall'),
+        ('rfm_stage_cache_hits_total', 'Aciertos de caché de la etapa', 'hit'),
+        ('rfm_stage_cache_misses_total', 'Fallos de caché de la etapa', 'miss'),
+        ('rfm_stage_errors_total', 'Ejecuciones de la etapa terminadas con error', 'errors'),
+    ]
+
+    lines = []
+    for metric, help_text, field in gauges:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+        for (name, kind), record in sorted(latest.items()):
+            value = record.get(field)
+            if value is None:
+                continue
+            if field == 'peak_rss_mb':
+                value = value * 1024 * 1024
+            lines.append(f'{metric}{{stage="{_escape_label(name)}",kind="{_escape_label(kind)}"}} {value}')
+
+    for metric, help_text, field in totals:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for (name, kind), count in sorted(counters.items()):
+            lines.append(f'{metric}{{stage="{_escape_label(name)}",kind="{_escape_label(kind)}"}} {count[field]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def run_wall_seconds(run):
+    """Tiempo total del rerun (solo etapas de primer nivel, sin contar anidadas ni los
+    trabajos en segundo plano, que corren en su propio hilo)"""
+    return sum(record['wall_s'] for record in run['stages']
+               if record.get('depth', 0) == 0 and record['kind'] != 'job')
+
+
+def summarize_run(run):
+    """Filas de resumen de un rerun para mostrar en una tabla"""
+    return [
+        {
+            'Etapa': '· ' * record.get('depth', 0) + record['name'],
+            'Tipo': record['kind'],
+            'Tiempo (s)': round(record['wall_s'], 3),
+            'CPU hilo (s)': round(record['cpu_s'], 3),
+            'Pico RSS (MB)': round(record['peak_rss_mb'], 1),
+            'Δ RSS (MB)': round(record['rss_delta_mb'], 1),
+            'Filas': record['rows'],
+            'Caché': record.get('cache', '-'),
+            'Error': record.get('error', '')
+        }
+        for record in run['stages']
+    ]
@@ -0,0 +1,77 @@
+"""
+Tabla de Facturas
+=================
+
+Capa intermedia entre las líneas limpias y el análisis: una fila por factura y
+cliente con su fecha, total, unidades, líneas, productos distintos y país.
+
+Se calcula una vez a partir de `df_clean` y la comparten:
+
+- RFM: Frequency es el número de facturas del cliente, Recency sale de la
+  última factura y Monetary de la suma de totales (agregación sobre facturas
+  en lugar de líneas)
+- EDA: tamaño de cesta, ticket medio y conteos por país sin volver a recorrer
+  las líneas
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+from backends import RFM_OUTPUT_COLUMNS
+
+INVOICE_COLUMNS = ['InvoiceNo', 'CustomerID', 'InvoiceDate', 'Total', 'Items', 'Lines', 'SKUs', 'Country']
+
+
+def build_invoice_table(df_clean):
+    """Una fila por (cliente, factura) a partir de las líneas limpias"""
+    lines = df_clean[['CustomerID', 'InvoiceNo', 'InvoiceDate', 'TotalAmount', 'Quantity',
+                      'StockCode', 'Country']]
+    grouped = lines.groupby(['CustomerID', 'InvoiceNo'], sort=False, observed=True)
+
+    invoices = grouped.agg(
+        InvoiceDate=('InvoiceDate', 'max'),
+        Total=('TotalAmount', 'sum'),
+        Items=('Quantity', 'sum'),
+        Lines=('Quantity', 'size'),
+        SKUs=('StockCode', 'nunique'),
+        Country=('Country', 'first')
+    ).reset_index()
+
+    # Almacenamiento compacto: enteros pequeños y texto repetido como categoría
+    invoices['InvoiceNo'] = invoices['InvoiceNo'].astype(str).astype('category')
+    invoices['Country'] = invoices['Country'].astype('category')
+    invoices['Items'] = invoices['Items'].astype(np.int32)
+    invoices['Lines'] = invoices['Lines'].astype(np.int32)
+    invoices['SKUs'] = invoices['SKUs'].astype(np.int32)
+
+    return invoices[INVOICE_COLUMNS].sort_values(['CustomerID', 'InvoiceDate'], ignore_index=True)
+
+
+def aggregate_rfm_invoices(invoices):
+    """Tabla RFM a partir de la tabla de facturas (mismo resultado que sobre líneas)"""
+    # Fecha de referencia
+    reference_date = invoices['InvoiceDate'].max() + timedelta(days=1)
+
+    customer_data = invoices.groupby('CustomerID').agg(
+        LastPurchaseDate=('InvoiceDate', 'max'),
+        FirstPurchaseDate=('InvoiceDate', 'min'),
+        Frequency=('Total', 'size'),
+        Monetary=('Total', 'sum')
+    ).reset_index()
+
+    customer_data['Recency'] = (reference_date - customer_data['LastPurchaseDate']).dt.days
+    customer_data['Frequency'] = customer_data['Frequency'].astype(np.int64)
+    customer_data['Tenure'] = (reference_date - customer_data['FirstPurchaseDate']).dt.days
+
+    return customer_data[RFM_OUTPUT_COLUMNS].copy()
+
+
+def basket_summary(invoices):
+    """Indicadores de cesta: facturas, ticket medio y tamaño medio/mediano"""
+    return {
+        'invoices': len(invoices),
+        'avg_total': float(invoices['Total'].mean()) if len(invoices) else 0.0,
+        'avg_items': float(invoices['Items'].mean()) if len(invoices) else 0.0,
+        'median_skus': float(invoices['SKUs'].median()) if len(invoices) else 0.0,
+    }
@@ -0,0 +1,98 @@
+"""
+Trabajos en Segundo Plano
+=========================
+
+Ejecuta etapas costosas del pipeline (carga de Excel, barrido de K, árbol,
+estabilidad, exportación) en hilos para que el rerun de Streamlit no quede
+bloqueado. Cada trabajo es un diccionario que el hilo actualiza en vivo y que
+la sesión conserva entre reruns:
+
+- `status`: 'running', 'done', 'error' o 'cancelled'
+- `done` / `total` / `message`: progreso informado por la etapa
+- `result` / `error`: resultado o error al terminar
+
+La cancelación es cooperativa: la etapa llama a `report_progress` entre pasos
+y ahí se interrumpe con `JobCancelled`. Si la etapa no informa progreso (una
+única llamada de pandas), el hilo termina su trabajo pero el resultado se
+descarta.
+"""
+
+import threading
+import time
+import uuid
+
+
+class JobCancelled(Exception):
+    """La sesión pidió cancelar el trabajo"""
+
+
+def start_job(name, func, *args, keep_result=True, **kwargs):
+    """Ejecutar func(job, *args, **kwargs) en un hilo; devuelve el estado que se actualiza en vivo"""
+    job = {
+        'id': uuid.uuid4().hex[:12],
+        'name': name,
+        'status': 'running',
+        'done': 0,
+        'total': None,
+        'message': None,
+        'result': None,
+        'error': None,
+        'started_at': time.time(),
+        'finished_at': None,
+        'cancel': threading.Event()
+    }
+
+    def run():
+        try:
+            result = func(job, *args, **kwargs)
+            if job['cancel'].is_set():
+                raise JobCancelled()
+            job['result'] = result if keep_result else None
+            job['status'] = 'done'
+        except JobCancelled:
+            job['status'] = 'cancelled'
+        except Exception as e:
+            job['status'] = 'error'
+            job['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            job['finished_at'] = time.time()
+
+    job['thread'] = threading.Thread(target=run, name=f'rfm-job-{name}', daemon=True)
+    job['thread'].start()
+    return job
+
+
+def report_progress(job, done, total=None, message=None):
+    """Informar el avance de una etapa (sin trabajo no hace nada); interrumpe si se canceló"""
+    if job is None:
+        return
+    if job['cancel'].is_set():
+        raise JobCancelled()
+    job['done'] = done
+    job['total'] = total
+    if message is not None:
+        job['message'] = message
+
+
+def cancel_job(job):
+    """Pedir la cancelación de un trabajo en curso"""
+    if job is not None and job['status'] == 'running':
+        job['cancel'].set()
+
+
+def wait_job(job, timeout):
+    """Esperar hasta `timeout` segundos a que termine el trabajo"""
+    job['thread'].join(timeout)
+    return job
+
+
+def job_fraction(job):
+    """Fracción completada (None si la etapa no informa un total)"""
+    if not job['total']:
+        return None
+    return min(job['done'] / job['total'], 1.0)
+
+
+def job_elapsed(job):
+    """Segundos transcurridos desde el inicio del trabajo"""
+    return (job['finished_at'] or time.time()) - job['started_at']
@@ -0,0 +1,367 @@
+"""
+Ingesta en Vivo desde una Carpeta
+=================================
+
+Vigila una carpeta donde el sistema de pedidos deja extractos CSV/Parquet
+(p. ej. cada hora) e ingiere solo los archivos nuevos:
+
+1. Cada archivo nuevo produce agregados parciales por cliente (última compra,
+   facturas y gasto), igual que una partición mensual
+2. Los parciales se combinan solo para los clientes afectados; la Recency se
+   recalcula con la nueva fecha de referencia
+3. Los clientes cuyas métricas cambiaron se reasignan con el modelo actual
+   (`predict` del K-Means vigente, sin reajustar). Si la fecha de referencia
+   avanza, la Recency cambia también para clientes sin compras nuevas
+4. Si la deriva supera el umbral, se reajusta K-Means sobre todos los clientes
+
+Deriva frente al último ajuste:
+
+- PSI (population stability index) del reparto de clientes por cluster
+- Aumento relativo de la distancia cuadrática media al centroide asignado
+
+Cada factura debe llegar en un solo archivo (los conteos de facturas se suman
+entre archivos). Un archivo que cambia después de ingerirse no se vuelve a
+leer: se informa como modificado. Los archivos se ingieren cuando llevan
+`SETTLE_SECONDS` sin modificarse, para no leer extractos a medio escribir.
+
+El estado vive en memoria del proceso (un hilo por carpeta vigilada): tras un
+reinicio la primera pasada vuelve a leer la carpeta completa.
+
+Uso:
+    python src/live_ingest.py --folder data/drop --clusters 4
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from backends import RFM_OUTPUT_COLUMNS, resolve_paths, read_transaction_files, clean_transactions_pandas
+from partitions import customer_partials, merge_partials
+from validation import RFM_REQUIRED_COLUMNS, validate_sample
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+# Cada cuánto se revisa la carpeta y cuánto debe llevar un archivo sin cambios
+SCAN_SECONDS = 5
+SETTLE_SECONDS = 2
+
+# Umbrales de deriva que disparan el reajuste completo
+DRIFT_PSI = 0.2
+DRIFT_INERTIA = 0.25
+
+# Lotes conservados en el historial y carpetas vigiladas a la vez por proceso
+BATCH_HISTORY = 50
+MAX_WATCHERS = 4
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+# ============================================================================
+# ARCHIVOS
+# ============================================================================
+
+def scan_folder(folder, manifest, settle_seconds=SETTLE_SECONDS, now=None):
+    """(archivos nuevos listos para ingerir, archivos modificados tras ingerirse)"""
+    now = now or time.time()
+    ready, modified = [], []
+    for path in resolve_paths(folder):
+        if os.path.basename(path).startswith('.'):
+            continue
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime)
+        if path not in manifest:
+            if now - stat.st_mtime >= settle_seconds:
+                ready.append((path, version))
+        elif manifest[path]['version'] != version:
+            modified.append(path)
+    return ready, modified
+
+
+def read_batch(files):
+    """Parciales por cliente de un lote de archivos y filas leídas/válidas (o error) de cada uno"""
+    partials, file_stats = [], {}
+    for path, _ in files:
+        try:
+            # Un extracto sin las columnas del RFM se rechaza sin leerlo entero
+            validate_sample(path, required=RFM_REQUIRED_COLUMNS)
+            df = read_transaction_files([path])
+            df_clean = clean_transactions_pandas(df)
+            partials.append(customer_partials(df_clean))
+            file_stats[path] = {'rows': len(df), 'valid': len(df_clean), 'error': None}
+        except Exception as e:
+            # Un extracto roto no bloquea el resto del lote (ni se reintenta en cada pasada)
+            file_stats[path] = {'rows': 0, 'valid': 0, 'error': f"{type(e).__name__}: {e}"}
+    return (merge_partials(partials) if partials else None), file_stats
+
+
+# ============================================================================
+# RFM INCREMENTAL Y DERIVA
+# ============================================================================
+
+def update_partials(partials, batch):
+    """Combinar el lote con los parciales acumulados; devuelve (parciales, clientes afectados)"""
+    if partials is None:
+        return batch.sort_index(), batch.index
+
+    affected = batch.index
+    existing = affected.intersection(partials.index)
+    partials = partials.copy()
+    old = partials.loc[existing]
+    new = batch.loc[existing]
+    partials.loc[existing, 'LastPurchaseDate'] = np.maximum(old['LastPurchaseDate'], new['LastPurchaseDate'])
+    partials.loc[existing, 'NumPurchases'] = old['NumPurchases'] + new['NumPurchases']
+    partials.loc[existing, 'TotalSpent'] = old['TotalSpent'] + new['TotalSpent']
+    partials.loc[existing, 'FirstPurchaseDate'] = np.minimum(old['FirstPurchaseDate'], new['FirstPurchaseDate'])
+
+    added = batch.loc[affected.difference(partials.index)]
+    if len(added):
+        partials = pd.concat([partials, added]).sort_index()
+    return partials, affected
+
+
+def partials_to_rfm(partials):
+    """Tabla RFM de todos los clientes (Recency frente a la última compra + 1 día)"""
+    reference_date = partials['LastPurchaseDate'].max() + pd.Timedelta(days=1)
+    rfm = pd.DataFrame({
+        'CustomerID': partials.index,
+        'Recency': (reference_date - partials['LastPurchaseDate']).dt.days.to_numpy(),
+        'Frequency': partials['NumPurchases'].to_numpy(dtype=np.int64),
+        'Monetary': partials['TotalSpent'].to_numpy(),
+        'Tenure': (reference_date - partials['FirstPurchaseDate']).dt.days.to_numpy()
+    })
+    return rfm[RFM_OUTPUT_COLUMNS]
+
+
+def fit_model(rfm, n_clusters):
+    """Normalizar y ajustar K-Means (mismos parámetros que el dashboard)"""
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import KMeans
+
+    scaler = StandardScaler()
+    features = scaler.fit_transform(rfm[RFM_COLUMNS])
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(features)
+    return labels, kmeans, scaler
+
+
+def cluster_shares(labels, n_clusters):
+    """Proporción de clientes por cluster"""
+    return np.bincount(labels, minlength=n_clusters) / max(len(labels), 1)
+
+
+def mean_sq_distance(rfm, labels, kmeans, scaler):
+    """Distancia cuadrática media de cada cliente a su centroide asignado"""
+    features = scaler.transform(rfm[RFM_COLUMNS])
+    return float(((features - kmeans.cluster_centers_[labels]) ** 2).sum(axis=1).mean())
+
+
+def measure_drift(baseline, rfm, labels, kmeans, scaler):
+    """PSI del reparto por cluster y aumento relativo de la distancia al centroide"""
+    eps = 1e-6
+    expected = baseline['shares'] + eps
+    actual = cluster_shares(labels, len(expected)) + eps
+    psi = float(((actual - expected) * np.log(actual / expected)).sum())
+    inertia = mean_sq_distance(rfm, labels, kmeans, scaler) / max(baseline['inertia'], eps) - 1
+    return {'psi': psi, 'inertia': inertia}
+
+
+def _baseline(rfm, labels, kmeans, scaler):
+    """Reparto por cluster y distancia media al centroide en el momento del ajuste"""
+    return {'shares': cluster_shares(labels, kmeans.n_clusters),
+            'inertia': mean_sq_distance(rfm, labels, kmeans, scaler)}
+
+
+# ============================================================================
+# INGESTA
+# ============================================================================
+
+def ingest_once(state):
+    """Una pasada: ingerir los archivos nuevos de la carpeta; None si no había"""
+    ready, modified = scan_folder(state['folder'], state['manifest'])
+    state['modified'] = modified
+    state['last_scan_at'] = time.time()
+    if not ready:
+        return None
+
+    start = time.perf_counter()
+    batch, file_stats = read_batch(ready)
+    if batch is None:
+        with state['lock']:
+            for path, version in ready:
+                state['manifest'][path] = {'version': version, 'ingested_at': time.time(), **file_stats[path]}
+        return None
+    partials, affected = update_partials(state['partials'], batch)
+    rfm = partials_to_rfm(partials)
+
+    recluster = None
+    if state['kmeans'] is None:
+        recluster = 'inicial'
+    else:
+        # Reasignar solo los clientes cuyas métricas cambiaron (nuevos o con R/F/M distinta)
+        labels = np.empty(len(rfm), dtype=np.int32)
+        known = state['rfm'].set_index('CustomerID').reindex(rfm['CustomerID'])
+        changed = (known['Cluster'].isna().to_numpy()
+                   | (known[RFM_COLUMNS].to_numpy() != rfm[RFM_COLUMNS].to_numpy()).any(axis=1))
+        labels[~changed] = known['Cluster'].to_numpy()[~changed].astype(np.int32)
+        if changed.any():
+            labels[changed] = state['kmeans'].predict(state['scaler'].transform(rfm.loc[changed, RFM_COLUMNS]))
+        reassigned = int(changed.sum())
+        drift = measure_drift(state['baseline'], rfm, labels, state['kmeans'], state['scaler'])
+        if drift['psi'] > DRIFT_PSI:
+            recluster = f"PSI {drift['psi']:.2f} > {DRIFT_PSI}"
+        elif drift['inertia'] > DRIFT_INERTIA:
+            recluster = f"distancia +{drift['inertia']:.0%} > {DRIFT_INERTIA:.0%}"
+
+    if recluster is not None:
+        labels, kmeans, scaler = fit_model(rfm, state['n_clusters'])
+        reassigned = len(rfm)
+        baseline = _baseline(rfm, labels, kmeans, scaler)
+        drift = {'psi': 0.0, 'inertia': 0.0}
+    else:
+        kmeans, scaler, baseline = state['kmeans'], state['scaler'], state['baseline']
+
+    rfm['Cluster'] = labels
+    finished_at = time.time()
+    seconds = time.perf_counter() - start
+    rows = sum(stats['rows'] for stats in file_stats.values())
+    lags = [finished_at - version[1] for _, version in ready]
+    batch_record = {
+        'finished_at': finished_at,
+        'files': len(ready),
+        'rows': rows,
+        'valid': sum(stats['valid'] for stats in file_stats.values()),
+        'customers_affected': len(affected),
+        'reassigned': reassigned,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else None,
+        'lag_seconds': max(lags),
+        'psi': drift['psi'],
+        'inertia_drift': drift['inertia'],
+        'recluster': recluster
+    }
+
+    # Publicar el nuevo estado de una vez: el dashboard lee siempre una versión completa
+    with state['lock']:
+        for path, version in ready:
+            state['manifest'][path] = {'version': version, 'ingested_at': finished_at, **file_stats[path]}
+        state['partials'] = partials
+        state['rfm'] = rfm
+        state['kmeans'], state['scaler'], state['baseline'] = kmeans, scaler, baseline
+        state['drift'] = drift
+        state['reclusters'] += recluster is not None
+        state['batches'] = (state['batches'] + [batch_record])[-BATCH_HISTORY:]
+        state['version'] += 1
+    return batch_record
+
+
+def start_live_ingest(folder, n_clusters, scan_seconds=SCAN_SECONDS):
+    """Lanzar el hilo que vigila la carpeta; devuelve el estado que se actualiza en vivo"""
+    state = {
+        'folder': folder,
+        'n_clusters': n_clusters,
+        'status': 'running',
+        'error': None,
+        'version': 0,
+        'manifest': {},
+        'modified': [],
+        'partials': None,
+        'rfm': None,
+        'kmeans': None,
+        'scaler': None,
+        'baseline': None,
+        'drift': None,
+        'reclusters': 0,
+        'batches': [],
+        'started_at': time.time(),
+        'last_scan_at': None,
+        'lock': threading.Lock(),
+        'stop': threading.Event()
+    }
+
+    def run():
+        while not state['stop'].is_set():
+            try:
+                ingest_once(state)
+                state['status'], state['error'] = 'running', None
+            except Exception as e:
+                # Un extracto roto no detiene la vigilancia: se reintenta en la siguiente pasada
+                state['status'] = 'error'
+                state['error'] = f"{type(e).__name__}: {e}"
+            state['stop'].wait(scan_seconds)
+
+    state['thread'] = threading.Thread(target=run, name='rfm-live-ingest', daemon=True)
+    state['thread'].start()
+    return state
+
+
+def get_live_ingest(folder, n_clusters):
+    """Vigilancia compartida por todas las sesiones para (carpeta, K); descarta las más antiguas"""
+    key = (os.path.abspath(folder), n_clusters)
+    with _watchers_lock:
+        state = _watchers.get(key)
+        if state is None:
+            state = _watchers[key] = start_live_ingest(key[0], n_clusters)
+            while len(_watchers) > MAX_WATCHERS:
+                oldest = next(iter(_watchers))
+                _watchers.pop(oldest)['stop'].set()
+        return state
+
+
+def live_revision(state):
+    """Huella barata de los cambios visibles (lotes publicados, archivos vistos, modificados y
+    error del vigilante) para saber si hace falta volver a leer la versión completa"""
+    with state['lock']:
+        return state['version'], len(state['manifest']), len(state['modified']), state['error']
+
+
+def live_snapshot(state):
+    """Copia coherente de la última versión publicada"""
+    with state['lock']:
+        return {
+            'version': state['version'],
+            'rfm': state['rfm'].copy() if state['rfm'] is not None else None,
+            'kmeans': state['kmeans'],
+            'scaler': state['scaler'],
+            'drift': state['drift'],
+            'reclusters': state['reclusters'],
+            'batches': list(state['batches']),
+            'files': len(state['manifest']),
+            'rows_read': sum(entry['rows'] for entry in state['manifest'].values()),
+            'rows_valid': sum(entry['valid'] for entry in state['manifest'].values()),
+            'file_errors': {path: entry['error'] for path, entry in state['manifest'].items() if entry['error']},
+            'modified': list(state['modified'])
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingerir extractos nuevos de una carpeta y mantener los segmentos")
+    parser.add_argument('--folder', required=True, help="Carpeta vigilada (CSV/Parquet)")
+    parser.add_argument('--clusters', type=int, default=4, help="Número de segmentos")
+    parser.add_argument('--scan-seconds', type=float, default=SCAN_SECONDS, help="Intervalo de revisión")
+    args = parser.parse_args()
+
+    state = start_live_ingest(os.path.abspath(args.folder), args.clusters, args.scan_seconds)
+    print(f"📡 Vigilando {state['folder']} (Ctrl+C para salir)")
+    last_seen = 0
+    try:
+        while True:
+            time.sleep(1)
+            if state['error']:
+                print(f"❌ {state['error']}")
+            for batch in [b for b in state['batches'] if b['finished_at'] > last_seen]:
+                print(f"✓ {batch['files']} archivos · {batch['rows']:,} filas · "
+                      f"{batch['customers_affected']:,} clientes afectados · {batch['reassigned']:,} reasignados · "
+                      f"retraso {batch['lag_seconds']:.1f}s · PSI {batch['psi']:.3f}"
+                      + (f" · reajuste ({batch['recluster']})" if batch['recluster'] else ""))
+                last_seen = batch['finished_at']
+    except KeyboardInterrupt:
+        state['stop'].set()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Análisis de Cesta por Segmento
+==============================
+
+Reglas de asociación entre productos ("quien compra A también compra B") para
+cada segmento, como base de las acciones de venta cruzada:
+
+1. Matriz dispersa factura × producto (CSR booleana) a partir de las líneas
+   limpias: con ~4k SKUs y decenas de miles de facturas ocupa unos pocos MB
+2. Itemsets frecuentes con FP-growth: un FP-tree comprime las facturas que
+   comparten prefijo y se minan árboles condicionales, sin generar
+   candidatos (a diferencia de Apriori o de la fuerza bruta)
+3. Reglas A → B (consecuente de un solo producto) con soporte, confianza y
+   lift, a partir de los soportes de los itemsets
+
+El soporte mínimo es relativo a las facturas de cada segmento, así que los
+segmentos pequeños no quedan sin reglas (con un piso de MIN_INVOICES facturas
+para no dar por asociación la coincidencia de dos o tres pedidos).
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MIN_SUPPORT = 0.02
+DEFAULT_MIN_CONFIDENCE = 0.3
+DEFAULT_MAX_LEN = 3
+# Facturas mínimas de un itemset aunque el soporte relativo pida menos (segmentos pequeños)
+MIN_INVOICES = 5
+
+BASKET_COLUMNS = ['CustomerID', 'InvoiceNo', 'StockCode', 'Description']
+
+
+# ============================================================================
+# MATRIZ DISPERSA
+# ============================================================================
+
+def build_basket_matrix(lines):
+    """Matriz CSR factura × producto (1 si la factura contiene el producto)"""
+    from scipy import sparse
+
+    lines = lines[BASKET_COLUMNS]
+    invoice_codes, invoice_index = pd.factorize(lines['InvoiceNo'].astype(str), sort=False)
+    product_codes, products = pd.factorize(lines['StockCode'].astype(str), sort=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(lines), dtype=np.bool_), (invoice_codes, product_codes)),
+        shape=(len(invoice_index), len(products))
+    )
+    # Líneas repetidas del mismo producto en una factura se suman: volver a 0/1
+    matrix.sum_duplicates()
+    matrix.data[:] = True
+
+    invoice_customer = lines.groupby(invoice_codes, sort=True)['CustomerID'].first().to_numpy()
+    descriptions = (lines.assign(_code=product_codes).dropna(subset=['Description'])
+                    .groupby('_code')['Description'].agg(lambda d: d.mode().iat[0])
+                    .reindex(range(len(products))).fillna('').to_numpy())
+    return {
+        'matrix': matrix,
+        'invoice_customer': invoice_customer,
+        'products': products.to_numpy(),
+        'descriptions': descriptions
+    }
+
+
+def basket_matrix_from_files(paths):
+    """Matriz factura × producto desde archivos CSV/Parquet (mismas reglas de limpieza)"""
+    from backends import read_transaction_files, clean_transactions_pandas
+    return build_basket_matrix(clean_transactions_pandas(read_transaction_files(list(paths))))
+
+
+# ============================================================================
+# FP-GROWTH
+# ============================================================================
+
+# Nodo del FP-tree: [producto, conteo, padre, hijos {producto: nodo}]
+_ITEM, _COUNT, _PARENT, _CHILDREN = range(4)
+
+
+def _build_tree(transactions, min_count):
+    """FP-tree de transacciones ponderadas [(productos, peso)]; devuelve (cabecera, conteos)"""
+    counts = {}
+    for items, weight in transactions:
+        for item in items:
+            counts[item] = counts.get(item, 0) + weight
+    frequent = {item: count for item, count in counts.items() if count >= min_count}
+    if not frequent:
+        return {}, {}
+
+    # Orden global por soporte descendente: maximiza los prefijos compartidos
+    rank = {item: position for position, item in
+            enumerate(sorted(frequent, key=lambda item: (-frequent[item], item)))}
+    root = [None, 0, None, {}]
+    header = {item: [] for item in frequent}
+    for items, weight in transactions:
+        node = root
+        for item in sorted((item for item in items if item in rank), key=rank.__getitem__):
+            child = node[_CHILDREN].get(item)
+            if child is None:
+                child = node[_CHILDREN][item] = [item, 0, node, {}]
+                header[item].append(child)
+            child[_COUNT] += weight
+            node = child
+    return header, frequent
+
+
+def _mine(header, counts, suffix, min_count, max_len, itemsets):
+    """Minar el árbol: cada producto frecuente extiende el sufijo y genera su árbol condicional"""
+    for item in sorted(counts, key=counts.__getitem__):
+        itemset = suffix + (item,)
+        itemsets[frozenset(itemset)] = counts[item]
+        if len(itemset) >= max_len:
+            continue
+
+        # Base de patrones condicional: caminos hasta la raíz de cada nodo del producto
+        conditional = []
+        for node in header[item]:
+            path = []
+            parent = node[_PARENT]
+            while parent[_ITEM] is not None:
+                path.append(parent[_ITEM])
+                parent = parent[_PARENT]
+            if path:
+                conditional.append((path, node[_COUNT]))
+
+        conditional_header, conditional_counts = _build_tree(conditional, min_count)
+        if conditional_counts:
+            _mine(conditional_header, conditional_counts, itemset, min_count, max_len, itemsets)
+
+
+def fp_growth(matrix, min_support=DEFAULT_MIN_SUPPORT, max_len=DEFAULT_MAX_LEN, min_invoices=MIN_INVOICES):
+    """Itemsets frecuentes de una matriz CSR factura × producto: {frozenset(productos): facturas}"""
+    n_invoices = matrix.shape[0]
+    if n_invoices == 0:
+        return {}
+    min_count = max(min_invoices, int(np.ceil(min_support * n_invoices)))
+
+    # Filtrar productos poco frecuentes antes de construir las transacciones
+    item_counts = np.asarray(matrix.sum(axis=0)).ravel()
+    keep = item_counts >= min_count
+    if not keep.any():
+        return {}
+    matrix = matrix[:, np.flatnonzero(keep)].tocsr()
+    original = np.flatnonzero(keep)
+
+    transactions = [(matrix.indices[start:end].tolist(), 1)
+                    for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:]) if end > start]
+    header, counts = _build_tree(transactions, min_count)
+    itemsets = {}
+    _mine(header, counts, (), min_count, max_len, itemsets)
+    return {frozenset(int(original[item]) for item in itemset): count for itemset, count in itemsets.items()}
+
+
+def association_rules(itemsets, n_invoices, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """Reglas A → b con un solo producto como consecuente, ordenadas por lift"""
+    rules = []
+    for itemset, count in itemsets.items():
+        if len(itemset) < 2:
+            continue
+        for consequent in itemset:
+            antecedent = itemset - {consequent}
+            confidence = count / itemsets[antecedent]
+            if confidence < min_confidence:
+                continue
+            rules.append({
+                'antecedent': tuple(sorted(antecedent)),
+                'consequent': consequent,
+                'support': count / n_invoices,
+                'confidence': confidence,
+                'lift': confidence / (itemsets[frozenset([consequent])] / n_invoices),
+                'invoices': count
+            })
+    rules = pd.DataFrame(rules, columns=['antecedent', 'consequent', 'support', 'confidence', 'lift', 'invoices'])
+    return rules.sort_values(['lift', 'confidence'], ascending=False, ignore_index=True)
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def _describe(basket, codes):
+    """Texto legible de uno o varios productos"""
+    return ' + '.join(f"{basket['descriptions'][code] or basket['products'][code]} ({basket['products'][code]})"
+                      for code in codes)
+
+
+def segment_basket_rules(basket, rfm, min_support=DEFAULT_MIN_SUPPORT,
+                         min_confidence=DEFAULT_MIN_CONFIDENCE, max_len=DEFAULT_MAX_LEN, top=50):
+    """Itemsets y reglas de asociación de cada segmento (facturas de sus clientes)"""
+    segment_of = rfm.set_index('CustomerID')['Segment']
+    invoice_segment = pd.Series(basket['invoice_customer']).map(segment_of).to_numpy()
+
+    results = {}
+    for segment in pd.unique(rfm['Segment']):
+        rows = np.flatnonzero(invoice_segment == segment)
+        matrix = basket['matrix'][rows]
+        itemsets = fp_growth(matrix, min_support=min_support, max_len=max_len)
+        rules = association_rules(itemsets, len(rows), min_confidence=min_confidence).head(top)
+
+        rules.insert(0, 'Si compra', [_describe(basket, codes) for codes in rules['antecedent']])
+        rules.insert(1, 'Recomendar', [_describe(basket, [code]) for code in rules['consequent']])
+        top_products = sorted(((count, next(iter(itemset))) for itemset, count in itemsets.items()
+                               if len(itemset) == 1), reverse=True)[:10]
+        results[segment] = {
+            'invoices': len(rows),
+            'itemsets': len(itemsets),
+            'max_itemset': max((len(itemset) for itemset in itemsets), default=0),
+            'rules': rules.drop(columns=['antecedent', 'consequent']),
+            'top_products': pd.DataFrame({
+                'Producto': [_describe(basket, [code]) for _, code in top_products],
+                'Soporte': [count / max(len(rows), 1) for count, _ in top_products]
+            })
+        }
+    return results
+
+
+def basket_matrix_stats(basket):
+    """Tamaño y densidad de la matriz factura × producto"""
+    matrix = basket['matrix']
+    cells = matrix.shape[0] * matrix.shape[1]
+    return {
+        'invoices': matrix.shape[0],
+        'products': matrix.shape[1],
+        'nonzero': int(matrix.nnz),
+        'density': matrix.nnz / cells if cells else 0.0,
+        'megabytes': (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1024**2
+    }
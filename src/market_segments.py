@@ -0,0 +1,216 @@
+"""
+Segmentación por Mercado en Paralelo
+====================================
+
+En Online Retail ~90% de los clientes son de Reino Unido, así que el K-Means
+sobre los datos agregados apenas ve los mercados pequeños. Este módulo ejecuta
+el pipeline completo (limpieza → RFM → K-Means) de forma independiente para
+cada país con suficientes clientes; los demás se agrupan en "Otros países".
+
+Las columnas de las transacciones se codifican una sola vez como arrays
+numéricos y se copian, ordenadas por mercado, a bloques de memoria compartida
+(el mismo esquema que `parallel.sharded_rfm`): cada proceso lee el rango de su
+mercado sin recibir DataFrames serializados. Los mercados se lanzan del más
+grande al más pequeño, así que el tiempo total se acerca al del mercado más
+grande (Reino Unido) en cuanto hay tantos núcleos como mercados grandes.
+
+La fecha de referencia de la recencia es la del dataset completo, para que los
+centroides de distintos mercados sean comparables.
+"""
+
+import os
+import time
+from concurrent.futures import as_completed, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from parallel import _NS_PER_DAY, _aggregate_shard, create_block, default_workers, get_pool, rfm_frame
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+# Clientes mínimos para segmentar un país por separado
+DEFAULT_MIN_CUSTOMERS = 50
+OTHER_MARKETS = 'Otros países'
+
+
+# ============================================================================
+# PIPELINE DE UN MERCADO
+# ============================================================================
+
+def _clean_mask(customers, cancelled, quantity, price):
+    """Mismas reglas que clean_transactions: cliente conocido, sin cancelaciones, cantidad y precio positivos"""
+    return ~np.isnan(customers) & ~cancelled & (quantity > 0) & (price > 0)
+
+
+def _segment_market(customers, invoices, cancelled, dates, quantity, price, reference, n_clusters):
+    """Limpieza, RFM y K-Means de las transacciones de un mercado"""
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import KMeans
+
+    start = time.perf_counter()
+    valid = _clean_mask(customers, cancelled, quantity, price)
+    rfm = rfm_frame(*_aggregate_shard(customers[valid], invoices[valid], dates[valid],
+                                      quantity[valid] * price[valid]), reference)
+
+    # Mercados con menos clientes que segmentos: un segmento por cliente
+    n_clusters = min(n_clusters, len(rfm))
+    if n_clusters:
+        # Mismo modelo que fit_clustering en el dashboard
+        rfm_scaled = StandardScaler().fit_transform(rfm[RFM_COLUMNS])
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        rfm['Cluster'] = kmeans.fit_predict(rfm_scaled)
+        inertia = float(kmeans.inertia_)
+    else:
+        rfm['Cluster'] = np.zeros(0, dtype=np.int32)
+        inertia = 0.0
+
+    return {
+        'rfm': rfm,
+        'rows': int(valid.sum()),
+        'inertia': inertia,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def _market_worker(specs, threads, start, stop, reference, n_clusters):
+    """Proceso hijo: leer el rango de su mercado de los bloques compartidos y segmentarlo"""
+    from threadpoolctl import threadpool_limits
+
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [np.ndarray((length,), dtype=dtype, buffer=block.buf)[start:stop]
+                  for block, (_, dtype, length) in zip(blocks, specs)]
+        # Un hilo de BLAS/OpenMP por proceso: evita sobresuscribir los núcleos
+        with threadpool_limits(threads):
+            result = _segment_market(*arrays, reference, n_clusters)
+        del arrays
+    finally:
+        for block in blocks:
+            block.close()
+    return result
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def encode_transactions(df):
+    """Columnas numéricas de las transacciones crudas (una sola conversión para todos los mercados)"""
+    invoice_codes, invoice_index = pd.factorize(df['InvoiceNo'].astype(str))
+    # Cancelación por factura distinta, no por línea
+    cancelled = np.asarray(pd.Index(invoice_index).str.startswith('C'), dtype=np.bool_)[invoice_codes]
+    return {
+        'customers': pd.to_numeric(df['CustomerID'], errors='coerce').to_numpy(dtype=np.float64),
+        'invoices': invoice_codes.astype(np.int64),
+        'cancelled': cancelled,
+        'dates': pd.to_datetime(df['InvoiceDate']).to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'quantity': pd.to_numeric(df['Quantity'], errors='coerce').to_numpy(dtype=np.float64),
+        'price': pd.to_numeric(df['UnitPrice'], errors='coerce').to_numpy(dtype=np.float64)
+    }
+
+
+def market_groups(countries, customers, valid, min_customers=DEFAULT_MIN_CUSTOMERS):
+    """Mercado de cada fila: el país si tiene `min_customers` clientes válidos, si no OTHER_MARKETS"""
+    countries = pd.Series(countries, copy=False).astype(str).to_numpy()
+    counts = pd.Series(customers[valid]).groupby(countries[valid]).nunique()
+    own = counts.index[counts >= min_customers]
+    return np.where(np.isin(countries, own), countries, OTHER_MARKETS)
+
+
+def segment_markets(df, n_clusters=4, min_customers=DEFAULT_MIN_CUSTOMERS, n_workers=None, on_progress=None):
+    """Segmentar cada mercado por separado en el pool de procesos
+
+    `on_progress(hechos, total)` se llama al terminar cada mercado; si lanza una
+    excepción se cancelan los mercados pendientes.
+    """
+    start = time.perf_counter()
+    n_workers = n_workers or default_workers()
+    on_progress = on_progress or (lambda done, total: None)
+
+    columns = encode_transactions(df)
+    valid = _clean_mask(columns['customers'], columns['cancelled'], columns['quantity'], columns['price'])
+    if not valid.any():
+        raise ValueError("No hay transacciones válidas para segmentar por mercado")
+    # Fecha de referencia común: última compra del dataset + 1 día
+    reference = int(columns['dates'][valid].max()) + _NS_PER_DAY
+
+    groups = market_groups(df['Country'].to_numpy(), columns['customers'], valid, min_customers)
+    market_codes, markets = pd.factorize(groups, sort=True)
+    order = np.argsort(market_codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(market_codes, minlength=len(markets)))])
+    # Del mercado más grande al más pequeño: el grande no queda para el final
+    plan = sorted(range(len(markets)), key=lambda i: bounds[i] - bounds[i + 1])
+
+    n_rows = len(df)
+    results = {}
+    if n_workers == 1:
+        ordered = {name: np.take(values, order) for name, values in columns.items()}
+        for done, i in enumerate(plan, start=1):
+            results[markets[i]] = _segment_market(
+                *(values[bounds[i]:bounds[i + 1]] for values in ordered.values()), reference, n_clusters
+            )
+            on_progress(done, len(plan))
+    else:
+        blocks = []
+        futures = {}
+        try:
+            specs = []
+            for values in columns.values():
+                block, shared = create_block(values.dtype, n_rows)
+                blocks.append(block)
+                # Copiar directamente en memoria compartida ya ordenado por mercado
+                np.take(values, order, out=shared)
+                del shared
+                specs.append((block.name, values.dtype.str, n_rows))
+
+            threads = max(1, (os.cpu_count() or 1) // n_workers)
+            pool = get_pool(n_workers)
+            futures = {pool.submit(_market_worker, specs, threads, int(bounds[i]), int(bounds[i + 1]),
+                                   reference, n_clusters): markets[i]
+                       for i in plan}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                on_progress(done, len(plan))
+        finally:
+            # Ningún mercado puede seguir leyendo los bloques cuando se liberan
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # Orden de presentación: mercados por número de clientes (sin los que no tienen ninguno válido)
+    results = dict(sorted(((market, result) for market, result in results.items() if len(result['rfm'])),
+                          key=lambda item: -len(item[1]['rfm'])))
+    return {
+        'markets': results,
+        'min_customers': min_customers,
+        'workers': n_workers,
+        'largest_seconds': max(result['seconds'] for result in results.values()),
+        'seconds': time.perf_counter() - start
+    }
+
+
+def compare_markets(markets):
+    """Mezcla de segmentos y centroides (en unidades originales) de cada mercado con columna Segment"""
+    mix = []
+    centers = []
+    for market, result in markets.items():
+        rfm = result['rfm']
+        shares = rfm['Segment'].value_counts(normalize=True)
+        mix.append(shares.rename(market))
+
+        grouped = rfm.groupby(['Cluster', 'Segment'])
+        center = grouped[RFM_COLUMNS].mean()
+        center['Customers'] = grouped.size()
+        center['Share'] = center['Customers'] / len(rfm)
+        centers.append(center.reset_index().assign(Market=market))
+
+    mix = pd.DataFrame(mix).fillna(0.0)
+    mix.index.name = 'Market'
+    centers = pd.concat(centers, ignore_index=True)[['Market', 'Cluster', 'Segment', 'Customers', 'Share']
+                                                     + RFM_COLUMNS]
+    return mix, centers
@@ -0,0 +1,169 @@
+"""
+RFM Multinúcleo por Shards de CustomerID
+========================================
+
+Reparte las transacciones limpias entre un pool de procesos según el hash de
+CustomerID: todas las compras de un cliente caen en el mismo shard, así que cada
+proceso calcula el RFM de sus clientes de forma independiente y los resultados
+solo se concatenan.
+
+Las columnas necesarias (cliente, factura codificada, fecha y monto) se copian
+una sola vez, ya ordenadas por shard, a bloques de memoria compartida; los
+procesos leen su rango sin recibir DataFrames serializados. Cada proceso
+devuelve solo la tabla de sus clientes.
+"""
+
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Número de procesos del modo multinúcleo (por defecto todos los núcleos)
+WORKERS_ENV = 'RFM_WORKERS'
+
+_NS_PER_DAY = 86_400 * 10**9
+
+# Pools reutilizados entre llamadas (arrancar procesos cuesta más que un shard pequeño)
+_pools = {}
+
+
+def default_workers():
+    """Procesos configurados en RFM_WORKERS o número de núcleos"""
+    workers = os.environ.get(WORKERS_ENV)
+    return max(1, int(workers)) if workers else (os.cpu_count() or 1)
+
+
+def get_pool(n_workers):
+    """Pool de procesos con arranque 'spawn' (seguro dentro del servidor multihilo)"""
+    pool = _pools.get(n_workers)
+    if pool is None:
+        pool = _pools[n_workers] = ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context('spawn'))
+    return pool
+
+
+@atexit.register
+def shutdown_pools():
+    """Cerrar los pools de procesos"""
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+
+# ============================================================================
+# MEMORIA COMPARTIDA
+# ============================================================================
+
+def create_block(dtype, length):
+    """Bloque de memoria compartida con un array de `length` elementos"""
+    block = shared_memory.SharedMemory(create=True, size=max(np.dtype(dtype).itemsize * length, 1))
+    return block, np.ndarray((length,), dtype=dtype, buffer=block.buf)
+
+
+# ============================================================================
+# CÁLCULO POR SHARD
+# ============================================================================
+
+def _aggregate_shard(customers, invoices, dates, amounts):
+    """RFM parcial de un shard: (clientes, última fecha ns, facturas, gasto, primera fecha ns)"""
+    shard = pd.DataFrame({
+        'CustomerID': customers,
+        'Invoice': invoices,
+        'Date': dates,
+        'Amount': amounts
+    })
+    grouped = shard.groupby('CustomerID', sort=False).agg(
+        Last=('Date', 'max'),
+        Frequency=('Invoice', 'nunique'),
+        Monetary=('Amount', 'sum'),
+        First=('Date', 'min')
+    )
+    return (grouped.index.to_numpy(), grouped['Last'].to_numpy(),
+            grouped['Frequency'].to_numpy(), grouped['Monetary'].to_numpy(), grouped['First'].to_numpy())
+
+
+def _shard_worker(specs, start, stop):
+    """Proceso hijo: leer su rango de los bloques compartidos y agregarlo"""
+    # Los hijos comparten el resource tracker del proceso principal, que es quien
+    # libera los bloques
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [np.ndarray((length,), dtype=dtype, buffer=block.buf)[start:stop]
+                  for block, (_, dtype, length) in zip(blocks, specs)]
+        result = _aggregate_shard(*arrays)
+        del arrays
+    finally:
+        for block in blocks:
+            block.close()
+    return result
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def shard_assignments(customers, n_shards):
+    """Shard de cada fila según el hash de CustomerID"""
+    return (pd.util.hash_array(customers) % np.uint64(n_shards)).astype(np.int64)
+
+
+def sharded_rfm(df_clean, n_workers=None):
+    """Tabla RFM calculada en `n_workers` procesos (mismo resultado que pandas)"""
+    n_workers = n_workers or default_workers()
+    n_rows = len(df_clean)
+
+    customers = df_clean['CustomerID'].to_numpy(dtype=np.float64)
+    columns = [
+        ('customers', customers),
+        ('invoices', pd.factorize(df_clean['InvoiceNo'])[0].astype(np.int64)),
+        ('dates', df_clean['InvoiceDate'].to_numpy(dtype='datetime64[ns]').view(np.int64)),
+        ('amounts', df_clean['TotalAmount'].to_numpy(dtype=np.float64)),
+    ]
+
+    if n_workers == 1 or n_rows == 0:
+        # Sin pool: referencia del coste del propio algoritmo por shards
+        parts = [_aggregate_shard(*(values for _, values in columns))]
+    else:
+        shards = shard_assignments(customers, n_workers)
+        order = np.argsort(shards, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(shards, minlength=n_workers))])
+
+        blocks = []
+        try:
+            specs = []
+            for _, values in columns:
+                block, shared = create_block(values.dtype, n_rows)
+                blocks.append(block)
+                # Copiar directamente en memoria compartida ya ordenado por shard
+                np.take(values, order, out=shared)
+                del shared
+                specs.append((block.name, values.dtype.str, n_rows))
+
+            pool = get_pool(n_workers)
+            futures = [pool.submit(_shard_worker, specs, int(bounds[i]), int(bounds[i + 1]))
+                       for i in range(n_workers) if bounds[i + 1] > bounds[i]]
+            parts = [future.result() for future in futures]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    ids, last, frequency, monetary, first = (np.concatenate(values) for values in zip(*parts))
+
+    # Fecha de referencia global: última compra + 1 día (igual que compute_rfm)
+    reference = last.max() + _NS_PER_DAY if len(last) else 0
+    return rfm_frame(ids, last, frequency, monetary, first, reference)
+
+
+def rfm_frame(ids, last, frequency, monetary, first, reference):
+    """Tabla RFM a partir de los agregados por cliente (fechas en ns) y la fecha de referencia"""
+    rfm = pd.DataFrame({
+        'CustomerID': ids,
+        'Recency': (reference - last) // _NS_PER_DAY,
+        'Frequency': frequency.astype(np.int64),
+        'Monetary': monetary,
+        'Tenure': (reference - first) // _NS_PER_DAY
+    })
+    return rfm.sort_values('CustomerID', ignore_index=True)
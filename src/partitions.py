@@ -0,0 +1,227 @@
+"""
+Particiones Mensuales de Transacciones
+======================================
+
+Almacena el histórico de transacciones particionado por mes de factura en
+archivos Parquet (una carpeta `month=YYYY-MM` por mes) y calcula RFM sin cargar
+todo el histórico en memoria:
+
+1. Solo se leen las particiones que se solapan con el rango de fechas pedido
+2. Cada partición produce agregados parciales por cliente: última compra,
+   número de facturas y gasto
+3. Los parciales se combinan (max / suma / suma) en la tabla RFM final
+
+Una factura tiene una única fecha, así que pertenece a una sola partición y los
+conteos de facturas por partición se pueden sumar sin duplicar.
+
+Crear particiones desde un archivo grande:
+
+    python src/partitions.py --input data/retail.parquet --output data/partitions
+"""
+
+import argparse
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from backends import RFM_OUTPUT_COLUMNS, clean_transactions_pandas, rfm_from_files
+
+PARTITION_PREFIX = 'month='
+
+# Columnas necesarias para RFM (se leen solo estas de cada partición)
+RFM_INPUT_COLUMNS = ['InvoiceNo', 'Quantity', 'InvoiceDate', 'UnitPrice', 'CustomerID']
+
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+
+def iter_source_chunks(path, chunk_rows=1_000_000):
+    """Leer un archivo CSV, Parquet o Excel en bloques"""
+    path = str(path)
+    if path.lower().endswith('.csv'):
+        yield from pd.read_csv(path, dtype={'InvoiceNo': str}, chunksize=chunk_rows)
+    elif path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield pd.read_excel(path)
+
+
+def write_partitions(chunks, root):
+    """Escribir bloques de transacciones particionados por mes; devuelve filas por mes"""
+    root = Path(root)
+    rows_per_month = {}
+
+    for chunk in chunks:
+        chunk = chunk.copy()
+        chunk['InvoiceDate'] = pd.to_datetime(chunk['InvoiceDate'])
+        chunk['InvoiceNo'] = chunk['InvoiceNo'].astype(str)
+        months = chunk['InvoiceDate'].dt.strftime('%Y-%m')
+
+        for month, part in chunk.groupby(months, sort=True):
+            folder = root / f'{PARTITION_PREFIX}{month}'
+            folder.mkdir(parents=True, exist_ok=True)
+            # Nombre único por bloque: se pueden añadir archivos nuevos sin reescribir
+            tmp_path = folder / f'.part-{uuid.uuid4().hex}.parquet.tmp'
+            part.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, folder / f'part-{uuid.uuid4().hex}.parquet')
+            rows_per_month[month] = rows_per_month.get(month, 0) + len(part)
+
+    return rows_per_month
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+
+def list_partitions(root):
+    """Meses disponibles con sus archivos: {'2011-01': [rutas...]}"""
+    root = Path(root)
+    partitions = {}
+    if not root.is_dir():
+        return partitions
+    for folder in sorted(root.glob(f'{PARTITION_PREFIX}*')):
+        files = sorted(str(p) for p in folder.glob('*.parquet'))
+        if folder.is_dir() and files:
+            partitions[folder.name[len(PARTITION_PREFIX):]] = files
+    return partitions
+
+
+def partition_versions(partitions):
+    """Huella (tamaño y fecha de modificación) de los archivos de las particiones"""
+    return tuple(
+        (path, os.path.getsize(path), os.path.getmtime(path))
+        for files in partitions.values() for path in files
+    )
+
+
+def month_bounds(month):
+    """Primer instante del mes y del mes siguiente"""
+    start = pd.Timestamp(f'{month}-01')
+    return start, start + pd.offsets.MonthBegin(1)
+
+
+def date_range(partitions):
+    """Primer y último día (fechas inclusivas) cubiertos por las particiones"""
+    months = list(partitions)
+    return month_bounds(months[0])[0].date(), (month_bounds(months[-1])[1] - timedelta(days=1)).date()
+
+
+def select_partitions(partitions, start=None, end=None):
+    """Particiones que se solapan con [start, end] (fechas inclusivas)"""
+    start = pd.Timestamp(start) if start is not None else None
+    end_exclusive = pd.Timestamp(end) + timedelta(days=1) if end is not None else None
+
+    selected = {}
+    for month, files in partitions.items():
+        month_start, month_end = month_bounds(month)
+        if start is not None and month_end <= start:
+            continue
+        if end_exclusive is not None and month_start >= end_exclusive:
+            continue
+        selected[month] = files
+    return selected
+
+
+def customer_partials(df_clean):
+    """Agregados parciales por cliente: última compra, número de facturas, gasto y primera compra"""
+    return df_clean.groupby('CustomerID').agg(
+        LastPurchaseDate=('InvoiceDate', 'max'),
+        NumPurchases=('InvoiceNo', 'nunique'),
+        TotalSpent=('TotalAmount', 'sum'),
+        FirstPurchaseDate=('InvoiceDate', 'min')
+    )
+
+
+def merge_partials(partials):
+    """Combinar agregados parciales de bloques disjuntos de facturas (max / suma / suma / min)"""
+    return pd.concat(partials).groupby(level=0).agg(
+        LastPurchaseDate=('LastPurchaseDate', 'max'),
+        NumPurchases=('NumPurchases', 'sum'),
+        TotalSpent=('TotalSpent', 'sum'),
+        FirstPurchaseDate=('FirstPurchaseDate', 'min')
+    )
+
+
+def _partial_rfm(files, start, end_exclusive):
+    """Agregados parciales por cliente de una partición"""
+    df = pd.concat([pd.read_parquet(path, columns=RFM_INPUT_COLUMNS) for path in files],
+                   ignore_index=True)
+    df_clean = clean_transactions_pandas(df)
+
+    if start is not None:
+        df_clean = df_clean[df_clean['InvoiceDate'] >= start]
+    if end_exclusive is not None:
+        df_clean = df_clean[df_clean['InvoiceDate'] < end_exclusive]
+
+    return customer_partials(df_clean), len(df), len(df_clean)
+
+
+def rfm_from_partitions(root, start=None, end=None, backend='pandas'):
+    """RFM desde particiones mensuales leyendo solo los meses del rango.
+    Devuelve (rfm, estadísticas)."""
+    partitions = select_partitions(list_partitions(root), start, end)
+    if not partitions:
+        raise FileNotFoundError("No hay particiones en el rango seleccionado")
+
+    start = pd.Timestamp(start) if start is not None else None
+    end_exclusive = pd.Timestamp(end) + timedelta(days=1) if end is not None else None
+    stats = {'partitions_read': len(partitions)}
+
+    if backend == 'duckdb':
+        # DuckDB procesa los archivos en streaming con el filtro de fechas empujado a la lectura
+        paths = [path for files in partitions.values() for path in files]
+        rfm, file_stats = rfm_from_files(paths, backend='duckdb', start=start, end_exclusive=end_exclusive)
+        return rfm, {**stats, **file_stats}
+
+    # Una partición en memoria a la vez; solo se conservan los parciales por cliente
+    partials = []
+    rows_read = rows_valid = 0
+    for files in partitions.values():
+        partial, n_read, n_valid = _partial_rfm(files, start, end_exclusive)
+        partials.append(partial)
+        rows_read += n_read
+        rows_valid += n_valid
+
+    merged = merge_partials(partials).reset_index()
+
+    if merged.empty:
+        raise ValueError("No hay transacciones válidas en el rango seleccionado")
+
+    # Fecha de referencia: última compra del rango + 1 día (igual que compute_rfm)
+    reference_date = merged['LastPurchaseDate'].max() + timedelta(days=1)
+    merged['Recency'] = (reference_date - merged['LastPurchaseDate']).dt.days
+    merged['Frequency'] = merged['NumPurchases'].astype(np.int64)
+    merged['Monetary'] = merged['TotalSpent']
+    merged['Tenure'] = (reference_date - merged['FirstPurchaseDate']).dt.days
+
+    stats.update({'rows_read': rows_read, 'rows_valid': rows_valid})
+    return merged[RFM_OUTPUT_COLUMNS].copy(), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Particionar transacciones por mes de factura")
+    parser.add_argument('--input', nargs='+', required=True, help="Archivos CSV, Parquet o Excel de origen")
+    parser.add_argument('--output', required=True, help="Carpeta raíz de las particiones")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help="Filas por bloque de lectura")
+    args = parser.parse_args()
+
+    def chunks():
+        for path in args.input:
+            yield from iter_source_chunks(path, args.chunk_rows)
+
+    rows_per_month = write_partitions(chunks(), args.output)
+    total = sum(rows_per_month.values())
+    print(f"✓ {total:,} transacciones escritas en {len(rows_per_month)} particiones mensuales ({args.output})")
+    for month, rows in sorted(rows_per_month.items()):
+        print(f"  {month}: {rows:,}")
+
+
+if __name__ == '__main__':
+    main()
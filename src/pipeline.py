@@ -0,0 +1,409 @@
+"""
+Pipeline de Segmentación
+========================
+
+Etapas del pipeline que comparten el dashboard y las herramientas de línea de
+comandos (exportación, snapshots, benchmarks, precalentamiento), sin depender
+de Streamlit: lectura del archivo, tabla RFM, K-Means con sus nombres de
+segmento, barrido de K, árbol de decisión explicativo y contexto del chatbot.
+La limpieza y la agregación por motor viven en backends.py; el dashboard solo
+añade encima sus cachés y la interfaz.
+"""
+
+import pandas as pd
+
+from backends import aggregate_rfm
+from invoices import aggregate_rfm_invoices
+from rfm_scoring import QUANTILE_OPTIONS, query_score_cube
+
+# Valores por defecto de los controles del dashboard (el precalentamiento usa los mismos)
+DEFAULT_N_CLUSTERS = 4
+TREE_DEFAULTS = {'max_depth': 4, 'min_samples_split': 100, 'min_samples_leaf': 50}
+
+
+# ============================================================================
+# DATOS Y RFM
+# ============================================================================
+
+def load_data(file):
+    """Cargar datos desde archivo Excel, CSV o Parquet"""
+    name = getattr(file, 'name', str(file)).lower()
+    if name.endswith('.csv'):
+        return pd.read_csv(file, dtype={'InvoiceNo': str})
+    if name.endswith('.parquet'):
+        return pd.read_parquet(file)
+    return pd.read_excel(file)
+
+
+def compute_rfm(df_clean, backend='pandas', invoices=None):
+    """Tabla RFM (con pandas, sobre la tabla de facturas si está disponible)"""
+    if invoices is not None and backend == 'pandas':
+        return aggregate_rfm_invoices(invoices)
+    return aggregate_rfm(df_clean, backend=backend)
+
+
+# ============================================================================
+# CLUSTERING
+# ============================================================================
+
+def fit_clustering(rfm, n_clusters=4):
+    """Normalizar y ajustar K-Means; devuelve (clusters, modelo, scaler)"""
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import KMeans
+
+    # Normalizar
+    scaler = StandardScaler()
+    rfm_scaled = scaler.fit_transform(rfm[['Recency', 'Frequency', 'Monetary']])
+    
+    # K-Means
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    return kmeans.fit_predict(rfm_scaled), kmeans, scaler
+
+
+def assign_segment_names(rfm):
+    """Asignar nombres descriptivos a los segmentos"""
+    cluster_avg = rfm.groupby('Cluster')[['Recency', 'Frequency', 'Monetary']].mean()
+    
+    segment_names = {}
+    for cluster_id in rfm['Cluster'].unique():
+        recency = cluster_avg.loc[cluster_id, 'Recency']
+        frequency = cluster_avg.loc[cluster_id, 'Frequency']
+        monetary = cluster_avg.loc[cluster_id, 'Monetary']
+        
+        if recency < 50 and frequency > 5 and monetary > 2000:
+            name = 'Champions'
+        elif recency < 100 and frequency > 3 and monetary > 1000:
+            name = 'Loyal Customers'
+        elif recency > 200 and frequency < 3:
+            name = 'At Risk'
+        else:
+            name = 'Occasional Buyers'
+        
+        segment_names[cluster_id] = name
+    
+    rfm['Segment'] = rfm['Cluster'].map(segment_names)
+    
+    return rfm, segment_names
+
+
+def train_decision_tree(rfm, max_depth=4, min_samples_split=100, min_samples_leaf=50):
+    """Entrenar árbol de decisión explicativo"""
+    from sklearn.tree import DecisionTreeClassifier
+
+    X = rfm[['Recency', 'Frequency', 'Monetary']]
+    y = rfm['Cluster']
+    
+    tree_model = DecisionTreeClassifier(
+        max_depth=max_depth,
+        min_samples_split=min_samples_split,
+        min_samples_leaf=min_samples_leaf,
+        random_state=42
+    )
+    
+    tree_model.fit(X, y)
+    
+    # Calcular predicciones y métricas
+    y_pred = tree_model.predict(X)
+    
+    return tree_model, X, y, y_pred
+
+
+def evaluate_clustering(rfm_scaled, max_k=10, on_progress=None):
+    """Evaluar diferentes valores de K para clustering"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    K_range = range(2, max_k + 1)
+    inertias = []
+    silhouette_scores_list = []
+    
+    for k in K_range:
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+        labels = kmeans.fit_predict(rfm_scaled)
+        inertias.append(kmeans.inertia_)
+        silhouette_scores_list.append(silhouette_score(rfm_scaled, labels))
+        if on_progress is not None:
+            on_progress(len(inertias), len(K_range), f"K = {k}")
+    
+    return K_range, inertias, silhouette_scores_list
+
+
+# ============================================================================
+# CONTEXTO DEL CHATBOT
+# ============================================================================
+
+def build_chatbot_context(profile, score_cube=None):
+    """Generar contexto completo sobre TODOS los análisis para el chatbot"""
+    
+    n_quantiles = score_cube['n_quantiles'] if score_cube is not None else 4
+    quantile_label = QUANTILE_OPTIONS.get(n_quantiles, f'{n_quantiles} cuantiles').lower()
+    
+    # Resumen de scores leído del cubo precalculado
+    scores_summary = ""
+    if score_cube is not None:
+        q = n_quantiles
+        best_customers, best_revenue = query_score_cube(score_cube, (q, q), (q, q), (q, q))
+        worst_customers, worst_revenue = query_score_cube(score_cube, (1, 1), (1, 1), (1, 1))
+        lapsed_customers, lapsed_revenue = query_score_cube(score_cube, (1, 2), (q - 1, q), (q - 1, q))
+        scores_summary = f"""
+DISTRIBUCIÓN DE SCORES RFM:
+- RFM_Score {q}{q}{q} (mejores clientes): {best_customers:,} clientes, £{best_revenue:,.2f}
+- RFM_Score 111 (menor valor): {worst_customers:,} clientes, £{worst_revenue:,.2f}
+- R_Score bajo con F/M altos (valiosos que se alejan): {lapsed_customers:,} clientes, £{lapsed_revenue:,.2f}
+"""
+    
+    clusters = profile['clusters']
+    segments = profile['segments']
+    overall = profile['overall']
+    total_customers = profile['total_customers']
+    n_clusters = len(clusters)
+    recency, frequency, monetary = overall['Recency'], overall['Frequency'], overall['Monetary']
+    
+    # ===== RESUMEN GENERAL =====
+    context = f"""Eres streetviewer, un asistente experto en análisis de segmentación de clientes para retail online.
+Tienes acceso a TODO el análisis completo del dashboard con 7 pestañas.
+
+═══════════════════════════════════════════════════════════
+📊 RESUMEN GENERAL DEL ANÁLISIS
+═══════════════════════════════════════════════════════════
+- Total de clientes: {total_customers:,}
+- Número de segmentos: {n_clusters}
+- Segmentos identificados: {', '.join(sorted(segments.index))}
+- Algoritmo de clustering: K-Means con K={n_clusters}
+- Método de segmentación: Análisis RFM + Machine Learning
+
+═══════════════════════════════════════════════════════════
+📈 ANÁLISIS EXPLORATORIO DE DATOS (EDA)
+═══════════════════════════════════════════════════════════
+
+DISTRIBUCIONES PRINCIPALES:
+- Recency: Rango {recency['min']:.0f} - {recency['max']:.0f} días
+  · Mediana: {recency['median']:.0f} días
+  · Desv. estándar: {recency['std']:.0f} días
+  
+- Frequency: Rango {frequency['min']:.0f} - {frequency['max']:.0f} compras
+  · Mediana: {frequency['median']:.1f} compras
+  · Desv. estándar: {frequency['std']:.1f} compras
+  · Clientes con 1 sola compra: {overall['single_purchase']} ({overall['single_purchase']/total_customers*100:.1f}%)
+  
+- Monetary: Rango £{monetary['min']:,.2f} - £{monetary['max']:,.2f}
+  · Mediana: £{monetary['median']:,.2f}
+  · Desv. estándar: £{monetary['std']:,.2f}
+  · Ingreso total: £{monetary['sum']:,.2f}
+
+CORRELACIONES RFM:
+- Frequency vs Monetary: Alta correlación positiva (clientes frecuentes gastan más)
+- Recency vs Frequency: Correlación negativa moderada (clientes activos compran más)
+- Recency vs Monetary: Correlación negativa (clientes recientes gastan más)
+
+═══════════════════════════════════════════════════════════
+🎯 ANÁLISIS RFM DETALLADO
+═══════════════════════════════════════════════════════════
+
+MÉTRICAS GLOBALES:
+- Recency promedio: {recency['mean']:.0f} días (último contacto)
+- Frequency promedio: {frequency['mean']:.1f} compras por cliente
+- Monetary promedio: £{monetary['mean']:,.2f} por cliente
+- Ticket promedio: £{monetary['sum']/frequency['sum']:,.2f} por compra
+
+SEGMENTACIÓN RFM:
+El análisis divide a los clientes en {quantile_label} (Q1-Q{n_quantiles}) para cada métrica:
+- R_Score: {n_quantiles} = compradores muy recientes, 1 = inactivos
+- F_Score: {n_quantiles} = muy frecuentes, 1 = ocasionales  
+- M_Score: {n_quantiles} = alto valor, 1 = bajo valor
+- RFM_Score: Concatenación de los tres scores
+{scores_summary}
+═══════════════════════════════════════════════════════════
+🔍 CLUSTERING K-MEANS (K={n_clusters})
+═══════════════════════════════════════════════════════════
+
+CARACTERÍSTICAS DE LOS CLUSTERS:"""
+    
+    # Análisis detallado por cluster
+    for cluster_id, cluster_data in clusters.iterrows():
+        context += f"""
+
+Cluster {cluster_id} - {cluster_data['Segment']}:
+- Tamaño: {cluster_data['Customers']:,} clientes ({cluster_data['CustomerShare']*100:.1f}%)
+- Centroide RFM:
+  · Recency: {cluster_data['Recency_mean']:.0f} días
+  · Frequency: {cluster_data['Frequency_mean']:.1f} compras
+  · Monetary: £{cluster_data['Monetary_mean']:,.2f}
+- Valor total: £{cluster_data['Monetary_sum']:,.2f} ({cluster_data['RevenueShare']*100:.1f}% del total)
+- Valor por cliente: £{cluster_data['Monetary_mean']:,.2f}"""
+    
+    # Interpretación de segmentos
+    context += """
+
+═══════════════════════════════════════════════════════════
+👥 INTERPRETACIÓN DE SEGMENTOS
+═══════════════════════════════════════════════════════════
+"""
+    
+    # Análisis detallado de cada segmento
+    segment_strategies = {
+        'Champions': {
+            'perfil': 'Mejores clientes - Compran frecuente y recientemente, gastan mucho',
+            'comportamiento': 'Altamente comprometidos, alta lealtad, embajadores de marca',
+            'estrategia': 'Recompensas VIP, programa de fidelización premium, early access a productos',
+            'riesgo': 'Bajo - Mantener satisfacción',
+            'prioridad': 'MÁXIMA'
+        },
+        'Loyal Customers': {
+            'perfil': 'Clientes leales - Compran con regularidad, buen valor',
+            'comportamiento': 'Consistentes, responden bien a comunicaciones',
+            'estrategia': 'Upselling/cross-selling, programas de puntos, contenido exclusivo',
+            'riesgo': 'Bajo-Medio - Proteger de competencia',
+            'prioridad': 'ALTA'
+        },
+        'Potential Loyalist': {
+            'perfil': 'Potencial leal - Clientes recientes con buena frecuencia',
+            'comportamiento': 'En fase de adopción, responden a incentivos',
+            'estrategia': 'Nutrición de relación, ofertas personalizadas, onboarding mejorado',
+            'riesgo': 'Medio - Vulnerable a competencia',
+            'prioridad': 'ALTA'
+        },
+        'Recent Customers': {
+            'perfil': 'Nuevos compradores - Primera/segunda compra reciente',
+            'comportamiento': 'Explorando la marca, formando opiniones',
+            'estrategia': 'Welcome series, educación de producto, incentivos para segunda compra',
+            'riesgo': 'Alto - No establecido vínculo',
+            'prioridad': 'MEDIA-ALTA'
+        },
+        'Promising': {
+            'perfil': 'Prometedores - Compradores recientes con potencial',
+            'comportamiento': 'Interesados pero necesitan activación',
+            'estrategia': 'Ofertas especiales, recomendaciones personalizadas, engagement campaigns',
+            'riesgo': 'Medio-Alto - Necesitan activación',
+            'prioridad': 'MEDIA'
+        },
+        'Need Attention': {
+            'perfil': 'Requieren atención - Antes activos, ahora decayendo',
+            'comportamiento': 'Disminuyendo frecuencia, en riesgo de pérdida',
+            'estrategia': 'Campañas de reactivación, encuestas de feedback, ofertas win-back',
+            'riesgo': 'Alto - Pérdida inminente',
+            'prioridad': 'ALTA'
+        },
+        'About to Sleep': {
+            'perfil': 'A punto de dormir - Inactividad prolongada',
+            'comportamiento': 'Alejándose de la marca, posible insatisfacción',
+            'estrategia': 'Campañas agresivas de reengagement, descuentos significativos',
+            'riesgo': 'Muy Alto - Casi perdidos',
+            'prioridad': 'MEDIA'
+        },
+        'At Risk': {
+            'perfil': 'En riesgo - Buenos clientes que no compran hace tiempo',
+            'comportamiento': 'Desconectados, alto valor histórico en juego',
+            'estrategia': 'Contacto directo, ofertas personalizadas VIP, recuperación urgente',
+            'riesgo': 'CRÍTICO - Alto valor en riesgo',
+            'prioridad': 'MÁXIMA'
+        },
+        'Cannot Lose Them': {
+            'perfil': 'No podemos perderlos - Clientes de alto valor inactivos',
+            'comportamiento': 'Antes top customers, ahora inactivos - ALERTA ROJA',
+            'estrategia': 'Intervención directa CEO/gerencia, ofertas ultra-premium, recuperación a cualquier costo',
+            'riesgo': 'CRÍTICO - Pérdida de alto impacto',
+            'prioridad': 'EMERGENCIA'
+        },
+        'Hibernating': {
+            'perfil': 'Hibernando - Largo tiempo sin actividad',
+            'comportamiento': 'Muy probablemente perdidos, bajo engagement',
+            'estrategia': 'Win-back campaigns de bajo costo, ofertas masivas, último intento',
+            'riesgo': 'Muy Alto - Probablemente perdidos',
+            'prioridad': 'BAJA'
+        },
+        'Lost': {
+            'perfil': 'Perdidos - Sin actividad reciente, bajo valor histórico',
+            'comportamiento': 'Churn completo, muy baja probabilidad de retorno',
+            'estrategia': 'Campañas masivas de bajo costo, focus en adquisición nueva',
+            'riesgo': 'Máximo - Churn completo',
+            'prioridad': 'MUY BAJA'
+        }
+    }
+    
+    for segment, segment_data in segments.sort_index().iterrows():
+        info = segment_strategies.get(segment, {})
+        
+        context += f"""
+
+🏷️ {segment.upper()}
+{'-' * 60}
+- Tamaño: {segment_data['Customers']:,.0f} clientes ({segment_data['CustomerShare']*100:.1f}%)
+- Perfil: {info.get('perfil', 'N/A')}
+- Comportamiento: {info.get('comportamiento', 'N/A')}
+- Estrategia recomendada: {info.get('estrategia', 'N/A')}
+- Nivel de riesgo: {info.get('riesgo', 'N/A')}
+- Prioridad: {info.get('prioridad', 'N/A')}
+
+Métricas clave:
+- Recency media: {segment_data['Recency_mean']:.0f} días
+- Frequency media: {segment_data['Frequency_mean']:.1f} compras
+- Monetary medio: £{segment_data['Monetary_mean']:,.2f}
+- Valor total: £{segment_data['Monetary_sum']:,.2f}
+- ROI potencial: {'ALTO' if segment in ['Champions', 'Loyal Customers', 'Cannot Lose Them', 'At Risk'] else 'MEDIO' if segment in ['Potential Loyalist', 'Need Attention'] else 'BAJO'}"""
+    
+    context += """
+
+═══════════════════════════════════════════════════════════
+🌳 ÁRBOL DE DECISIÓN - REGLAS DE CLASIFICACIÓN
+═══════════════════════════════════════════════════════════
+
+El modelo de árbol de decisión genera reglas interpretables para clasificar clientes:
+- Entradas: Recency, Frequency, Monetary (escaladas)
+- Salida: Predicción de segmento
+- Parámetros optimizables: max_depth, min_samples_split, min_samples_leaf
+
+INTERPRETACIÓN DE REGLAS:
+Las reglas del árbol muestran los umbrales exactos de RFM que definen cada segmento.
+Ejemplo: "Si Recency <= 50 días Y Frequency > 5 compras → Champions"
+
+MÉTRICAS DEL MODELO:
+- Accuracy: Mide precisión general de clasificación
+- Confusion Matrix: Muestra aciertos/errores por segmento
+- Feature Importance: Recency suele ser la más influyente
+
+═══════════════════════════════════════════════════════════
+💡 INSIGHTS ACCIONABLES
+═══════════════════════════════════════════════════════════
+
+1. PRIORIZACIÓN DE RECURSOS:
+   - MÁXIMA: Champions, At Risk, Cannot Lose Them
+   - ALTA: Loyal Customers, Potential Loyalist, Need Attention
+   - MEDIA: Recent Customers, Promising, About to Sleep
+   - BAJA: Hibernating, Lost
+
+2. OPTIMIZACIÓN DE PRESUPUESTO:
+   - 60% en retención de alto valor (Champions, Loyal, At Risk)
+   - 25% en desarrollo (Potential Loyalist, Recent)
+   - 15% en recuperación (Need Attention, Cannot Lose)
+
+3. MÉTRICAS A MONITOREAR:
+   - Tasa de migración entre segmentos
+   - CLV (Customer Lifetime Value) por segmento
+   - Churn rate en segmentos de riesgo
+   - Efectividad de campañas por segmento
+
+═══════════════════════════════════════════════════════════
+🎯 TU MISIÓN COMO STREETVIEWER
+═══════════════════════════════════════════════════════════
+
+Debes ayudar a los usuarios a:
+1. ✅ Entender CUALQUIER aspecto del análisis completo (7 pestañas)
+2. ✅ Interpretar métricas RFM, clusters, y reglas del árbol
+3. ✅ Tomar decisiones estratégicas basadas en datos
+4. ✅ Diseñar campañas específicas por segmento
+5. ✅ Optimizar presupuestos de marketing
+6. ✅ Identificar oportunidades y riesgos
+7. ✅ Explicar el análisis a stakeholders no técnicos
+
+ESTILO DE RESPUESTA:
+- 🎯 Claro y conciso, orientado a negocios
+- 📊 Fundamentado en los datos proporcionados arriba
+- 💼 Lenguaje profesional pero accesible
+- 🇪🇸 Siempre en español
+- 💡 Proactivo: sugiere insights adicionales relevantes
+- 🔢 Usa números específicos del análisis cuando sea posible
+
+¡Ahora tienes CONTEXTO COMPLETO del dashboard entero! 🚀"""
+    
+    return context
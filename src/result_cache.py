@@ -0,0 +1,398 @@
+"""
+Caché de Resultados en Disco
+============================
+
+Segunda capa, debajo de `@st.cache_data`, para los resultados del pipeline
+(datos leídos, transacciones limpias, RFM, modelos, barridos...). Vive en
+disco local y la comparten todas las sesiones y todos los procesos del
+servidor: dos analistas que suben el mismo libro, o el mismo analista tras un
+reinicio, reutilizan el resultado.
+
+- Direccionada por contenido: la clave es un SHA-256 de la etapa, del código
+  del que depende la función y de sus argumentos sin `_` (la misma convención
+  que `st.cache_data`; los argumentos `_` van acompañados de una huella). El
+  código incluye las funciones del mismo módulo que llama y el fuente de los
+  módulos del proyecto que usa, con sus imports: cambiar la lógica de
+  `backends.py`, `segment_profile.py`... invalida las entradas que dependen de él
+- Índice SQLite (`index.sqlite`, modo WAL) con tamaño, creación, último acceso
+  y coste de cálculo de cada entrada, más aciertos y fallos por etapa
+- Escrituras atómicas: archivo temporal en la misma carpeta y `os.replace`
+- Presupuesto total (`RFM_CACHE_MAX_MB`, 0 desactiva la caché): al superarlo
+  se eliminan las entradas usadas hace más tiempo (LRU); las entradas más
+  antiguas que `RFM_CACHE_TTL_HOURS` se tratan como fallo y se borran
+
+Uso:
+    python src/result_cache.py --stats
+    python src/result_cache.py --clear
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+CACHE_DIR_ENV = 'RFM_CACHE_DIR'
+CACHE_MAX_MB_ENV = 'RFM_CACHE_MAX_MB'
+CACHE_TTL_HOURS_ENV = 'RFM_CACHE_TTL_HOURS'
+
+DEFAULT_CACHE_DIR = 'data/cache'
+DEFAULT_MAX_MB = 2048
+DEFAULT_TTL_HOURS = 7 * 24
+
+# Cambiar al modificar el formato de las entradas (invalida la caché completa);
+# los cambios de lógica del proyecto ya cambian la clave (ver code_digest).
+# 2: las tablas RFM calculadas desde transacciones incluyen Tenure
+CACHE_FORMAT = 2
+
+# Carpeta de los módulos del proyecto cuyo código forma parte de la clave
+_SOURCE_DIR = Path(__file__).resolve().parent
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    compute_seconds REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    stage TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    saved_seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+
+def cache_root():
+    """Carpeta de la caché (RFM_CACHE_DIR o data/cache)"""
+    return Path(os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+
+
+def cache_budget_bytes():
+    """Tamaño máximo de la caché en bytes (0 = desactivada)"""
+    return int(float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024)
+
+
+def cache_ttl_seconds():
+    """Antigüedad máxima de una entrada en segundos"""
+    return float(os.environ.get(CACHE_TTL_HOURS_ENV, DEFAULT_TTL_HOURS)) * 3600
+
+
+def _connect(root):
+    """Conexión al índice (una por operación: seguro entre hilos y procesos)"""
+    root.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(root / 'index.sqlite', timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _object_path(root, key):
+    return root / 'objects' / key[:2] / f'{key}.pkl'
+
+
+def _count(conn, stage, hits=0, misses=0, saved_seconds=0.0):
+    """Sumar aciertos, fallos y segundos ahorrados de una etapa"""
+    conn.execute(
+        "INSERT INTO stats (stage, hits, misses, saved_seconds) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(stage) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses, "
+        "saved_seconds = saved_seconds + excluded.saved_seconds",
+        (stage, hits, misses, saved_seconds)
+    )
+
+
+# ============================================================================
+# LECTURA Y ESCRITURA
+# ============================================================================
+
+_MISS = object()
+
+
+def cache_get(stage, key):
+    """Valor guardado para `key` (o `_MISS`); actualiza el último acceso y las estadísticas"""
+    root = cache_root()
+    path = _object_path(root, key)
+    try:
+        with closing(_connect(root)) as conn:
+            row = conn.execute("SELECT created_at, compute_seconds FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+            value = _MISS
+            if row is not None and time.time() - row[0] <= cache_ttl_seconds():
+                try:
+                    with open(path, 'rb') as f:
+                        value = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                    value = _MISS
+            if value is _MISS:
+                if row is not None:
+                    # Caducada, borrada por otro proceso o ilegible
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    path.unlink(missing_ok=True)
+                _count(conn, stage, misses=1)
+            else:
+                conn.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                             (time.time(), key))
+                _count(conn, stage, hits=1, saved_seconds=row[1])
+            return value
+    except sqlite3.Error:
+        return _MISS
+
+
+def cache_put(stage, key, value, compute_seconds=0.0):
+    """Guardar un valor de forma atómica y aplicar el presupuesto; False si no se guardó"""
+    budget = cache_budget_bytes()
+    root = cache_root()
+    path = _object_path(root, key)
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Temporal en la misma carpeta: os.replace es atómico y nadie lee un archivo a medias
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as f:
+            tmp_path = Path(f.name)
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = tmp_path.stat().st_size
+        if size > budget:
+            tmp_path.unlink()
+            return False
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with closing(_connect(root)) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, stage, size, compute_seconds, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, size, compute_seconds, now, now)
+            )
+            _evict(conn, root, budget)
+        return True
+    except (OSError, sqlite3.Error, pickle.PicklingError, TypeError, AttributeError):
+        # La caché en disco es una optimización: un fallo no interrumpe el pipeline
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def _evict(conn, root, budget):
+    """Borrar entradas caducadas y, si se supera el presupuesto, las menos usadas recientemente"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        expired = [key for (key,) in conn.execute("SELECT key FROM entries WHERE created_at < ?",
+                                                   (time.time() - cache_ttl_seconds(),))]
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        evicted = []
+        if total > budget:
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= budget:
+                    break
+                evicted.append(key)
+                total -= size
+        removed = list(dict.fromkeys(expired + evicted))
+        conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in removed])
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        conn.execute('ROLLBACK')
+        raise
+    for key in removed:
+        _object_path(root, key).unlink(missing_ok=True)
+
+
+# ============================================================================
+# DECORADOR
+# ============================================================================
+
+def content_key(data):
+    """Huella SHA-256 de un contenido en bytes (p. ej. un archivo subido)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _project_module(name):
+    """Ruta del módulo del proyecto con ese nombre (None si no es del proyecto)"""
+    path = _SOURCE_DIR / f"{name.split('.')[0]}.py"
+    return path if path.is_file() else None
+
+
+def _code_names(code):
+    """Nombres globales, atributos e imports de un código (con sus funciones anidadas y lambdas)"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _module_imports(path):
+    """Módulos del proyecto que importa un archivo (también los imports dentro de funciones)"""
+    names = set()
+    for node in ast.walk(ast.parse(path.read_text(encoding='utf-8'))):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return {path for path in map(_project_module, names) if path is not None}
+
+
+def code_digest(func):
+    """Huella del código del que depende una función: su fuente, las funciones de su
+    módulo que llama y los módulos del proyecto que usa (con sus imports)"""
+    sources = []
+    modules = set()
+    pending, seen = [func], set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        sources.append(inspect.getsource(current))
+        for name in sorted(_code_names(current.__code__)):
+            path = _project_module(name)
+            if path is not None:
+                modules.add(path)
+                continue
+            # Las funciones cacheadas del mismo módulo se siguen a través de sus decoradores
+            target = current.__globals__.get(name)
+            if callable(target) and hasattr(target, '__wrapped__'):
+                target = inspect.unwrap(target)
+            owner = getattr(target, '__module__', None)
+            if inspect.isfunction(target) and owner == func.__module__:
+                pending.append(target)
+            elif owner is not None and _project_module(owner) is not None:
+                modules.add(_project_module(owner))
+
+    # Cierre transitivo: los módulos que importan los módulos usados
+    pending = list(modules)
+    while pending:
+        for path in _module_imports(pending.pop()) - modules:
+            modules.add(path)
+            pending.append(path)
+
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(source.encode())
+    for path in sorted(modules):
+        digest.update(path.name.encode() + b'\0' + path.read_bytes())
+    return digest.hexdigest()
+
+
+def disk_cached(stage):
+    """Cachear en disco el resultado de una etapa según sus argumentos sin `_`"""
+    def decorator(func):
+        signature = inspect.signature(func)
+        # Se calcula en la primera llamada: las funciones que usa pueden definirse después
+        digest = functools.cache(lambda: code_digest(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if cache_budget_bytes() <= 0:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            hashed = [(name, value) for name, value in bound.arguments.items() if not name.startswith('_')]
+            # El código del que depende la etapa forma parte de la clave: cambiarlo invalida sus entradas
+            key = content_key(pickle.dumps((CACHE_FORMAT, stage, digest(), hashed), protocol=4))
+
+            value = cache_get(stage, key)
+            if value is not _MISS:
+                return value
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            cache_put(stage, key, value, time.perf_counter() - start)
+            return value
+
+        return wrapper
+    return decorator
+
+
+# ============================================================================
+# ESTADÍSTICAS
+# ============================================================================
+
+def cache_stats():
+    """Ocupación de la caché y aciertos/fallos por etapa (acumulados entre procesos)"""
+    root = cache_root()
+    empty = {'entries': 0, 'bytes': 0, 'budget_bytes': cache_budget_bytes(), 'hits': 0, 'misses': 0,
+             'hit_rate': None, 'saved_seconds': 0.0, 'stages': pd.DataFrame()}
+    if not (root / 'index.sqlite').exists():
+        return empty
+
+    with closing(_connect(root)) as conn:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        stages = pd.read_sql_query(
+            "SELECT s.stage AS Etapa, s.hits AS Aciertos, s.misses AS Fallos, "
+            "s.saved_seconds AS Segundos_ahorrados, COUNT(e.key) AS Entradas, COALESCE(SUM(e.size), 0) AS Bytes "
+            "FROM stats s LEFT JOIN entries e ON e.stage = s.stage GROUP BY s.stage ORDER BY s.stage",
+            conn
+        )
+
+    hits, misses = int(stages['Aciertos'].sum()), int(stages['Fallos'].sum())
+    stages['Tasa_aciertos'] = stages['Aciertos'] / (stages['Aciertos'] + stages['Fallos']).where(lambda n: n > 0)
+    return {
+        **empty,
+        'entries': entries,
+        'bytes': size,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else None,
+        'saved_seconds': float(stages['Segundos_ahorrados'].sum()),
+        'stages': stages
+    }
+
+
+def clear_cache():
+    """Vaciar entradas, archivos y estadísticas"""
+    root = cache_root()
+    if not (root / 'index.sqlite').exists():
+        return
+    with closing(_connect(root)) as conn:
+        keys = [key for (key,) in conn.execute("SELECT key FROM entries")]
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM stats")
+    for key in keys:
+        _object_path(root, key).unlink(missing_ok=True)
+
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Estadísticas y limpieza de la caché de resultados en disco")
+    parser.add_argument('--stats', action='store_true', help="Mostrar ocupación y aciertos por etapa")
+    parser.add_argument('--clear', action='store_true', help="Vaciar la caché")
+    args = parser.parse_args()
+
+    if args.clear:
+        clear_cache()
+        print(f"✓ Caché vaciada ({cache_root()})")
+
+    stats = cache_stats()
+    print(f"Caché: {cache_root()} · {stats['entries']:,} entradas · "
+          f"{stats['bytes'] / 1024**2:.1f} de {stats['budget_bytes'] / 1024**2:.0f} MB")
+    if stats['hit_rate'] is not None:
+        print(f"Aciertos: {stats['hits']:,} de {stats['hits'] + stats['misses']:,} "
+              f"({stats['hit_rate']:.1%}) · {stats['saved_seconds']:.1f}s de cálculo ahorrados")
+    if args.stats and not stats['stages'].empty:
+        print(stats['stages'].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
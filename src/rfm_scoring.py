@@ -0,0 +1,130 @@
+"""
+Scoring RFM por Cuantiles
+=========================
+
+Asigna a cada cliente R_Score, F_Score y M_Score (1 = peor, q = mejor) y el
+RFM_Score concatenado, usando rangos calculados con NumPy sobre la tabla
+completa (sin bucles por cliente).
+
+También precalcula un cubo de conteos e ingresos sobre todas las combinaciones
+de scores (q x q x q), de forma que filtrar clientes por score sea una consulta
+sobre un array pequeño y no un recorrido de la tabla RFM.
+"""
+
+import numpy as np
+
+# Métodos de desempate soportados (mismo significado que en pandas.rank)
+TIE_METHODS = ('average', 'min', 'max', 'first')
+
+# Escalas disponibles en el dashboard
+QUANTILE_OPTIONS = {4: 'Cuartiles', 5: 'Quintiles'}
+
+
+def rank_values(values, ties='average'):
+    """Calcular rangos 1..n de un vector con el tratamiento de empates indicado"""
+    if ties not in TIE_METHODS:
+        raise ValueError(f"Método de desempate no soportado: {ties}")
+
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+
+    if ties == 'first':
+        # Empates resueltos por orden de aparición (argsort estable)
+        order = np.argsort(values, kind='stable')
+        ranks = np.empty(n, dtype=float)
+        ranks[order] = np.arange(1, n + 1)
+        return ranks
+
+    # Cada grupo de valores iguales ocupa las posiciones [inicio, fin]
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    starts = ends - counts + 1
+
+    if ties == 'min':
+        return starts[inverse].astype(float)
+    if ties == 'max':
+        return ends[inverse].astype(float)
+    return ((starts + ends) / 2.0)[inverse]
+
+
+def quantile_scores(values, n_quantiles=4, ties='average', higher_is_better=True):
+    """Convertir valores en scores 1..n_quantiles según su rango percentil"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n == 0:
+        return np.empty(0, dtype=np.int8)
+
+    # Para Recency los valores bajos son mejores: se invierte el orden
+    ranks = rank_values(values if higher_is_better else -values, ties=ties)
+
+    scores = np.ceil(ranks * n_quantiles / n)
+    return np.clip(scores, 1, n_quantiles).astype(np.int8)
+
+
+def score_rfm(rfm, n_quantiles=4, ties='average'):
+    """Añadir R_Score, F_Score, M_Score y RFM_Score a la tabla RFM"""
+    if n_quantiles < 2 or n_quantiles > 9:
+        raise ValueError("n_quantiles debe estar entre 2 y 9")
+
+    rfm['R_Score'] = quantile_scores(rfm['Recency'].to_numpy(), n_quantiles, ties,
+                                     higher_is_better=False)
+    rfm['F_Score'] = quantile_scores(rfm['Frequency'].to_numpy(), n_quantiles, ties)
+    rfm['M_Score'] = quantile_scores(rfm['Monetary'].to_numpy(), n_quantiles, ties)
+
+    # Concatenación de los tres dígitos (ej: "444")
+    codes = (rfm['R_Score'].astype(np.int16) * 100
+             + rfm['F_Score'].astype(np.int16) * 10
+             + rfm['M_Score'].astype(np.int16))
+    rfm['RFM_Score'] = codes.astype(str)
+
+    return rfm
+
+
+def build_score_cube(rfm, n_quantiles=4):
+    """Precalcular conteos e ingresos para todas las combinaciones R x F x M"""
+    q = n_quantiles
+    r = rfm['R_Score'].to_numpy(dtype=np.int64) - 1
+    f = rfm['F_Score'].to_numpy(dtype=np.int64) - 1
+    m = rfm['M_Score'].to_numpy(dtype=np.int64) - 1
+
+    # Índice plano de la celda de cada cliente
+    cell = (r * q + f) * q + m
+
+    counts = np.bincount(cell, minlength=q ** 3).reshape(q, q, q)
+    revenue = np.bincount(cell, weights=rfm['Monetary'].to_numpy(dtype=float),
+                          minlength=q ** 3).reshape(q, q, q)
+
+    return {
+        'n_quantiles': q,
+        'counts': counts,
+        'revenue': revenue
+    }
+
+
+def _score_slice(score_range, n_quantiles):
+    """Convertir un rango de scores (min, max) inclusivo en un slice del cubo"""
+    if score_range is None:
+        return slice(0, n_quantiles)
+    low, high = score_range
+    return slice(max(int(low), 1) - 1, min(int(high), n_quantiles))
+
+
+def query_score_cube(cube, r_range=None, f_range=None, m_range=None):
+    """Clientes e ingreso total dentro de los rangos de scores indicados"""
+    q = cube['n_quantiles']
+    index = (_score_slice(r_range, q), _score_slice(f_range, q), _score_slice(m_range, q))
+
+    customers = int(cube['counts'][index].sum())
+    revenue = float(cube['revenue'][index].sum())
+
+    return customers, revenue
+
+
+def score_mask(rfm, r_range=None, f_range=None, m_range=None):
+    """Máscara booleana de los clientes dentro de los rangos de scores"""
+    mask = np.ones(len(rfm), dtype=bool)
+    for column, score_range in (('R_Score', r_range), ('F_Score', f_range), ('M_Score', m_range)):
+        if score_range is not None:
+            values = rfm[column].to_numpy()
+            mask &= (values >= score_range[0]) & (values <= score_range[1])
+    return mask
@@ -0,0 +1,270 @@
+"""
+Cubo de Ventas País × Mes × Segmento
+====================================
+
+Precalcula, una vez por segmentación, las ventas agregadas por país, mes de
+factura y segmento para que los filtros de país y periodo del dashboard sean
+consultas sobre arrays pequeños y no un nuevo recorrido de las transacciones:
+
+1. Actividad por (cliente, país, mes): facturas, ingreso y unidades. Es la
+   única pasada sobre las líneas y se cachea por dataset (no depende de la
+   segmentación)
+2. Cubo denso países × meses × segmentos con facturas, ingreso y unidades
+   (np.bincount sobre el índice plano de la celda, igual que el cubo de scores)
+3. Matriz dispersa cliente × (país, mes) de actividad: los clientes distintos
+   no se pueden sumar entre celdas (un cliente que compra en varios meses se
+   contaría varias veces), así que se cuentan las filas activas de las columnas
+   seleccionadas
+
+Una factura tiene una sola fecha y un solo país, así que sus facturas, ingresos
+y unidades se suman sin duplicar entre celdas.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+ACTIVITY_COLUMNS = ['CustomerID', 'Country', 'Month', 'Invoices', 'Revenue', 'Quantity']
+CUBE_MEASURES = ['Customers', 'Invoices', 'Revenue', 'Quantity']
+
+
+# ============================================================================
+# ACTIVIDAD POR CLIENTE, PAÍS Y MES
+# ============================================================================
+
+def customer_activity(df_clean):
+    """Facturas, ingreso y unidades por (cliente, país, mes) desde las líneas limpias"""
+    # Mes como datetime64[M]: agrupar por entero es mucho más rápido que por texto
+    month = pd.Series(df_clean['InvoiceDate'].to_numpy().astype('datetime64[M]'),
+                      index=df_clean.index, name='Month')
+    activity = df_clean.groupby(
+        [df_clean['CustomerID'], df_clean['Country'].astype(str), month], sort=True, observed=True
+    ).agg(
+        Invoices=('InvoiceNo', 'nunique'),
+        Revenue=('TotalAmount', 'sum'),
+        Quantity=('Quantity', 'sum')
+    ).reset_index()
+    activity['Month'] = np.datetime_as_string(activity['Month'].to_numpy().astype('datetime64[M]'), unit='M')
+    return _compact(activity)
+
+
+def _compact(activity):
+    """Tipos compactos de la tabla de actividad (país y mes como categorías)"""
+    activity = activity[ACTIVITY_COLUMNS].copy()
+    activity['CustomerID'] = activity['CustomerID'].astype(float)
+    activity['Country'] = activity['Country'].astype('category')
+    activity['Month'] = activity['Month'].astype('category')
+    activity['Invoices'] = activity['Invoices'].astype(np.int32)
+    activity['Revenue'] = activity['Revenue'].astype(float)
+    activity['Quantity'] = activity['Quantity'].astype(np.int64)
+    return activity
+
+
+_ACTIVITY_SQL = """
+    SELECT
+        CAST(CustomerID AS DOUBLE) AS CustomerID,
+        CAST(Country AS VARCHAR) AS Country,
+        strftime(CAST(InvoiceDate AS TIMESTAMP), '%Y-%m') AS Month,
+        COUNT(DISTINCT CAST(InvoiceNo AS VARCHAR)) AS Invoices,
+        SUM(Quantity * UnitPrice) AS Revenue,
+        SUM(Quantity) AS Quantity
+    FROM {source}
+    WHERE {clean_filter} {date_filter}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+"""
+
+
+def activity_from_files(paths, backend='duckdb', start=None, end_exclusive=None):
+    """Actividad por cliente, país y mes directamente desde archivos CSV/Parquet;
+    con DuckDB se agrega durante la lectura. Opcionalmente solo [start, end_exclusive)."""
+    from backends import (_CLEAN_FILTER_SQL, _check_backend, _connect, _file_source_sql,
+                          clean_transactions_pandas, read_transaction_files)
+    _check_backend(backend)
+    if not paths:
+        raise FileNotFoundError("No se encontraron archivos CSV/Parquet")
+
+    if backend != 'duckdb':
+        df_clean = clean_transactions_pandas(read_transaction_files(list(paths)))
+        if start is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] >= start]
+        if end_exclusive is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] < end_exclusive]
+        return customer_activity(df_clean)
+
+    date_filter = ''
+    if start is not None:
+        date_filter += f" AND CAST(InvoiceDate AS TIMESTAMP) >= TIMESTAMP '{pd.Timestamp(start)}'"
+    if end_exclusive is not None:
+        date_filter += f" AND CAST(InvoiceDate AS TIMESTAMP) < TIMESTAMP '{pd.Timestamp(end_exclusive)}'"
+
+    connection = _connect()
+    try:
+        activity = connection.execute(_ACTIVITY_SQL.format(
+            source=_file_source_sql(list(paths)), clean_filter=_CLEAN_FILTER_SQL, date_filter=date_filter
+        )).df()
+    finally:
+        connection.close()
+    return _compact(activity)
+
+
+def activity_from_partitions(root, start=None, end=None, backend='pandas'):
+    """Actividad desde particiones mensuales leyendo solo los meses del rango (fechas inclusivas)"""
+    from backends import clean_transactions_pandas
+    from partitions import RFM_INPUT_COLUMNS, list_partitions, select_partitions
+
+    partitions = select_partitions(list_partitions(root), start, end)
+    if not partitions:
+        raise FileNotFoundError("No hay particiones en el rango seleccionado")
+    start = pd.Timestamp(start) if start is not None else None
+    end_exclusive = pd.Timestamp(end) + timedelta(days=1) if end is not None else None
+
+    if backend == 'duckdb':
+        paths = [path for files in partitions.values() for path in files]
+        return activity_from_files(paths, backend='duckdb', start=start, end_exclusive=end_exclusive)
+
+    # Una partición en memoria a la vez; cada mes aporta filas disjuntas de actividad
+    frames = []
+    for files in partitions.values():
+        df = pd.concat([pd.read_parquet(path, columns=RFM_INPUT_COLUMNS + ['Country']) for path in files],
+                       ignore_index=True)
+        df_clean = clean_transactions_pandas(df)
+        if start is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] >= start]
+        if end_exclusive is not None:
+            df_clean = df_clean[df_clean['InvoiceDate'] < end_exclusive]
+        frames.append(customer_activity(df_clean).astype({'Country': str, 'Month': str}))
+    return _compact(pd.concat(frames, ignore_index=True))
+
+
+# ============================================================================
+# CUBO
+# ============================================================================
+
+def build_sales_cube(activity, rfm):
+    """Cubo denso país × mes × segmento y matriz dispersa de actividad por cliente"""
+    from scipy import sparse
+
+    segment_of = rfm.set_index('CustomerID')['Segment']
+    activity = activity[activity['CustomerID'].isin(segment_of.index)]
+    segments = np.sort(pd.unique(rfm['Segment']).astype(str))
+
+    country_codes, countries = pd.factorize(activity['Country'].astype(str), sort=True)
+    month_codes, months = pd.factorize(activity['Month'].astype(str), sort=True)
+    customer_codes, customer_ids = pd.factorize(activity['CustomerID'], sort=True)
+    customer_segment = np.searchsorted(segments, segment_of.reindex(customer_ids).astype(str).to_numpy())
+
+    shape = (len(countries), len(months), len(segments))
+    n_cells = int(np.prod(shape))
+    # Índice plano de la celda de cada fila de actividad
+    cell = (country_codes * shape[1] + month_codes) * shape[2] + customer_segment[customer_codes]
+
+    def measure(column, dtype):
+        weights = activity[column].to_numpy(dtype=float)
+        values = np.bincount(cell, weights=weights, minlength=n_cells).reshape(shape)
+        return values if dtype is float else np.rint(values).astype(dtype)
+
+    # Cada fila es un (cliente, país, mes) distinto: su conteo son los clientes de la celda
+    cube = {
+        'Customers': np.bincount(cell, minlength=n_cells).reshape(shape).astype(np.int32),
+        'Invoices': measure('Invoices', np.int32),
+        'Revenue': measure('Revenue', float),
+        'Quantity': measure('Quantity', np.int64)
+    }
+
+    # CSC: filtrar por país y mes es seleccionar columnas
+    activity_matrix = sparse.csc_matrix(
+        (np.ones(len(activity), dtype=np.bool_), (customer_codes, country_codes * shape[1] + month_codes)),
+        shape=(len(customer_ids), shape[0] * shape[1])
+    )
+
+    return {
+        'countries': countries.to_numpy(),
+        'months': months.to_numpy(),
+        'segments': segments,
+        'measures': cube,
+        'activity': activity_matrix,
+        'customer_segment': customer_segment.astype(np.int32)
+    }
+
+
+def _selection(cube, countries=None, month_range=None):
+    """Índices de países y meses seleccionados (vacío o None = todos; meses inclusivos)"""
+    country_index = np.arange(len(cube['countries']))
+    if countries:
+        country_index = np.flatnonzero(np.isin(cube['countries'], list(countries)))
+
+    months = cube['months']
+    month_index = np.arange(len(months))
+    if month_range is not None:
+        low, high = month_range
+        month_index = month_index[np.searchsorted(months, low, 'left'):np.searchsorted(months, high, 'right')]
+    return country_index, month_index
+
+
+def _active_customers(cube, country_index, month_index):
+    """Filas de cliente y (país, mes) de cada celda activa dentro de la selección"""
+    n_months = len(cube['months'])
+    columns = (country_index[:, None] * n_months + month_index[None, :]).ravel()
+    matrix = cube['activity'][:, columns]
+    column_of = np.repeat(columns, np.diff(matrix.indptr))
+    return matrix.indices, column_of // n_months, column_of % n_months
+
+
+def query_sales_cube(cube, countries=None, month_range=None):
+    """Totales, segmentos, meses y países dentro de la selección de países y periodo"""
+    segments = cube['segments']
+    n_segments = len(segments)
+    country_index, month_index = _selection(cube, countries, month_range)
+    index = np.ix_(country_index, month_index)
+    sliced = {name: cube['measures'][name][index] for name in CUBE_MEASURES[1:]}
+
+    # Clientes distintos: pares únicos de la matriz de actividad (no suma de celdas)
+    rows, country_of, month_of = _active_customers(cube, country_index, month_index)
+    segment_of = cube['customer_segment']
+    customers = np.unique(rows)
+    by_country = np.unique(rows.astype(np.int64) * len(cube['countries']) + country_of)
+    by_month = np.unique(rows.astype(np.int64) * len(cube['months']) + month_of)
+
+    by_segment = pd.DataFrame({
+        'Customers': np.bincount(segment_of[customers], minlength=n_segments),
+        **{name: values.sum(axis=(0, 1)) for name, values in sliced.items()}
+    }, index=pd.Index(segments, name='Segment'))
+
+    month_customers = np.bincount(
+        (by_month % len(cube['months'])) * n_segments + segment_of[by_month // len(cube['months'])],
+        minlength=len(cube['months']) * n_segments
+    ).reshape(len(cube['months']), n_segments)[month_index]
+    monthly = pd.DataFrame({
+        'Month': np.repeat(cube['months'][month_index], n_segments),
+        'Segment': np.tile(segments, len(month_index)),
+        'Customers': month_customers.ravel(),
+        **{name: values.sum(axis=0).ravel() for name, values in sliced.items()}
+    })
+
+    country_customers = np.bincount(by_country % len(cube['countries']),
+                                    minlength=len(cube['countries']))[country_index]
+    by_country = pd.DataFrame({
+        'Customers': country_customers,
+        **{name: values.sum(axis=(1, 2)) for name, values in sliced.items()}
+    }, index=pd.Index(cube['countries'][country_index], name='Country'))
+
+    return {
+        'totals': {'Customers': len(customers),
+                   **{name: values.sum().item() for name, values in sliced.items()}},
+        'segments': by_segment,
+        'months': monthly,
+        'countries': by_country.sort_values('Revenue', ascending=False)
+    }
+
+
+def sales_cube_stats(cube):
+    """Tamaño del cubo denso y de la matriz de actividad"""
+    matrix = cube['activity']
+    dense_bytes = sum(values.nbytes for values in cube['measures'].values())
+    return {
+        'cells': int(cube['measures']['Revenue'].size),
+        'active_cells': int(matrix.nnz),
+        'megabytes': (dense_bytes + matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1024**2
+    }
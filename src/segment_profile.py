@@ -0,0 +1,92 @@
+"""
+Perfil de Segmentos
+===================
+
+Estadísticas por cluster y por segmento calculadas con una agregación
+agrupada sobre la tabla RFM (más las medianas por segmento, que no se pueden
+combinar a partir de las de cada cluster). Todas las pestañas, la sección de insights y el
+contexto del chatbot leen de esta estructura en lugar de volver a filtrar la
+tabla completa por cada segmento.
+"""
+
+import numpy as np
+import pandas as pd
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+
+def _frame_key(frame):
+    """Huella barata de una tabla a partir de los hashes de sus filas"""
+    hashed = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    # Suma y xor de los hashes por fila como resumen compacto
+    return f"{len(frame)}-{int(hashed.sum(dtype=np.uint64)):x}-{int(np.bitwise_xor.reduce(hashed)):x}"
+
+
+def _metric_columns(rfm):
+    """Columnas de métricas de la huella (Tenure solo si la fuente la calcula)"""
+    return ['CustomerID'] + RFM_COLUMNS + (['Tenure'] if 'Tenure' in rfm else [])
+
+
+def segmentation_key(rfm):
+    """Huella barata de una segmentación (clientes, métricas y asignaciones)"""
+    return _frame_key(rfm[_metric_columns(rfm) + ['Cluster', 'Segment']])
+
+
+def rfm_key(rfm):
+    """Huella de la tabla RFM antes de segmentar (clientes y métricas)"""
+    return _frame_key(rfm[_metric_columns(rfm)])
+
+
+def build_segment_profile(rfm):
+    """Calcular el perfil de clusters y segmentos en una sola pasada agrupada"""
+    aggregations = {'Segment': ('Segment', 'first'), 'Customers': ('Recency', 'size')}
+    for column in RFM_COLUMNS:
+        aggregations[f'{column}_mean'] = (column, 'mean')
+        aggregations[f'{column}_median'] = (column, 'median')
+        aggregations[f'{column}_sum'] = (column, 'sum')
+
+    clusters = rfm.groupby('Cluster', sort=True).agg(**aggregations)
+    # Las medianas no se combinan entre clusters: se calculan también por segmento
+    segment_medians = rfm.groupby('Segment')[RFM_COLUMNS].median().add_suffix('_median')
+
+    total_customers = int(clusters['Customers'].sum())
+    total_revenue = float(clusters['Monetary_sum'].sum())
+
+    clusters['CustomerShare'] = clusters['Customers'] / total_customers
+    clusters['RevenueShare'] = clusters['Monetary_sum'] / total_revenue if total_revenue else 0.0
+
+    # Vista por segmento: varios clusters pueden compartir nombre, así que se
+    # combinan sumas y conteos (las medias se recalculan ponderadas)
+    sum_columns = ['Customers'] + [f'{column}_sum' for column in RFM_COLUMNS]
+    segments = clusters.groupby('Segment')[sum_columns + ['CustomerShare', 'RevenueShare']].sum()
+    for column in RFM_COLUMNS:
+        segments[f'{column}_mean'] = segments[f'{column}_sum'] / segments['Customers']
+    segments = segments.join(segment_medians)
+    segments = segments.sort_values('Monetary_sum', ascending=False)
+
+    return {
+        'clusters': clusters,
+        'segments': segments,
+        'centroids': clusters[[f'{column}_mean' for column in RFM_COLUMNS]].set_axis(RFM_COLUMNS, axis=1),
+        'segment_names_ordered': clusters['Segment'].tolist(),
+        'overall': _overall_stats(rfm),
+        'total_customers': total_customers,
+        'total_revenue': total_revenue
+    }
+
+
+def _overall_stats(rfm):
+    """Estadísticas globales de la tabla RFM (una pasada por métrica)"""
+    overall = {}
+    for column in RFM_COLUMNS:
+        values = rfm[column]
+        overall[column] = {
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'mean': float(values.mean()),
+            'median': float(values.median()),
+            'std': float(values.std()),
+            'sum': float(values.sum())
+        }
+    overall['single_purchase'] = int((rfm['Frequency'] == 1).sum())
+    return overall
@@ -0,0 +1,259 @@
+"""
+Snapshot Pre-procesado (Arrow + metadatos)
+==========================================
+
+Reemplaza `rfm_segments.csv` + `segment_names.pkl` por una carpeta con:
+
+- `rfm-<hash>.arrow`: tabla RFM segmentada en formato Arrow IPC sin compresión,
+  con tipos explícitos y abrible con memory-map (sin parsear texto)
+- `metadata.json`: versión de esquema, nombres de segmentos, parámetros del
+  modelo (normalización y centroides), resultados del barrido de K y el nombre
+  del archivo de datos vigente
+
+Escritura atómica: el archivo de datos lleva el hash de su contenido y se
+escribe completo antes de reemplazar `metadata.json`, que es el punto de
+confirmación. Un lector siempre ve un snapshot completo (el anterior o el
+nuevo): el archivo de datos anterior se conserva hasta la escritura siguiente,
+así que un lector que ya leyó los metadatos viejos todavía lo encuentra. No se
+usa pickle.
+
+El lector reconstruye la normalización desde los metadatos en lugar de
+reajustarla sobre la tabla.
+
+Convertir los archivos antiguos:
+
+    python src/snapshot_store.py --csv data/rfm_segments.csv --names data/segment_names.pkl --k-sweep
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from pipeline import evaluate_clustering
+
+SCHEMA_VERSION = 1
+SNAPSHOT_DIR = 'data/rfm_snapshot'
+METADATA_FILE = 'metadata.json'
+
+# Archivos del formato anterior (solo lectura, como respaldo)
+LEGACY_CSV = 'data/rfm_segments.csv'
+LEGACY_NAMES = 'data/segment_names.pkl'
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+
+def _file_sha256(path):
+    """Hash SHA-256 de un archivo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _atomic_write_text(path, text):
+    """Escribir un archivo de texto con reemplazo atómico"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def model_parameters(rfm, scaler=None, kmeans=None):
+    """Parámetros de normalización y centroides en formato JSON"""
+    if scaler is None:
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler().fit(rfm[RFM_COLUMNS])
+    if kmeans is not None:
+        centers = kmeans.cluster_centers_
+        params = {'n_clusters': int(kmeans.n_clusters), 'random_state': kmeans.random_state,
+                  'n_init': kmeans.n_init, 'inertia': float(kmeans.inertia_)}
+    else:
+        # Sin el modelo, los centroides de K-Means son las medias normalizadas por cluster
+        scaled = scaler.transform(rfm[RFM_COLUMNS])
+        clusters = rfm['Cluster'].to_numpy()
+        centers = np.vstack([scaled[clusters == c].mean(axis=0) for c in np.sort(np.unique(clusters))])
+        params = {'n_clusters': int(len(centers))}
+
+    return {
+        **params,
+        'features': RFM_COLUMNS,
+        'scaler_mean': scaler.mean_.tolist(),
+        'scaler_scale': scaler.scale_.tolist(),
+        'cluster_centers': np.asarray(centers).tolist()
+    }
+
+
+def write_snapshot(rfm, segment_names, directory=SNAPSHOT_DIR, scaler=None, kmeans=None, k_sweep=None):
+    """Guardar la tabla RFM segmentada y sus metadatos; devuelve los metadatos"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    table = rfm.reset_index(drop=True)
+    if not isinstance(table['Segment'].dtype, pd.CategoricalDtype):
+        # Pocos valores repetidos: se guarda como diccionario de Arrow
+        table = table.assign(Segment=table['Segment'].astype('category'))
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+
+    # 1. Datos en un archivo temporal, renombrado según su contenido
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.arrow')
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        os.chmod(tmp_path, 0o644)
+        content_hash = _file_sha256(tmp_path)
+        data_file = f'rfm-{content_hash[:16]}.arrow'
+        os.replace(tmp_path, directory / data_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    # El archivo vigente hasta ahora pasa a ser el anterior y se conserva
+    previous = read_metadata(directory)
+    keep = {data_file, previous['data_file']} if previous is not None else {data_file}
+
+    # 2. Metadatos al final: es el paso que hace visible el snapshot nuevo
+    metadata = {
+        'schema_version': SCHEMA_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'data_file': data_file,
+        'sha256': content_hash,
+        'rows': len(table),
+        'columns': {field.name: str(field.type) for field in arrow_table.schema},
+        'segment_names': {str(int(cluster)): name for cluster, name in segment_names.items()},
+        'model': model_parameters(table, scaler, kmeans),
+        'k_sweep': k_sweep
+    }
+    _atomic_write_text(directory / METADATA_FILE, json.dumps(metadata, indent=2, ensure_ascii=False))
+
+    # 3. Datos de snapshots más antiguos que el anterior (ningún lector puede necesitarlos)
+    for old in directory.glob('rfm-*.arrow'):
+        if old.name not in keep:
+            try:
+                old.unlink()
+            except OSError:
+                # En Windows un lector puede tenerlo mapeado; se borrará en la próxima escritura
+                pass
+
+    return metadata
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+
+def read_metadata(directory=SNAPSHOT_DIR):
+    """Metadatos del snapshot (None si no existe)"""
+    path = Path(directory) / METADATA_FILE
+    if not path.exists():
+        return None
+    metadata = json.loads(path.read_text(encoding='utf-8'))
+    if metadata.get('schema_version', 0) > SCHEMA_VERSION:
+        raise ValueError(f"Snapshot con esquema v{metadata['schema_version']}; "
+                         f"esta versión del dashboard lee hasta v{SCHEMA_VERSION}")
+    return metadata
+
+
+def read_snapshot(directory=SNAPSHOT_DIR, metadata=None):
+    """Tabla RFM del snapshot leída con memory-map"""
+    metadata = metadata or read_metadata(directory)
+    source = pa.memory_map(str(Path(directory) / metadata['data_file']), 'r')
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def segment_names_from_metadata(metadata):
+    """Nombres de segmentos con claves de cluster enteras"""
+    return {int(cluster): name for cluster, name in metadata['segment_names'].items()}
+
+
+def scaler_from_metadata(metadata):
+    """StandardScaler reconstruido con la media y escala guardadas (sin reajustar)"""
+    from sklearn.preprocessing import StandardScaler
+
+    model = metadata['model']
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(model['scaler_mean'], dtype=np.float64)
+    scaler.scale_ = np.asarray(model['scaler_scale'], dtype=np.float64)
+    scaler.var_ = scaler.scale_ ** 2
+    scaler.n_features_in_ = len(model['features'])
+    scaler.feature_names_in_ = np.asarray(model['features'], dtype=object)
+    scaler.n_samples_seen_ = metadata['rows']
+    return scaler
+
+
+def centers_from_metadata(metadata):
+    """Centroides guardados en el espacio normalizado"""
+    return np.asarray(metadata['model']['cluster_centers'], dtype=np.float64)
+
+
+def load_preprocessed(directory=SNAPSHOT_DIR, legacy_csv=LEGACY_CSV, legacy_names=LEGACY_NAMES):
+    """(rfm, nombres de segmentos, metadatos) desde el snapshot o, si no existe,
+    desde el CSV + pickle anteriores (metadatos None)"""
+    metadata = read_metadata(directory)
+    if metadata is not None:
+        return read_snapshot(directory, metadata), segment_names_from_metadata(metadata), metadata
+
+    rfm = pd.read_csv(legacy_csv)
+    with open(legacy_names, 'rb') as f:
+        segment_names = pickle.load(f)
+    return rfm, segment_names, None
+
+
+def k_sweep_results(metadata):
+    """(K_range, inercias, silhouettes) guardados en el snapshot o None"""
+    sweep = (metadata or {}).get('k_sweep')
+    if not sweep:
+        return None
+    return range(sweep['K'][0], sweep['K'][-1] + 1), sweep['inertia'], sweep['silhouette']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convertir rfm_segments.csv + segment_names.pkl a snapshot Arrow")
+    parser.add_argument('--csv', default=LEGACY_CSV, help="CSV con la tabla RFM segmentada")
+    parser.add_argument('--names', default=LEGACY_NAMES, help="Pickle con los nombres de segmentos")
+    parser.add_argument('--output', default=SNAPSHOT_DIR, help="Carpeta del snapshot")
+    parser.add_argument('--k-sweep', action='store_true', help="Calcular y guardar el barrido de K (2-10)")
+    args = parser.parse_args()
+
+    rfm = pd.read_csv(args.csv)
+    with open(args.names, 'rb') as f:
+        segment_names = pickle.load(f)
+
+    k_sweep = None
+    if args.k_sweep:
+        from sklearn.preprocessing import StandardScaler
+        # Mismo barrido que la pestaña de Clustering
+        scaled = StandardScaler().fit_transform(rfm[RFM_COLUMNS])
+        K_range, inertias, silhouettes = evaluate_clustering(scaled, max_k=10)
+        k_sweep = {'K': list(K_range), 'inertia': [float(v) for v in inertias],
+                   'silhouette': [float(v) for v in silhouettes]}
+
+    metadata = write_snapshot(rfm, segment_names, args.output, k_sweep=k_sweep)
+    print(f"✓ Snapshot escrito en {args.output}/{metadata['data_file']} ({metadata['rows']:,} clientes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Snapshots RFM a Fin de Mes y Migración entre Segmentos
+======================================================
+
+Calcula el RFM de todos los clientes "a fecha" de cada cierre de mes en una sola
+pasada sobre la tabla de facturas:
+
+1. Se ordenan las facturas por (cliente, fecha) una vez y se acumula el gasto
+2. Para cada corte, una búsqueda binaria por cliente da cuántas facturas tenía
+   antes del corte (Frequency), su última fecha (Recency) y, por diferencia de
+   sumas acumuladas, su gasto (Monetary)
+3. Cada snapshot se clasifica con el mismo scaler y K-Means ya entrenados, así
+   los segmentos son comparables entre meses
+
+El corte de un mes es el primer instante del mes siguiente: Recency son los días
+completos entre la última compra y ese instante.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Etiqueta de los clientes que aún no habían comprado en el corte de origen
+NEW_CUSTOMER_LABEL = 'Nuevo'
+
+_SECONDS_PER_DAY = 86_400
+
+
+def snapshot_cutoffs(invoices):
+    """Cortes mensuales (inicio del mes siguiente) desde el primer al último mes"""
+    first_month = invoices['InvoiceDate'].min().to_period('M')
+    last_month = invoices['InvoiceDate'].max().to_period('M')
+    months = pd.period_range(first_month, last_month, freq='M')
+    return [(str(month), (month + 1).to_timestamp()) for month in months]
+
+
+def compute_snapshots(invoices, scaler, kmeans, cluster_segments):
+    """RFM y segmento de cada cliente en cada cierre de mes (formato largo)"""
+    codes, customers = pd.factorize(invoices['CustomerID'], sort=True)
+    n_customers = len(customers)
+    seconds = invoices['InvoiceDate'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    base = seconds.min()
+    span = seconds.max() - base + 1
+
+    # Clave única ordenable (cliente, fecha): un solo argsort para todos los cortes
+    keys = codes.astype(np.int64) * span + (seconds - base)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    seconds = seconds[order]
+    cumulative_total = np.concatenate([[0.0], np.cumsum(invoices['Total'].to_numpy(dtype=np.float64)[order])])
+
+    customer_offsets = np.arange(n_customers, dtype=np.int64) * span
+    starts = np.searchsorted(keys, customer_offsets)
+
+    frames = []
+    for label, cutoff in snapshot_cutoffs(invoices):
+        cutoff_s = int(np.datetime64(cutoff, 's').astype(np.int64))
+        ends = np.searchsorted(keys, customer_offsets + min(max(cutoff_s - base, 0), span))
+        counts = ends - starts
+        active = counts > 0
+        if not active.any():
+            continue
+
+        frames.append(pd.DataFrame({
+            'Snapshot': label,
+            'CustomerID': customers[active],
+            'Recency': (cutoff_s - seconds[ends[active] - 1]) // _SECONDS_PER_DAY,
+            'Frequency': counts[active],
+            'Monetary': cumulative_total[ends[active]] - cumulative_total[starts[active]]
+        }))
+
+    snapshots = pd.concat(frames, ignore_index=True)
+
+    # Modelo fijo: mismos centroides y normalización que la segmentación actual
+    features = snapshots[['Recency', 'Frequency', 'Monetary']]
+    snapshots['Cluster'] = kmeans.predict(scaler.transform(features))
+    snapshots['Segment'] = snapshots['Cluster'].map(cluster_segments)
+    snapshots['Snapshot'] = pd.Categorical(snapshots['Snapshot'],
+                                           categories=[label for label, _ in snapshot_cutoffs(invoices)],
+                                           ordered=True)
+    return snapshots
+
+
+def migration_matrix(snapshots, from_snapshot, to_snapshot, segment_order=None):
+    """Clientes por segmento de origen (filas) y de destino (columnas)"""
+    origin = snapshots.loc[snapshots['Snapshot'] == from_snapshot].set_index('CustomerID')['Segment']
+    target = snapshots.loc[snapshots['Snapshot'] == to_snapshot].set_index('CustomerID')['Segment']
+
+    moves = pd.DataFrame({'Origen': origin, 'Destino': target})
+    moves = moves[moves['Destino'].notna()]
+    moves['Origen'] = moves['Origen'].fillna(NEW_CUSTOMER_LABEL)
+
+    matrix = pd.crosstab(moves['Origen'], moves['Destino'])
+    if segment_order is not None:
+        # Varios clusters pueden compartir nombre de segmento
+        segment_order = list(dict.fromkeys(segment_order))
+        rows = [s for s in segment_order if s in matrix.index]
+        if NEW_CUSTOMER_LABEL in matrix.index:
+            rows.append(NEW_CUSTOMER_LABEL)
+        matrix = matrix.reindex(index=rows, columns=[s for s in segment_order if s in matrix.columns])
+    return matrix
+
+
+def segment_sizes(snapshots):
+    """Clientes por segmento en cada corte (filas: cortes)"""
+    return pd.crosstab(snapshots['Snapshot'], snapshots['Segment'])
+
+
+def customer_trajectory(snapshots, customer_id):
+    """Evolución de RFM y segmento de un cliente a lo largo de los cortes"""
+    trajectory = snapshots.loc[snapshots['CustomerID'] == customer_id]
+    return trajectory.drop(columns=['CustomerID', 'Cluster']).sort_values('Snapshot', ignore_index=True)
@@ -0,0 +1,202 @@
+"""
+Estabilidad de los Clusters (Bootstrap)
+=======================================
+
+Comprueba si los segmentos de K-Means son estables o un artefacto de la
+semilla: se reajusta K-Means muchas veces y cada reajuste se compara con la
+segmentación actual sobre los mismos clientes.
+
+- Semillas: misma muestra de clientes, distinta `random_state`
+- Bootstrap: muestra con reemplazo y semilla nueva en cada réplica
+
+Medidas:
+
+- ARI (adjusted Rand index) de cada réplica frente a la segmentación actual
+  (1 = misma partición, ~0 = coincidencia al azar)
+- Jaccard por cluster: para cada cluster actual, el máximo solapamiento con
+  algún cluster de la réplica (Hennig, 2007). Medias > 0.75 indican un cluster
+  estable; < 0.5, un cluster que se "disuelve"
+
+Los reajustes se reparten en el pool de procesos de `parallel`: la matriz RFM
+normalizada y las etiquetas actuales se copian una vez a memoria compartida y
+cada proceso solo recibe la semilla de su réplica.
+"""
+
+import os
+import time
+from concurrent.futures import as_completed, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from parallel import get_pool, create_block, default_workers
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'Monetary']
+
+DEFAULT_SEED_REFITS = 10
+DEFAULT_BOOTSTRAP_REFITS = 20
+# Clientes por réplica: acota el coste de cada K-Means con millones de clientes
+DEFAULT_SAMPLE_ROWS = 20_000
+
+STABLE_JACCARD = 0.75
+DISSOLVED_JACCARD = 0.5
+
+
+# ============================================================================
+# MEDIDAS
+# ============================================================================
+
+def cluster_jaccard(reference, labels, n_clusters):
+    """Jaccard máximo de cada cluster de referencia frente a los de la réplica"""
+    contingency = np.bincount(reference * n_clusters + labels,
+                              minlength=n_clusters * n_clusters).reshape(n_clusters, n_clusters)
+    reference_sizes = contingency.sum(axis=1)
+    label_sizes = contingency.sum(axis=0)
+    union = reference_sizes[:, None] + label_sizes[None, :] - contingency
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccard = np.where(union > 0, contingency / union, 0.0)
+    best = jaccard.max(axis=1)
+    # Cluster ausente de la muestra: sin información en esta réplica
+    best[reference_sizes == 0] = np.nan
+    return best
+
+
+def _refit(features, reference, n_clusters, kind, seed, sample_seed, sample_rows, n_init):
+    """Una réplica: muestrear, reajustar K-Means y compararlo con la referencia"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+
+    n_rows = len(reference)
+    rng = np.random.default_rng(sample_seed)
+    if kind == 'bootstrap':
+        sample = rng.choice(n_rows, size=sample_rows, replace=True)
+    elif sample_rows < n_rows:
+        sample = rng.choice(n_rows, size=sample_rows, replace=False)
+    else:
+        sample = np.arange(n_rows)
+
+    labels = KMeans(n_clusters=n_clusters, random_state=seed, n_init=n_init).fit_predict(features[sample])
+
+    # Los clientes repetidos del bootstrap no aportan información a la comparación
+    unique_rows, first = np.unique(sample, return_index=True)
+    reference = reference[unique_rows].astype(np.int64)
+    labels = labels[first].astype(np.int64)
+    return {
+        'kind': kind,
+        'seed': seed,
+        'ari': float(adjusted_rand_score(reference, labels)),
+        'jaccard': cluster_jaccard(reference, labels, n_clusters)
+    }
+
+
+def _refit_worker(specs, threads, *args):
+    """Proceso hijo: leer la matriz compartida y ejecutar una réplica"""
+    from threadpoolctl import threadpool_limits
+
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        features, reference = (np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                               for block, (_, dtype, shape) in zip(blocks, specs))
+        # Un hilo de BLAS/OpenMP por proceso: evita sobresuscribir los núcleos
+        with threadpool_limits(threads):
+            result = _refit(features, reference, *args)
+        del features, reference
+    finally:
+        for block in blocks:
+            block.close()
+    return result
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def replicate_plan(n_seed_refits, n_bootstrap_refits, base_seed=42):
+    """(tipo, semilla de K-Means, semilla de muestreo) de cada réplica"""
+    plan = [('seeds', base_seed + 1 + i, base_seed) for i in range(n_seed_refits)]
+    plan += [('bootstrap', base_seed + 1001 + i, base_seed + 1001 + i) for i in range(n_bootstrap_refits)]
+    return plan
+
+
+def cluster_stability(rfm, n_seed_refits=DEFAULT_SEED_REFITS, n_bootstrap_refits=DEFAULT_BOOTSTRAP_REFITS,
+                      sample_rows=DEFAULT_SAMPLE_ROWS, n_init=10, n_workers=None, on_progress=None):
+    """Estabilidad de la segmentación actual (columna Cluster) frente a reajustes de K-Means
+
+    `on_progress(hechos, total)` se llama tras cada réplica; si lanza una excepción
+    se cancelan las réplicas pendientes.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    start = time.perf_counter()
+    n_workers = n_workers or default_workers()
+    features = np.ascontiguousarray(StandardScaler().fit_transform(rfm[RFM_COLUMNS]), dtype=np.float64)
+    clusters, reference = np.unique(rfm['Cluster'].to_numpy(), return_inverse=True)
+    reference = reference.astype(np.int32)
+    n_clusters = len(clusters)
+    sample_rows = min(sample_rows, len(rfm))
+    plan = replicate_plan(n_seed_refits, n_bootstrap_refits)
+    on_progress = on_progress or (lambda done, total: None)
+
+    if n_workers == 1:
+        results = []
+        for kind, seed, sample_seed in plan:
+            results.append(_refit(features, reference, n_clusters, kind, seed, sample_seed, sample_rows, n_init))
+            on_progress(len(results), len(plan))
+    else:
+        blocks = []
+        futures = []
+        try:
+            specs = []
+            for values in (features, reference):
+                block, shared = create_block(values.dtype, values.size)
+                blocks.append(block)
+                shared[:] = values.ravel()
+                del shared
+                specs.append((block.name, values.dtype.str, values.shape))
+
+            threads = max(1, (os.cpu_count() or 1) // n_workers)
+            pool = get_pool(n_workers)
+            futures = [pool.submit(_refit_worker, specs, threads, n_clusters, kind, seed, sample_seed,
+                                   sample_rows, n_init)
+                       for kind, seed, sample_seed in plan]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                on_progress(done, len(plan))
+            results = [future.result() for future in futures]
+        finally:
+            # Ninguna réplica puede seguir leyendo los bloques cuando se liberan
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    return summarize_stability(results, clusters, sample_rows, n_workers, time.perf_counter() - start)
+
+
+def summarize_stability(results, clusters, sample_rows, n_workers, seconds):
+    """Resumen global y por cluster de las réplicas"""
+    replicates = pd.DataFrame([{'Tipo': r['kind'], 'Semilla': r['seed'], 'ARI': r['ari']} for r in results])
+    jaccard = np.vstack([r['jaccard'] for r in results])
+
+    per_cluster = pd.DataFrame({
+        'Jaccard_mean': np.nanmean(jaccard, axis=0),
+        'Jaccard_min': np.nanmin(jaccard, axis=0),
+        # Las réplicas en las que el cluster no aparece (NaN) no cuentan ni como disueltas ni como estables
+        'Dissolved_share': np.nanmean(np.where(np.isnan(jaccard), np.nan, jaccard < DISSOLVED_JACCARD), axis=0)
+    }, index=pd.Index(clusters, name='Cluster'))
+
+    overall = {kind: {'ari_mean': float(group['ARI'].mean()), 'ari_min': float(group['ARI'].min())}
+               for kind, group in replicates.groupby('Tipo')}
+    overall['jaccard_mean'] = float(np.nanmean(jaccard))
+
+    return {
+        'overall': overall,
+        'clusters': per_cluster,
+        'replicates': replicates,
+        'sample_rows': sample_rows,
+        'workers': n_workers,
+        'seconds': seconds
+    }
@@ -0,0 +1,223 @@
+"""
+Etapas Cacheadas del Pipeline
+=============================
+
+Etapas del dashboard con su caché en disco (`result_cache.disk_cached`), sin
+depender de Streamlit. El dashboard envuelve cada una con `st.cache_data`
+(primera capa, en memoria del proceso) y el precalentamiento (`warmup.py`) las
+llama directamente: las dos usan las mismas claves, así que lo que calienta
+la línea de comandos el dashboard solo lo lee.
+
+Convención de argumentos: los que empiezan por `_` no forman parte de la clave
+(van acompañados de un identificador del dataset o de la segmentación).
+"""
+
+from backends import clean_transactions, rfm_from_files, read_transaction_files
+from clv import predict_clv
+from customer_index import build_customer_index
+from instrumentation import mark_cache_miss
+from invoices import build_invoice_table
+from jobs import report_progress
+from market_basket import build_basket_matrix, basket_matrix_from_files, segment_basket_rules, basket_matrix_stats
+from market_segments import segment_markets
+from partitions import rfm_from_partitions
+from pipeline import (load_data, compute_rfm, fit_clustering, assign_segment_names,
+                      train_decision_tree, evaluate_clustering, build_chatbot_context)
+from result_cache import disk_cached
+from sales_cube import customer_activity, activity_from_files, activity_from_partitions, build_sales_cube
+from segment_profile import build_segment_profile
+from snapshots import compute_snapshots
+from stability import cluster_stability
+from validation import quality_report
+
+
+# ============================================================================
+# DATOS Y RFM
+# ============================================================================
+
+@disk_cached('load_data')
+def get_raw_data(dataset_id, _file):
+    """Datos leídos del archivo subido, cacheados por su contenido"""
+    mark_cache_miss()
+    # Los errores de lectura los muestra el trabajo de carga (no se cachean)
+    return load_data(_file)
+
+
+@disk_cached('quality_report')
+def get_quality_report(dataset_id, _df):
+    """Informe de calidad de las transacciones crudas (cacheado por archivo cargado)"""
+    mark_cache_miss()
+    return quality_report(_df)
+
+
+@disk_cached('clean_data')
+def get_clean_data(dataset_id, backend, _df):
+    """Transacciones limpias cacheadas por archivo cargado y motor"""
+    mark_cache_miss()
+    return clean_transactions(_df, backend=backend)
+
+
+@disk_cached('build_invoice_table')
+def get_invoice_table(dataset_id, _df_clean):
+    """Tabla de facturas compartida por RFM y EDA (cacheada por archivo cargado)"""
+    mark_cache_miss()
+    return build_invoice_table(_df_clean)
+
+
+@disk_cached('calculate_rfm')
+def get_rfm(dataset_id, backend, _df_clean, _invoices):
+    """Tabla RFM cacheada por archivo cargado y motor"""
+    mark_cache_miss()
+    return compute_rfm(_df_clean, backend=backend, invoices=_invoices)
+
+
+@disk_cached('rfm_from_files')
+def load_rfm_from_files(paths, file_versions, backend):
+    """RFM directamente desde archivos CSV/Parquet (cacheado por versión de archivos)"""
+    mark_cache_miss()
+    return rfm_from_files(list(paths), backend=backend)
+
+
+@disk_cached('rfm_from_partitions')
+def load_rfm_from_partitions(root, versions, start, end, backend):
+    """RFM desde particiones mensuales dentro del rango de fechas (cacheado)"""
+    mark_cache_miss()
+    return rfm_from_partitions(root, start=start, end=end, backend=backend)
+
+
+@disk_cached('rfm_snapshots')
+def get_rfm_snapshots(dataset_id, segmentation_id, _invoices, _scaler, _kmeans, cluster_segments):
+    """RFM y segmento a cada cierre de mes con el modelo actual (cacheado por dataset y segmentación)"""
+    mark_cache_miss()
+    return compute_snapshots(_invoices, _scaler, _kmeans, cluster_segments)
+
+
+# ============================================================================
+# SEGMENTACIÓN
+# ============================================================================
+
+@disk_cached('perform_clustering')
+def get_clustering(rfm_id, _rfm, n_clusters):
+    """K-Means cacheado por tabla RFM y número de segmentos"""
+    mark_cache_miss()
+    return fit_clustering(_rfm, n_clusters)
+
+
+@disk_cached('evaluate_clustering')
+def get_k_sweep(rfm_id, _rfm, max_k=10, _job=None):
+    """Barrido de K cacheado por tabla RFM (con progreso si corre como trabajo)"""
+    from sklearn.preprocessing import StandardScaler
+
+    mark_cache_miss()
+    rfm_scaled = StandardScaler().fit_transform(_rfm[['Recency', 'Frequency', 'Monetary']])
+    return evaluate_clustering(rfm_scaled, max_k=max_k,
+                               on_progress=lambda done, total, k: report_progress(_job, done, total, k))
+
+
+@disk_cached('train_decision_tree')
+def get_decision_tree(segmentation_id, _rfm, max_depth, min_samples_split, min_samples_leaf):
+    """Árbol explicativo y sus predicciones, cacheados por segmentación y parámetros"""
+    mark_cache_miss()
+    tree_model, _, _, y_pred = train_decision_tree(_rfm, max_depth, min_samples_split, min_samples_leaf)
+    return tree_model, y_pred
+
+
+@disk_cached('cluster_stability')
+def get_cluster_stability(segmentation_id, _rfm, n_bootstrap_refits, _job=None):
+    """Estabilidad de los clusters frente a semillas y remuestreos (cacheada por dataset y K)"""
+    mark_cache_miss()
+    return cluster_stability(
+        _rfm, n_bootstrap_refits=n_bootstrap_refits,
+        on_progress=lambda done, total: report_progress(_job, done, total, f"réplica {done} de {total}")
+    )
+
+
+@disk_cached('segment_profile')
+def get_segment_profile(segmentation_id, _rfm):
+    """Perfil de segmentos cacheado por segmentación (una sola agregación)"""
+    mark_cache_miss()
+    return build_segment_profile(_rfm)
+
+
+@disk_cached('customer_index')
+def get_customer_index(segmentation_id, _rfm, _scaler):
+    """Índice de búsqueda y vecinos de clientes (uno por segmentación)"""
+    mark_cache_miss()
+    return build_customer_index(_rfm, _scaler)
+
+
+# ============================================================================
+# ANÁLISIS
+# ============================================================================
+
+@disk_cached('predict_clv')
+def get_clv(segmentation_id, _rfm, horizon_months):
+    """CLV por cliente (BG/NBD + Gamma-Gamma), cacheado por segmentación y horizonte"""
+    mark_cache_miss()
+    return predict_clv(_rfm, horizon_months=horizon_months)
+
+
+@disk_cached('basket_matrix')
+def get_basket_matrix(basket_source, _df_clean=None):
+    """Matriz dispersa factura × producto, cacheada por dataset (líneas subidas o archivos)"""
+    mark_cache_miss()
+    if _df_clean is None:
+        return basket_matrix_from_files(basket_source[1])
+    return build_basket_matrix(_df_clean)
+
+
+@disk_cached('basket_rules')
+def get_basket_rules(segmentation_id, basket_source, min_support, min_confidence, _rfm, _df_clean=None):
+    """Itemsets y reglas de asociación por segmento (FP-growth), cacheados por segmentación"""
+    mark_cache_miss()
+    basket = get_basket_matrix(basket_source, _df_clean)
+    return (basket_matrix_stats(basket),
+            segment_basket_rules(basket, _rfm[['CustomerID', 'Segment']],
+                                 min_support=min_support, min_confidence=min_confidence))
+
+
+@disk_cached('customer_activity')
+def get_customer_activity(activity_source, _df_clean=None):
+    """Actividad por cliente, país y mes, cacheada por dataset (líneas subidas, archivos o particiones)"""
+    mark_cache_miss()
+    if activity_source[0] == 'upload':
+        return customer_activity(_df_clean)
+    if activity_source[0] == 'partitions':
+        root, _, start, end, backend = activity_source[1:]
+        return activity_from_partitions(root, start=start, end=end, backend=backend)
+    paths, _, backend = activity_source[1:]
+    return activity_from_files(list(paths), backend=backend)
+
+
+@disk_cached('sales_cube')
+def get_sales_cube(segmentation_id, activity_source, _rfm, _df_clean=None):
+    """Cubo país × mes × segmento, cacheado por segmentación (una sola pasada por dataset)"""
+    mark_cache_miss()
+    activity = get_customer_activity(activity_source, _df_clean)
+    return build_sales_cube(activity, _rfm[['CustomerID', 'Segment']])
+
+
+@disk_cached('market_segmentation')
+def get_market_segmentation(basket_source, n_clusters, min_customers, _df=None, _job=None):
+    """Segmentación independiente por país en procesos paralelos (cacheada por dataset, K y umbral)"""
+    mark_cache_miss()
+    df = _df if _df is not None else read_transaction_files(list(basket_source[1]))
+    result = segment_markets(
+        df, n_clusters=n_clusters, min_customers=min_customers,
+        on_progress=lambda done, total: report_progress(_job, done, total, f"mercado {done} de {total}")
+    )
+    # Nombres con las mismas reglas que la segmentación global
+    for market in result['markets'].values():
+        market['rfm'], market['segment_names'] = assign_segment_names(market['rfm'])
+    return result
+
+
+# ============================================================================
+# CHATBOT
+# ============================================================================
+
+@disk_cached('chatbot_context')
+def get_chatbot_context(segmentation_id, n_quantiles, ties, _profile, _score_cube=None):
+    """Contexto del chatbot cacheado por segmentación y escala de scores"""
+    mark_cache_miss()
+    return build_chatbot_context(_profile, _score_cube)
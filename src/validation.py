@@ -0,0 +1,199 @@
+"""
+Validación de Esquema y Calidad de Datos
+========================================
+
+Rechaza en segundos un archivo que no sirve para el análisis, antes de la
+lectura completa, la limpieza y el RFM:
+
+1. Cabecera y muestra: se leen solo las primeras SAMPLE_ROWS filas (CSV y
+   Excel con `nrows`, Parquet con el primer lote de registros) y se comprueban
+   las columnas obligatorias, que los valores se puedan interpretar con su tipo
+   (números, fechas) y que estén en rangos razonables
+2. Datos completos: las mismas comprobaciones sobre todas las filas y un
+   informe de calidad vectorizado (nulos por columna, cancelaciones,
+   cantidades y precios no positivos, filas duplicadas, rango de fechas y
+   filas que sobreviven a la limpieza)
+
+Los problemas que impiden el análisis se lanzan como ValueError con todos los
+motivos juntos; los demás quedan como avisos en el informe.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Columnas que usan la limpieza, el RFM, la tabla de facturas y la cesta
+REQUIRED_COLUMNS = {
+    'InvoiceNo': 'texto',
+    'StockCode': 'texto',
+    'Quantity': 'número',
+    'InvoiceDate': 'fecha',
+    'UnitPrice': 'número',
+    'CustomerID': 'número',
+    'Country': 'texto'
+}
+OPTIONAL_COLUMNS = ['Description']
+# Subconjunto suficiente para el RFM (ingesta en vivo)
+RFM_REQUIRED_COLUMNS = {column: REQUIRED_COLUMNS[column]
+                        for column in ('InvoiceNo', 'Quantity', 'InvoiceDate', 'UnitPrice', 'CustomerID')}
+
+SAMPLE_ROWS = 1_000
+# Proporción máxima de valores no nulos que no se pueden interpretar con su tipo
+MAX_UNPARSEABLE = 0.01
+# Fechas fuera de este rango indican una columna mal interpretada (p. ej. números de serie)
+MIN_DATE = pd.Timestamp('1990-01-01')
+MAX_FUTURE_DAYS = 1
+# Avisos del informe de calidad
+WARN_NULL_CUSTOMERS = 0.5
+WARN_DUPLICATES = 0.05
+
+
+# ============================================================================
+# ESQUEMA
+# ============================================================================
+
+def _parse_dates(values):
+    """Fechas de una columna (NaT donde no se puede interpretar)"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    # Números de serie de Excel u otros enteros no son fechas válidas aquí
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.Series(pd.NaT, index=values.index)
+    with warnings.catch_warnings():
+        # Sin formato común pandas avisa y prueba valor a valor: el resultado es el mismo
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(values, errors='coerce')
+
+
+def schema_problems(df, required=REQUIRED_COLUMNS):
+    """Motivos por los que el DataFrame no se puede analizar (lista vacía si es válido)"""
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        return [f"Faltan columnas obligatorias: {', '.join(missing)}"]
+    if df.empty:
+        return ["El archivo no tiene filas"]
+
+    problems = []
+    for column, kind in required.items():
+        values = df[column]
+        present = values.notna()
+        if kind == 'número':
+            parsed = pd.to_numeric(values, errors='coerce')
+        elif kind == 'fecha':
+            parsed = _parse_dates(values)
+        else:
+            continue
+        bad = (present & parsed.isna()).sum()
+        if bad > MAX_UNPARSEABLE * max(present.sum(), 1):
+            problems.append(f"{column} debería ser {kind}: {bad:,} de {present.sum():,} valores no se "
+                            f"pueden interpretar (tipo {values.dtype})")
+        elif kind == 'fecha':
+            parsed = parsed.dropna()
+            latest = pd.Timestamp.now() + pd.Timedelta(days=MAX_FUTURE_DAYS)
+            if len(parsed) and (parsed.min() < MIN_DATE or parsed.max() > latest):
+                problems.append(f"{column} fuera de rango: de {parsed.min():%Y-%m-%d} a {parsed.max():%Y-%m-%d}")
+
+    if df['InvoiceNo'].isna().all():
+        problems.append("InvoiceNo no tiene ningún valor")
+    if df['CustomerID'].isna().all():
+        problems.append("CustomerID no tiene ningún valor: no se puede calcular el RFM por cliente")
+    return problems
+
+
+def check_schema(df, source='archivo', required=REQUIRED_COLUMNS):
+    """Lanzar ValueError con todos los problemas del esquema (si los hay)"""
+    problems = schema_problems(df, required)
+    if problems:
+        raise ValueError(f"{source} no válido: " + "; ".join(problems))
+
+
+# ============================================================================
+# CABECERA Y MUESTRA
+# ============================================================================
+
+def read_sample(file, n_rows=SAMPLE_ROWS):
+    """Primeras filas de un archivo CSV, Parquet o Excel (ruta o archivo subido) sin leerlo entero"""
+    name = getattr(file, 'name', str(file)).lower()
+    position = file.tell() if hasattr(file, 'seek') else None
+    try:
+        if name.endswith('.csv'):
+            return pd.read_csv(file, dtype={'InvoiceNo': str}, nrows=n_rows)
+        if name.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            parquet = pq.ParquetFile(file)
+            batch = next(parquet.iter_batches(batch_size=n_rows), None)
+            if batch is None:
+                return parquet.schema_arrow.empty_table().to_pandas()
+            return batch.to_pandas()
+        return pd.read_excel(file, nrows=n_rows)
+    finally:
+        # El archivo subido se vuelve a leer completo después
+        if position is not None:
+            file.seek(position)
+
+
+def validate_sample(file, n_rows=SAMPLE_ROWS, required=REQUIRED_COLUMNS):
+    """Validar cabecera y primeras filas antes de la lectura completa; devuelve la muestra"""
+    name = getattr(file, 'name', str(file))
+    try:
+        sample = read_sample(file, n_rows)
+    except Exception as e:
+        raise ValueError(f"No se pudo leer {name}: {type(e).__name__}: {e}") from e
+    check_schema(sample, source=f"{name} (primeras {len(sample):,} filas)", required=required)
+    return sample
+
+
+# ============================================================================
+# INFORME DE CALIDAD
+# ============================================================================
+
+def quality_report(df):
+    """Informe de calidad vectorizado de las transacciones completas (sin limpiar)"""
+    n_rows = len(df)
+    errors = schema_problems(df)
+    if errors:
+        return {'rows': n_rows, 'errors': errors, 'warnings': [], 'checks': {}, 'nulls': pd.Series(dtype=float)}
+
+    invoice_codes, invoices = pd.factorize(df['InvoiceNo'].astype(str))
+    # Cancelación por factura distinta, no por línea
+    cancelled = np.asarray(pd.Index(invoices).str.startswith('C'), dtype=np.bool_)[invoice_codes]
+    quantity = pd.to_numeric(df['Quantity'], errors='coerce')
+    price = pd.to_numeric(df['UnitPrice'], errors='coerce')
+    dates = _parse_dates(df['InvoiceDate'])
+    missing_customer = df['CustomerID'].isna().to_numpy()
+    valid = ~missing_customer & ~cancelled & (quantity > 0).to_numpy() & (price > 0).to_numpy()
+
+    checks = {
+        'Sin CustomerID': float(missing_customer.mean()),
+        'Cancelaciones': float(cancelled.mean()),
+        'Cantidad ≤ 0': float((quantity <= 0).mean()),
+        'Precio ≤ 0': float((price <= 0).mean()),
+        'Filas duplicadas': float(df.duplicated().mean()),
+        'Filas válidas': float(valid.mean())
+    }
+
+    notices = []
+    if not valid.any():
+        errors.append("Ninguna fila sobrevive a la limpieza (cliente, factura no cancelada, cantidad y precio positivos)")
+    if checks['Sin CustomerID'] > WARN_NULL_CUSTOMERS:
+        notices.append(f"{checks['Sin CustomerID']:.0%} de las filas no tienen CustomerID")
+    if checks['Filas duplicadas'] > WARN_DUPLICATES:
+        notices.append(f"{checks['Filas duplicadas']:.1%} de las filas están duplicadas (se cuentan dos veces)")
+
+    return {
+        'rows': n_rows,
+        'errors': errors,
+        'warnings': notices,
+        'checks': checks,
+        'nulls': df.isna().mean().sort_values(ascending=False),
+        'date_range': (dates.min(), dates.max()),
+        'customers': int(df.loc[valid, 'CustomerID'].nunique()),
+        'invoices': int(pd.unique(invoice_codes[valid]).size)
+    }
+
+
+def check_quality(report, source='archivo'):
+    """Lanzar ValueError si el informe de calidad tiene errores"""
+    if report['errors']:
+        raise ValueError(f"{source} no válido: " + "; ".join(report['errors']))
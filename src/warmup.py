@@ -0,0 +1,281 @@
+"""
+Precalentamiento de Caché
+=========================
+
+Paso de arranque que se ejecuta antes del servidor (o programado, por ejemplo
+con cron) y recorre los datasets registrados con las mismas etapas y claves
+que el dashboard: RFM, clustering, barrido de K, árboles de decisión, perfil
+de segmentos, índice de clientes, contexto del chatbot, CLV, reglas de
+asociación y cubo país × mes × segmento. Los resultados quedan en la caché en
+disco (`result_cache`), compartida por todos los procesos del servidor: el
+dashboard solo los lee.
+
+    python src/warmup.py && streamlit run src/app_dashboard.py
+    python src/warmup.py --repeat    # repetir cada `interval_minutes`
+
+Los datasets se registran en un JSON (ruta en `RFM_WARMUP_CONFIG`, por defecto
+`data/warmup.json`; sin archivo no hay precalentamiento):
+
+    {
+      "interval_minutes": 60,
+      "clusters": [4],
+      "tree_depths": [3, 4, 5],
+      "datasets": [
+        {"source": "preprocessed"},
+        {"source": "files", "path": "data/*.parquet", "backend": "duckdb"},
+        {"source": "partitions", "path": "data/partitions"}
+      ]
+    }
+
+Con `--repeat` el recorrido se repite periódicamente: si los archivos cambian,
+sus nuevas versiones quedan en caché antes de que alguien las pida. El estado
+de cada recorrido se escribe en `warmup_status.json`, junto a la caché, y la
+barra lateral del dashboard lo muestra.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from result_cache import cache_root
+
+WARMUP_CONFIG_ENV = 'RFM_WARMUP_CONFIG'
+DEFAULT_CONFIG_PATH = 'data/warmup.json'
+STATUS_FILE = 'warmup_status.json'
+
+WARMUP_SOURCES = ('preprocessed', 'files', 'partitions')
+
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+
+def load_warmup_config(path=None):
+    """Leer y validar la configuración (None si no hay archivo)"""
+    path = Path(path or os.environ.get(WARMUP_CONFIG_ENV) or DEFAULT_CONFIG_PATH)
+    if not path.exists():
+        return None
+
+    config = json.loads(path.read_text(encoding='utf-8'))
+    datasets = config.get('datasets') or []
+    for entry in datasets:
+        if entry.get('source') not in WARMUP_SOURCES:
+            raise ValueError(f"Fuente de precalentamiento no válida: {entry.get('source')!r} "
+                             f"(opciones: {', '.join(WARMUP_SOURCES)})")
+        if entry['source'] != 'preprocessed' and not entry.get('path'):
+            raise ValueError(f"El dataset '{entry['source']}' necesita 'path'")
+
+    return {
+        'datasets': datasets,
+        'clusters': [int(k) for k in config.get('clusters', [])],
+        'tree_depths': [int(d) for d in config.get('tree_depths', [])],
+        'interval_minutes': config.get('interval_minutes')
+    }
+
+
+def dataset_label(entry):
+    """Nombre corto de un dataset registrado para mostrar el progreso"""
+    if entry['source'] == 'preprocessed':
+        return 'Snapshot pre-procesado'
+    return f"{entry['source']}: {entry['path']}"
+
+
+# ============================================================================
+# ESTADO
+# ============================================================================
+
+def status_path():
+    """Archivo de estado del precalentamiento (junto a la caché que llena)"""
+    return cache_root() / STATUS_FILE
+
+
+def write_warmup_status(status):
+    """Guardar el estado con reemplazo atómico (el dashboard lo lee en cada rerun)"""
+    path = status_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({**status, 'updated_at': time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_warmup_status():
+    """Último estado escrito por el precalentamiento (None si nunca se ejecutó)"""
+    try:
+        return json.loads(status_path().read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+def warm_dataset(entry, config, on_step):
+    """Ejecutar las etapas del dashboard sobre un dataset registrado (mismas cachés y claves)"""
+    from sklearn.preprocessing import StandardScaler
+
+    import stages
+    from clv import DEFAULT_HORIZON_MONTHS
+    from backends import default_backend, resolve_paths
+    from market_basket import DEFAULT_MIN_SUPPORT, DEFAULT_MIN_CONFIDENCE
+    from partitions import list_partitions, partition_versions, date_range
+    from pipeline import assign_segment_names, DEFAULT_N_CLUSTERS, TREE_DEFAULTS
+    from rfm_scoring import QUANTILE_OPTIONS, TIE_METHODS, score_rfm, build_score_cube
+    from segment_profile import segmentation_key, rfm_key
+    from snapshot_store import load_preprocessed, k_sweep_results, scaler_from_metadata
+
+    snapshot_metadata = None
+    basket_source = None
+    activity_source = None
+    if entry['source'] == 'preprocessed':
+        on_step('read_preprocessed')
+        rfm, _, snapshot_metadata = load_preprocessed()
+        if snapshot_metadata is not None:
+            scaler = scaler_from_metadata(snapshot_metadata)
+        else:
+            scaler = StandardScaler().fit(rfm[['Recency', 'Frequency', 'Monetary']])
+        rfm_id = rfm_key(rfm)
+        segmentations = [(rfm, scaler)]
+    else:
+        backend = entry.get('backend') or default_backend()
+        if entry['source'] == 'files':
+            on_step('rfm_from_files')
+            paths = resolve_paths(entry['path'])
+            if not paths:
+                raise FileNotFoundError(f"No se encontraron archivos CSV/Parquet en {entry['path']}")
+            file_versions = tuple((os.path.getsize(path), os.path.getmtime(path)) for path in paths)
+            base_rfm, _ = stages.load_rfm_from_files(tuple(paths), file_versions, backend)
+            basket_source = ('files', tuple(paths), file_versions)
+            activity_source = ('files', tuple(paths), file_versions, backend)
+        else:
+            on_step('rfm_from_partitions')
+            partitions = list_partitions(entry['path'])
+            if not partitions:
+                raise FileNotFoundError(f"No se encontraron particiones month=YYYY-MM en {entry['path']}")
+            # Rango completo: el valor inicial del selector de fechas
+            first_day, last_day = date_range(partitions)
+            partition_args = (entry['path'], partition_versions(partitions), first_day, last_day, backend)
+            base_rfm, _ = stages.load_rfm_from_partitions(*partition_args)
+            activity_source = ('partitions',) + partition_args
+
+        rfm_id = rfm_key(base_rfm)
+        segmentations = []
+        for n_clusters in config['clusters'] or [DEFAULT_N_CLUSTERS]:
+            on_step(f'perform_clustering (K={n_clusters})')
+            rfm = base_rfm.copy()
+            rfm['Cluster'], _, scaler = stages.get_clustering(rfm_id, rfm, n_clusters)
+            rfm, _ = assign_segment_names(rfm)
+            segmentations.append((rfm, scaler))
+
+    if k_sweep_results(snapshot_metadata) is None:
+        on_step('evaluate_clustering')
+        stages.get_k_sweep(rfm_id, segmentations[0][0], max_k=10)
+
+    for rfm, scaler in segmentations:
+        segmentation_id = segmentation_key(rfm)
+        on_step('segment_profile')
+        profile = stages.get_segment_profile(segmentation_id, rfm)
+        on_step('customer_index')
+        stages.get_customer_index(segmentation_id, rfm, scaler)
+        # Contexto del chatbot en cada escala con el tratamiento de empates por defecto
+        for n_quantiles in QUANTILE_OPTIONS:
+            on_step(f'get_chatbot_context ({QUANTILE_OPTIONS[n_quantiles].lower()})')
+            score_cube = build_score_cube(score_rfm(rfm, n_quantiles=n_quantiles, ties=TIE_METHODS[0]),
+                                          n_quantiles=n_quantiles)
+            stages.get_chatbot_context(segmentation_id, n_quantiles, TIE_METHODS[0], profile, score_cube)
+        for max_depth in config['tree_depths'] or [TREE_DEFAULTS['max_depth']]:
+            on_step(f'train_decision_tree (profundidad {max_depth})')
+            stages.get_decision_tree(segmentation_id, rfm, max_depth,
+                                     TREE_DEFAULTS['min_samples_split'], TREE_DEFAULTS['min_samples_leaf'])
+        if 'Tenure' in rfm:
+            on_step('predict_clv')
+            stages.get_clv(segmentation_id, rfm, DEFAULT_HORIZON_MONTHS)
+        if basket_source is not None:
+            on_step('basket_rules')
+            stages.get_basket_rules(segmentation_id, basket_source, DEFAULT_MIN_SUPPORT,
+                                    DEFAULT_MIN_CONFIDENCE, rfm)
+        if activity_source is not None:
+            on_step('sales_cube')
+            stages.get_sales_cube(segmentation_id, activity_source, rfm)
+
+
+# ============================================================================
+# EJECUCIÓN
+# ============================================================================
+
+def run_warmup(config, status=None):
+    """Un recorrido completo por los datasets registrados; devuelve el estado final"""
+    status = status or {'runs': 0}
+    status.update(status='running', total=len(config['datasets']), datasets_done=0, current=None,
+                  step=None, results=[], started_at=time.time(), finished_at=None, next_run_at=None)
+    write_warmup_status(status)
+
+    for entry in config['datasets']:
+        label = dataset_label(entry)
+        status['current'] = label
+        start = time.perf_counter()
+        result = {'dataset': label, 'status': 'done', 'error': None, 'steps': []}
+
+        def on_step(step):
+            status['step'] = step
+            result['steps'].append(step)
+            write_warmup_status(status)
+
+        try:
+            warm_dataset(entry, config, on_step)
+        except Exception as e:
+            # Un dataset roto no impide calentar los demás
+            result['status'] = 'error'
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['seconds'] = time.perf_counter() - start
+        status['results'].append(result)
+        status['datasets_done'] += 1
+
+    status.update(status='done', current=None, step=None, finished_at=time.time(), runs=status['runs'] + 1)
+    write_warmup_status(status)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Llenar la caché en disco con los datasets registrados")
+    parser.add_argument('--config', help=f"Configuración JSON (por defecto ${WARMUP_CONFIG_ENV} o {DEFAULT_CONFIG_PATH})")
+    parser.add_argument('--repeat', action='store_true',
+                        help="Repetir el recorrido cada interval_minutes de la configuración")
+    args = parser.parse_args()
+
+    config = load_warmup_config(args.config)
+    if not config or not config['datasets']:
+        print("Sin datasets registrados: no hay nada que precalentar")
+        return
+    interval = config.get('interval_minutes')
+    if args.repeat and not interval:
+        parser.error("--repeat necesita 'interval_minutes' en la configuración")
+
+    status = None
+    while True:
+        status = run_warmup(config, status)
+        for result in status['results']:
+            mark = '✓' if result['status'] == 'done' else '❌'
+            detail = result['error'] or f"{len(result['steps'])} etapas"
+            print(f"{mark} {result['dataset']}: {detail} en {result['seconds']:.1f}s")
+        if not args.repeat:
+            break
+        status.update(status='waiting', next_run_at=status['finished_at'] + interval * 60)
+        write_warmup_status(status)
+        time.sleep(interval * 60)
+
+    if any(result['status'] == 'error' for result in status['results']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""Configuración común de las pruebas: los módulos del proyecto viven en src/
+y se importan entre sí por nombre, igual que al ejecutar el dashboard."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
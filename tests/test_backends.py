@@ -0,0 +1,73 @@
+"""Motores pandas y DuckDB: misma limpieza y misma tabla RFM"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backends import clean_transactions, aggregate_rfm, rfm_from_files, compare_rfm
+
+duckdb = pytest.importorskip('duckdb')
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    """Líneas como las lee pandas de Excel: InvoiceNo numérico salvo las cancelaciones 'C…'"""
+    rng = np.random.default_rng(0)
+    n_invoices = 800
+    numbers = 536000 + np.arange(n_invoices)
+    cancelled = rng.random(n_invoices) < 0.05
+    invoices = pd.DataFrame({
+        'InvoiceNo': [f'C{n}' if c else int(n) for n, c in zip(numbers, cancelled)],
+        'CustomerID': np.where(rng.random(n_invoices) < 0.1, np.nan, rng.integers(12000, 12150, n_invoices)),
+        'InvoiceDate': (pd.Timestamp('2010-12-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n_invoices),
+                                                                     'min')).astype(str),
+        'Country': rng.choice(['United Kingdom', 'France'], n_invoices)
+    })
+    # Algunas facturas llegan con el número como texto en unas líneas y como entero en otras
+    lines = invoices.loc[invoices.index.repeat(rng.integers(1, 5, size=n_invoices))].reset_index(drop=True)
+    as_text = rng.random(len(lines)) < 0.3
+    lines['InvoiceNo'] = [str(v) if t else v for v, t in zip(lines['InvoiceNo'], as_text)]
+    lines['StockCode'] = rng.choice(['85123A', '71053', '84406B', '22752'], len(lines))
+    lines['Quantity'] = np.where(rng.random(len(lines)) < 0.03, -1, rng.integers(1, 24, len(lines)))
+    lines['UnitPrice'] = np.where(rng.random(len(lines)) < 0.02, 0.0, rng.choice([0.85, 1.25, 2.95], len(lines)))
+    assert lines['InvoiceNo'].dtype == object
+    return lines
+
+
+def test_clean_transactions_agree(transactions):
+    pandas_clean = clean_transactions(transactions, backend='pandas')
+    duckdb_clean = clean_transactions(transactions, backend='duckdb')
+    assert len(pandas_clean) == len(duckdb_clean)
+    assert pandas_clean['TotalAmount'].sum() == pytest.approx(duckdb_clean['TotalAmount'].sum())
+    assert set(pandas_clean['InvoiceNo']) == set(duckdb_clean['InvoiceNo'])
+
+
+def test_rfm_agrees_on_mixed_invoice_numbers(transactions):
+    rfm_pandas = aggregate_rfm(clean_transactions(transactions, backend='pandas'), backend='pandas')
+    rfm_duckdb = aggregate_rfm(clean_transactions(transactions, backend='duckdb'), backend='duckdb')
+    assert compare_rfm(rfm_pandas, rfm_duckdb) == []
+
+    # El mismo número como entero y como texto es una sola factura
+    clean = clean_transactions(transactions, backend='pandas')
+    expected = clean['InvoiceNo'].astype(str).groupby(clean['CustomerID']).nunique()
+    assert rfm_pandas.set_index('CustomerID')['Frequency'].sort_index().tolist() == expected.sort_index().tolist()
+
+
+def test_rfm_from_files_agrees(transactions, tmp_path):
+    path = str(tmp_path / 'ventas.csv')
+    transactions.to_csv(path, index=False)
+    rfm_pandas, stats_pandas = rfm_from_files([path], backend='pandas')
+    rfm_duckdb, stats_duckdb = rfm_from_files([path], backend='duckdb')
+    assert compare_rfm(rfm_pandas, rfm_duckdb) == []
+    assert stats_pandas == stats_duckdb
+
+
+def test_compare_rfm_reports_differences(transactions):
+    rfm = aggregate_rfm(clean_transactions(transactions, backend='pandas'), backend='pandas')
+    assert compare_rfm(rfm, rfm.sample(frac=1, random_state=0)) == []
+
+    changed = rfm.copy()
+    changed.loc[changed.index[:3], 'Frequency'] += 1
+    changed.loc[changed.index[0], 'Monetary'] *= 1.01
+    assert compare_rfm(rfm, changed) == ["Frequency: 3 clientes distintos", "Monetary fuera de tolerancia"]
+    assert compare_rfm(rfm, rfm.iloc[1:]) == [f"Número de clientes distinto: {len(rfm):,} vs {len(rfm) - 1:,}"]
@@ -0,0 +1,116 @@
+"""BG/NBD y Gamma-Gamma frente a sus expresiones cerradas"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.special import hyp2f1
+
+from clv import (probability_alive, expected_purchases, fit_gamma_gamma, expected_spend,
+                 predict_clv, clv_by_segment, CLV_COLUMNS)
+
+# Parámetros publicados para CDNOW (Fader, Hardie y Lee, 2005)
+CDNOW = {'r': 0.243, 'alpha': 4.414, 'a': 0.793, 'b': 2.426}
+
+
+def closed_form_expected_purchases(params, t, x, t_x, T):
+    """Ecuación (10) del artículo, con la hipergeométrica 2F1"""
+    r, alpha, a, b = (params[name] for name in ('r', 'alpha', 'a', 'b'))
+    hyp = hyp2f1(r + x, b + x, a + b + x - 1, t / (alpha + T + t))
+    numerator = (a + b + x - 1) / (a - 1) * (1 - ((alpha + T) / (alpha + T + t)) ** (r + x) * hyp)
+    odds = np.where(x > 0, a / np.where(x > 0, b + x - 1, 1) * ((alpha + T) / (alpha + t_x)) ** (r + x), 0)
+    return numerator / (1 + odds)
+
+
+@pytest.mark.parametrize('params', [CDNOW, {'r': 1.5, 'alpha': 20.0, 'a': 2.5, 'b': 6.0},
+                                    {'r': 0.6, 'alpha': 8.0, 'a': 0.3, 'b': 12.0}])
+def test_expected_purchases_matches_hypergeometric(params):
+    rng = np.random.default_rng(0)
+    T = rng.uniform(5, 78, size=300)
+    t_x = T * rng.uniform(0, 1, size=300)
+    x = rng.integers(0, 15, size=300).astype(float)
+    t_x[x == 0] = 0
+    horizons = np.array([4.0, 26.0, 52.0])
+
+    quadrature = expected_purchases(params, horizons, x, t_x, T)
+    for i, t in enumerate(horizons):
+        np.testing.assert_allclose(quadrature[i], closed_form_expected_purchases(params, t, x, t_x, T),
+                                   rtol=1e-6)
+
+
+def test_expected_purchases_zero_horizon():
+    x, t_x, T = np.array([0.0, 3.0]), np.array([0.0, 20.0]), np.array([30.0, 40.0])
+    np.testing.assert_allclose(expected_purchases(CDNOW, [0.0], x, t_x, T), 0.0)
+
+
+def test_probability_alive_known_answer():
+    # Sin compras repetidas el cliente no ha tenido ocasión de abandonar
+    assert probability_alive(CDNOW, np.array([0.0]), np.array([0.0]), np.array([30.0]))[0] == 1.0
+
+    r, alpha, a, b = CDNOW.values()
+    x, t_x, T = 2.0, 30.43, 38.86
+    expected = 1 / (1 + a / (b + x - 1) * ((alpha + T) / (alpha + t_x)) ** (r + x))
+    assert probability_alive(CDNOW, np.array([x]), np.array([t_x]), np.array([T]))[0] == pytest.approx(expected)
+
+
+def _gamma_gamma_sample(n=3000, p=6.0, q=4.0, v=15.0, seed=0):
+    """Clientes simulados del modelo Gamma-Gamma: nu ~ Gamma(q, v), gasto ~ Gamma(p x, nu) / x"""
+    rng = np.random.default_rng(seed)
+    frequency = rng.integers(2, 12, size=n)
+    nu = rng.gamma(q, 1 / v, size=n)
+    spend = rng.gamma(p * frequency, 1 / nu) / frequency
+    return frequency, spend
+
+
+def test_gamma_gamma_recovers_population_mean():
+    frequency, spend = _gamma_gamma_sample()
+    params = fit_gamma_gamma(frequency, spend)
+    assert params['converged'] and not params['mean_fallback']
+    assert params['q'] > 1
+    # Media poblacional p v / (q - 1) = 6 * 15 / 3
+    assert params['mean_spend'] == pytest.approx(30.0, rel=0.1)
+
+
+def test_expected_spend_posterior_and_one_time_buyers():
+    params = {'p': 6.0, 'q': 4.0, 'v': 15.0, 'mean_spend': 30.0}
+    frequency, spend = np.array([1, 2, 10]), np.array([500.0, 20.0, 20.0])
+    result = expected_spend(params, frequency, spend)
+
+    # Una sola compra: la media poblacional, no su único ticket
+    assert result[0] == 30.0
+    # Posterior p (v + x m) / (p x + q - 1), más cerca del gasto observado con más compras
+    assert result[1] == pytest.approx(6 * (15 + 2 * 20) / (6 * 2 + 3))
+    assert result[2] == pytest.approx(6 * (15 + 10 * 20) / (6 * 10 + 3))
+    assert abs(result[2] - 20) < abs(result[1] - 20)
+
+
+def test_gamma_gamma_without_repeat_customers():
+    with pytest.raises(ValueError):
+        fit_gamma_gamma(np.array([1, 1]), np.array([10.0, 20.0]))
+
+
+def test_predict_clv_scores_every_customer():
+    rng = np.random.default_rng(1)
+    n = 500
+    tenure = rng.integers(30, 365, size=n)
+    frequency = rng.integers(1, 15, size=n)
+    rfm = pd.DataFrame({
+        'CustomerID': np.arange(n, dtype=float),
+        'Recency': (tenure * rng.uniform(0, 1, size=n)).astype(int),
+        'Frequency': frequency,
+        'Monetary': frequency * rng.gamma(5.0, 4.0, size=n),
+        'Tenure': tenure,
+        'Segment': rng.choice(['A', 'B'], size=n)
+    })
+    result = predict_clv(rfm, horizon_months=12)
+    clv = result['customers']
+
+    assert list(clv.columns) == CLV_COLUMNS and len(clv) == n
+    assert np.isfinite(clv[['P_Alive', 'Expected_Purchases', 'Expected_Spend', 'CLV']].to_numpy()).all()
+    assert (clv['CLV'] >= 0).all() and clv['P_Alive'].between(0, 1).all()
+    assert clv_by_segment(rfm, clv)['CLV_Share'].sum() == pytest.approx(1.0)
+
+
+def test_clv_requires_tenure():
+    rfm = pd.DataFrame({'CustomerID': [1.0], 'Recency': [1], 'Frequency': [2], 'Monetary': [10.0]})
+    with pytest.raises(ValueError):
+        predict_clv(rfm)
@@ -0,0 +1,73 @@
+"""Matriz factura × producto, FP-growth y reglas de asociación"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from market_basket import build_basket_matrix, fp_growth, association_rules
+
+
+def brute_force_itemsets(dense, min_count, max_len):
+    """Referencia: contar todas las combinaciones de productos hasta max_len"""
+    itemsets = {}
+    n_products = dense.shape[1]
+    for size in range(1, max_len + 1):
+        for items in combinations(range(n_products), size):
+            count = int(dense[:, items].all(axis=1).sum())
+            if count >= min_count:
+                itemsets[frozenset(items)] = count
+    return itemsets
+
+
+def random_baskets(seed, n_invoices=400, n_products=12):
+    """Facturas aleatorias con popularidad desigual y productos que se compran juntos"""
+    rng = np.random.default_rng(seed)
+    popularity = rng.uniform(0.02, 0.35, size=n_products)
+    dense = rng.random((n_invoices, n_products)) < popularity
+    dense[:, 1] |= dense[:, 0] & (rng.random(n_invoices) < 0.7)
+    dense[:, 2] |= dense[:, 1] & (rng.random(n_invoices) < 0.5)
+    return dense
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('min_support,max_len', [(0.02, 3), (0.05, 4), (0.1, 2)])
+def test_fp_growth_matches_brute_force(seed, min_support, max_len):
+    dense = random_baskets(seed)
+    min_count = max(5, int(np.ceil(min_support * len(dense))))
+    itemsets = fp_growth(sparse.csr_matrix(dense), min_support=min_support, max_len=max_len)
+    assert itemsets == brute_force_itemsets(dense, min_count, max_len)
+
+
+def test_fp_growth_empty_matrix():
+    assert fp_growth(sparse.csr_matrix((0, 5), dtype=bool)) == {}
+
+
+def test_association_rules_known_answer():
+    # 10 facturas: A en 6, B en 5, A y B juntas en 4
+    itemsets = {frozenset([0]): 6, frozenset([1]): 5, frozenset([0, 1]): 4}
+    rules = association_rules(itemsets, n_invoices=10, min_confidence=0.5).set_index('consequent')
+
+    assert rules.loc[1, 'antecedent'] == (0,)
+    assert rules.loc[1, 'confidence'] == pytest.approx(4 / 6)
+    assert rules.loc[1, 'lift'] == pytest.approx((4 / 6) / 0.5)
+    assert rules.loc[0, 'confidence'] == pytest.approx(4 / 5)
+    assert rules.loc[0, 'support'] == pytest.approx(0.4)
+    assert association_rules(itemsets, 10, min_confidence=0.7).shape[0] == 1
+
+
+def test_basket_matrix_collapses_repeated_lines():
+    lines = pd.DataFrame({
+        'CustomerID': [1.0, 1.0, 1.0, 2.0],
+        'InvoiceNo': ['536365', '536365', '536365', 536366],
+        'StockCode': ['85123A', '85123A', '71053', '71053'],
+        'Description': ['HEART', 'HEART', 'LANTERN', 'LANTERN']
+    })
+    basket = build_basket_matrix(lines)
+    assert basket['matrix'].shape == (2, 2)
+    assert basket['matrix'].nnz == 3
+    assert basket['matrix'].sum() == 3
+    assert list(basket['products']) == ['71053', '85123A']
+    assert list(basket['invoice_customer']) == [1.0, 2.0]
@@ -0,0 +1,164 @@
+"""Caché de resultados en disco: clave, caducidad, expulsión LRU e invalidación por código"""
+
+import importlib
+import sqlite3
+import sys
+import time
+
+import pytest
+
+import result_cache
+from result_cache import _MISS, cache_get, cache_put, cache_stats, code_digest, disk_cached
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(result_cache.CACHE_DIR_ENV, str(tmp_path / 'cache'))
+    monkeypatch.delenv(result_cache.CACHE_MAX_MB_ENV, raising=False)
+    monkeypatch.delenv(result_cache.CACHE_TTL_HOURS_ENV, raising=False)
+    return tmp_path / 'cache'
+
+
+def _entry_keys(root):
+    with sqlite3.connect(root / 'index.sqlite') as conn:
+        return {key for (key,) in conn.execute("SELECT key FROM entries")}
+
+
+# ============================================================================
+# CLAVE
+# ============================================================================
+
+calls = []
+
+
+@disk_cached('test_stage')
+def cached_sum(dataset_id, factor, _rows=None):
+    calls.append((dataset_id, factor))
+    return sum(_rows) * factor
+
+
+def test_key_uses_only_public_arguments():
+    calls.clear()
+    assert cached_sum('a', 2, _rows=[1, 2, 3]) == 12
+    # Los argumentos `_` no forman parte de la clave: se lee el resultado guardado
+    assert cached_sum('a', 2, _rows=[100]) == 12
+    assert calls == [('a', 2)]
+
+    assert cached_sum('a', 3, _rows=[1, 2, 3]) == 18
+    assert cached_sum('b', 2, _rows=[1]) == 2
+    assert calls == [('a', 2), ('a', 3), ('b', 2)]
+
+    stages = cache_stats()['stages'].set_index('Etapa')
+    assert stages.loc['test_stage', 'Aciertos'] == 1
+    assert stages.loc['test_stage', 'Fallos'] == 3
+
+
+def test_zero_budget_disables_cache(monkeypatch, cache_dir):
+    monkeypatch.setenv(result_cache.CACHE_MAX_MB_ENV, '0')
+    calls.clear()
+    cached_sum('a', 2, _rows=[1])
+    cached_sum('a', 2, _rows=[1])
+    assert len(calls) == 2
+    assert not cache_dir.exists()
+
+
+# ============================================================================
+# CADUCIDAD Y EXPULSIÓN
+# ============================================================================
+
+def test_expired_entry_is_a_miss_and_is_deleted(cache_dir):
+    assert cache_put('stage', 'k' * 64, {'value': 1})
+    assert cache_get('stage', 'k' * 64) == {'value': 1}
+
+    old = time.time() - result_cache.cache_ttl_seconds() - 60
+    with sqlite3.connect(cache_dir / 'index.sqlite') as conn:
+        conn.execute("UPDATE entries SET created_at = ?", (old,))
+
+    assert cache_get('stage', 'k' * 64) is _MISS
+    assert _entry_keys(cache_dir) == set()
+    assert not result_cache._object_path(cache_dir, 'k' * 64).exists()
+
+
+def test_put_evicts_least_recently_used_over_budget(monkeypatch, cache_dir):
+    payload = b'x' * 10_000
+    # Caben dos entradas de ~10 KB, no tres
+    monkeypatch.setenv(result_cache.CACHE_MAX_MB_ENV, str(25_000 / 1024 ** 2))
+    key_a, key_b, key_c = 'a' * 64, 'b' * 64, 'c' * 64
+
+    assert cache_put('stage', key_a, payload)
+    time.sleep(0.01)
+    assert cache_put('stage', key_b, payload)
+    time.sleep(0.01)
+    # Leer `a` la convierte en la más reciente: la expulsada es `b`
+    assert cache_get('stage', key_a) == payload
+    time.sleep(0.01)
+    assert cache_put('stage', key_c, payload)
+
+    assert _entry_keys(cache_dir) == {key_a, key_c}
+    assert cache_get('stage', key_b) is _MISS
+    assert not result_cache._object_path(cache_dir, key_b).exists()
+
+
+def test_value_larger_than_budget_is_not_stored(monkeypatch, cache_dir):
+    monkeypatch.setenv(result_cache.CACHE_MAX_MB_ENV, str(1_000 / 1024 ** 2))
+    assert not cache_put('stage', 'd' * 64, b'x' * 10_000)
+    assert cache_get('stage', 'd' * 64) is _MISS
+
+
+# ============================================================================
+# INVALIDACIÓN POR CÓDIGO
+# ============================================================================
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """Carpeta de módulos que code_digest trata como del proyecto"""
+    source_dir = tmp_path / 'project'
+    source_dir.mkdir()
+    monkeypatch.setattr(result_cache, '_SOURCE_DIR', source_dir)
+    monkeypatch.syspath_prepend(str(source_dir))
+    # Sin .pyc: dos versiones del mismo tamaño en el mismo segundo no se confunden
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+
+    def load(name, source):
+        (source_dir / f'{name}.py').write_text(source, encoding='utf-8')
+        sys.modules.pop(name, None)
+        importlib.invalidate_caches()
+        return importlib.import_module(name)
+
+    yield load
+    for path in source_dir.glob('*.py'):
+        sys.modules.pop(path.stem, None)
+
+
+def test_digest_changes_with_same_module_callee(project):
+    stage_v1 = project('stage_v1', "def helper():\n    return 1\n\n\ndef stage():\n    return helper()\n")
+    stage_v2 = project('stage_v2', "def helper():\n    return 2\n\n\ndef stage():\n    return helper()\n")
+    stage_v3 = project('stage_v3', "def helper():\n    return 1\n\n\ndef stage():\n    return helper()\n")
+
+    assert code_digest(stage_v1.stage) != code_digest(stage_v2.stage)
+    assert code_digest(stage_v1.stage) == code_digest(stage_v3.stage)
+
+
+def test_digest_changes_with_imported_project_modules(project):
+    project('deep', "VALUE = 1\n")
+    project('dep', "import deep\n\n\ndef compute():\n    return deep.VALUE\n")
+    stage = project('stage', "from dep import compute\n\n\ndef run():\n    return compute()\n").run
+    before = code_digest(stage)
+
+    # Un módulo importado de forma transitiva también forma parte de la huella
+    project('deep', "VALUE = 2\n")
+    assert code_digest(stage) != before
+
+
+def test_code_change_invalidates_cached_entries(project):
+    source = ("from result_cache import disk_cached\n\n\n"
+              "@disk_cached('versioned')\n"
+              "def stage(x):\n    return x * {factor}\n")
+    v1 = project('versioned', source.format(factor=2))
+    assert v1.stage(5) == 10
+    assert project('versioned', source.format(factor=2)).stage(5) == 10
+    # Misma etapa y argumentos con otra lógica: no se devuelve el resultado anterior
+    assert project('versioned', source.format(factor=3)).stage(5) == 15
+    stats = cache_stats()['stages'].set_index('Etapa')
+    assert stats.loc['versioned', 'Aciertos'] == 1
+    assert stats.loc['versioned', 'Fallos'] == 2
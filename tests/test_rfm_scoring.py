@@ -0,0 +1,80 @@
+"""Scores RFM por cuantiles y cubo de combinaciones"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rfm_scoring import (TIE_METHODS, rank_values, quantile_scores, score_rfm, build_score_cube,
+                         query_score_cube, score_mask)
+
+
+@pytest.mark.parametrize('ties', TIE_METHODS)
+def test_rank_values_matches_pandas(ties):
+    values = np.random.default_rng(0).integers(0, 20, size=500)
+    expected = pd.Series(values).rank(method=ties).to_numpy()
+    np.testing.assert_array_equal(rank_values(values, ties=ties), expected)
+
+
+def test_rank_values_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        rank_values([1, 2, 3], ties='dense')
+
+
+def test_quantile_scores_known_answer():
+    # 8 valores distintos en cuartiles: dos clientes por score
+    np.testing.assert_array_equal(quantile_scores([10, 20, 30, 40, 50, 60, 70, 80], 4),
+                                  [1, 1, 2, 2, 3, 3, 4, 4])
+    # Recency: los valores bajos reciben el score alto
+    np.testing.assert_array_equal(quantile_scores([10, 20, 30, 40], 4, higher_is_better=False),
+                                  [4, 3, 2, 1])
+
+
+def test_quantile_scores_ties_share_a_score():
+    scores = quantile_scores([5, 5, 5, 5, 9, 9, 1, 1], 4, ties='average')
+    assert len(set(scores[:4])) == 1
+    assert len(set(scores[4:6])) == 1 and len(set(scores[6:])) == 1
+
+
+def test_quantile_scores_empty():
+    assert quantile_scores([], 4).shape == (0,)
+
+
+def _random_rfm(n=1000, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'CustomerID': np.arange(n, dtype=float),
+        'Recency': rng.integers(0, 365, size=n),
+        'Frequency': rng.integers(1, 30, size=n),
+        'Monetary': rng.gamma(2.0, 300.0, size=n).round(2)
+    })
+
+
+@pytest.mark.parametrize('n_quantiles', [4, 5])
+def test_score_rfm_matches_pandas_qcut_ranks(n_quantiles):
+    rfm = score_rfm(_random_rfm(), n_quantiles=n_quantiles)
+    n = len(rfm)
+    for column, score, ascending in (('Recency', 'R_Score', False), ('Frequency', 'F_Score', True),
+                                     ('Monetary', 'M_Score', True)):
+        ranks = rfm[column].rank(method='average', ascending=ascending)
+        expected = np.clip(np.ceil(ranks * n_quantiles / n), 1, n_quantiles).astype(int)
+        np.testing.assert_array_equal(rfm[score].to_numpy(), expected.to_numpy())
+    codes = rfm['R_Score'].astype(str) + rfm['F_Score'].astype(str) + rfm['M_Score'].astype(str)
+    assert (rfm['RFM_Score'] == codes).all()
+
+
+def test_score_rfm_rejects_out_of_range_scale():
+    with pytest.raises(ValueError):
+        score_rfm(_random_rfm(10), n_quantiles=1)
+
+
+def test_score_cube_matches_table_filter():
+    rfm = score_rfm(_random_rfm(), n_quantiles=4)
+    cube = build_score_cube(rfm, n_quantiles=4)
+    assert cube['counts'].sum() == len(rfm)
+    assert cube['revenue'].sum() == pytest.approx(rfm['Monetary'].sum())
+
+    for ranges in [((4, 4), (4, 4), (4, 4)), ((1, 2), (3, 4), None), (None, None, (2, 3))]:
+        mask = score_mask(rfm, *ranges)
+        customers, revenue = query_score_cube(cube, *ranges)
+        assert customers == int(mask.sum())
+        assert revenue == pytest.approx(rfm.loc[mask, 'Monetary'].sum())
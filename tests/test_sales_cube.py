@@ -0,0 +1,100 @@
+"""Cubo país × mes × segmento frente a un groupby de pandas sobre las líneas"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_cube import customer_activity, build_sales_cube, query_sales_cube, ACTIVITY_COLUMNS
+
+
+@pytest.fixture(scope='module')
+def lines():
+    """Líneas limpias: cada factura con un cliente, un país y una fecha"""
+    rng = np.random.default_rng(0)
+    n_invoices = 600
+    invoices = pd.DataFrame({
+        'InvoiceNo': [str(536000 + i) for i in range(n_invoices)],
+        'CustomerID': rng.integers(12000, 12080, size=n_invoices).astype(float),
+        'InvoiceDate': pd.Timestamp('2011-01-01') + pd.to_timedelta(rng.integers(0, 200 * 24, size=n_invoices), 'h')
+    })
+    # La mayoría de los clientes compra siempre desde el mismo país
+    countries = np.array(['United Kingdom', 'France', 'Germany', 'EIRE'])
+    invoices['Country'] = countries[(invoices['CustomerID'].astype(int) + rng.integers(0, 10, size=n_invoices) // 9) % 4]
+
+    lines = invoices.loc[invoices.index.repeat(rng.integers(1, 6, size=n_invoices))].reset_index(drop=True)
+    lines['Quantity'] = rng.integers(1, 24, size=len(lines))
+    lines['UnitPrice'] = rng.choice([0.85, 1.25, 2.95, 4.95], size=len(lines))
+    lines['TotalAmount'] = lines['Quantity'] * lines['UnitPrice']
+    return lines
+
+
+@pytest.fixture(scope='module')
+def segments(lines):
+    customers = np.sort(lines['CustomerID'].unique())
+    # Un cliente sin segmento (fuera de la tabla RFM) no entra en el cubo
+    return pd.DataFrame({'CustomerID': customers[1:],
+                         'Segment': np.array(['Campeones', 'En Riesgo', 'Leales'])[np.arange(len(customers) - 1) % 3]})
+
+
+@pytest.fixture(scope='module')
+def cube(lines, segments):
+    return build_sales_cube(customer_activity(lines), segments)
+
+
+def reference(lines, segments, countries=None, month_range=None):
+    """Mismos filtros aplicados directamente a las líneas"""
+    table = lines.merge(segments, on='CustomerID')
+    table['Month'] = table['InvoiceDate'].dt.strftime('%Y-%m')
+    if countries:
+        table = table[table['Country'].isin(countries)]
+    if month_range is not None:
+        table = table[table['Month'].between(*month_range)]
+    return table
+
+
+AGGREGATIONS = {'Customers': ('CustomerID', 'nunique'), 'Invoices': ('InvoiceNo', 'nunique'),
+                'Revenue': ('TotalAmount', 'sum'), 'Quantity': ('Quantity', 'sum')}
+
+SELECTIONS = [(None, None), (['France'], None), (None, ('2011-03', '2011-05')),
+              (['United Kingdom', 'EIRE'], ('2011-02', '2011-02')), (['Narnia'], None)]
+
+
+def test_activity_has_one_row_per_customer_country_month(lines):
+    activity = customer_activity(lines)
+    assert list(activity.columns) == ACTIVITY_COLUMNS
+    assert not activity.duplicated(['CustomerID', 'Country', 'Month']).any()
+    assert activity['Revenue'].sum() == pytest.approx(lines['TotalAmount'].sum())
+    assert activity['Invoices'].sum() == lines['InvoiceNo'].nunique()
+
+
+@pytest.mark.parametrize('countries,month_range', SELECTIONS)
+def test_totals_and_distinct_counts_match_groupby(lines, segments, cube, countries, month_range):
+    result = query_sales_cube(cube, countries, month_range)
+    table = reference(lines, segments, countries, month_range)
+
+    expected_totals = {name: table[column].agg(how) for name, (column, how) in AGGREGATIONS.items()}
+    for name, value in expected_totals.items():
+        assert result['totals'][name] == pytest.approx(value), name
+
+    by_segment = table.groupby('Segment').agg(**AGGREGATIONS)
+    actual = result['segments'].loc[result['segments']['Customers'] > 0]
+    pd.testing.assert_frame_equal(actual[list(AGGREGATIONS)], by_segment, check_dtype=False, check_names=False,
+                                  check_index_type=False)
+
+    by_country = table.groupby('Country').agg(**AGGREGATIONS)
+    actual = result['countries'].loc[by_country.index] if len(by_country) else result['countries'].iloc[:0]
+    pd.testing.assert_frame_equal(actual[list(AGGREGATIONS)], by_country, check_dtype=False, check_names=False,
+                                  check_index_type=False)
+
+    by_month = table.groupby(['Month', 'Segment']).agg(**AGGREGATIONS)
+    actual = result['months'].set_index(['Month', 'Segment'])
+    actual = actual.loc[actual['Customers'] > 0]
+    pd.testing.assert_frame_equal(actual[list(AGGREGATIONS)], by_month, check_dtype=False, check_names=False,
+                                  check_index_type=False)
+
+
+def test_distinct_customers_are_not_summed_across_cells(lines, segments, cube):
+    result = query_sales_cube(cube)
+    # Los clientes compran en varios meses: la suma por mes supera a los clientes distintos
+    assert result['months']['Customers'].sum() > result['totals']['Customers']
+    assert result['totals']['Customers'] == len(segments)
@@ -0,0 +1,90 @@
+"""Esquema, muestra e informe de calidad de las transacciones"""
+
+import pandas as pd
+import pytest
+
+from validation import quality_report, check_quality, schema_problems, validate_sample
+
+
+def transactions():
+    """Diez líneas con un problema conocido de cada tipo"""
+    return pd.DataFrame({
+        'InvoiceNo': ['536365', '536365', 536366, 'C536367', 'C536367', '536368', '536369', '536370', '536370',
+                      '536371'],
+        'StockCode': ['85123A', '71053', '84406B', '84029G', '84029E', '22752', '21730', '22633', '22633',
+                      '84879'],
+        'Description': ['HEART', 'LANTERN', None, 'WARMER', 'WARMER', 'SET', 'HOLDER', 'HANDWARMER',
+                        'HANDWARMER', 'BIRD'],
+        'Quantity': [6, 6, 8, -6, -6, 2, 0, 6, 6, 32],
+        'InvoiceDate': ['2010-12-01 08:26', '2010-12-01 08:26', '2010-12-01 08:28', '2010-12-01 08:34',
+                        '2010-12-01 08:34', '2010-12-01 08:45', '2010-12-01 09:00', '2010-12-01 09:02',
+                        '2010-12-01 09:02', '2010-12-01 09:09'],
+        'UnitPrice': [2.55, 3.39, 2.75, 3.39, 3.39, 7.65, 4.25, 1.85, 1.85, 0.0],
+        'CustomerID': [17850.0, 17850.0, 13047.0, 17850.0, 17850.0, None, 13047.0, 12583.0, 12583.0, 12583.0],
+        'Country': ['United Kingdom'] * 9 + ['France']
+    })
+
+
+def test_quality_report_known_answer():
+    report = quality_report(transactions())
+    checks = report['checks']
+
+    assert report['rows'] == 10 and report['errors'] == []
+    assert checks['Sin CustomerID'] == pytest.approx(0.1)
+    # Cancelaciones por factura: las dos líneas de C536367 (mezcla de InvoiceNo int y str)
+    assert checks['Cancelaciones'] == pytest.approx(0.2)
+    assert checks['Cantidad ≤ 0'] == pytest.approx(0.3)
+    assert checks['Precio ≤ 0'] == pytest.approx(0.1)
+    assert checks['Filas duplicadas'] == pytest.approx(0.1)
+    # Sobreviven 536365 (2 líneas), 536366 y 536370 (2 líneas)
+    assert checks['Filas válidas'] == pytest.approx(0.5)
+    assert report['customers'] == 3
+    assert report['invoices'] == 3
+    assert report['date_range'] == (pd.Timestamp('2010-12-01 08:26'), pd.Timestamp('2010-12-01 09:09'))
+    assert report['nulls']['Description'] == pytest.approx(0.1)
+    # 10% de duplicados supera el umbral de aviso
+    assert any('duplicadas' in warning for warning in report['warnings'])
+
+
+def test_quality_report_without_valid_rows_is_an_error():
+    df = transactions()
+    df['Quantity'] = -1
+    report = quality_report(df)
+    assert report['checks']['Filas válidas'] == 0
+    with pytest.raises(ValueError, match='Ninguna fila'):
+        check_quality(report, source='ventas.csv')
+
+
+def test_quality_report_stops_at_schema_errors():
+    report = quality_report(transactions().drop(columns=['Country', 'UnitPrice']))
+    assert report['errors'] == ["Faltan columnas obligatorias: UnitPrice, Country"]
+    assert report['checks'] == {}
+
+
+@pytest.mark.parametrize('column,value,message', [
+    ('Quantity', 'seis', 'Quantity debería ser número'),
+    ('InvoiceDate', 'ayer', 'InvoiceDate debería ser fecha'),
+    ('InvoiceDate', '1899-12-31', 'InvoiceDate fuera de rango'),
+])
+def test_schema_rejects_uninterpretable_columns(column, value, message):
+    df = transactions()
+    df[column] = df[column].astype(object)
+    df.loc[:, column] = value
+    assert any(problem.startswith(message) for problem in schema_problems(df))
+
+
+def test_schema_rejects_excel_serial_dates():
+    df = transactions()
+    df['InvoiceDate'] = 40513.35
+    assert any(problem.startswith('InvoiceDate debería ser fecha') for problem in schema_problems(df))
+
+
+def test_validate_sample_reads_only_the_header_rows(tmp_path):
+    path = tmp_path / 'ventas.csv'
+    df = pd.concat([transactions()] * 50, ignore_index=True)
+    df.to_csv(path, index=False)
+    assert len(validate_sample(str(path), n_rows=20)) == 20
+
+    df.drop(columns=['CustomerID']).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='Faltan columnas obligatorias: CustomerID'):
+        validate_sample(str(path))